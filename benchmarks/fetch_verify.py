@@ -0,0 +1,55 @@
+"""
+Time fetching a file that's already in the local storage with each of the
+verification policies.
+
+Creates a Pooch with a single 1 MiB file in a temporary folder and times
+many calls to :meth:`pooch.Pooch.fetch` after the first one (which verifies
+the file). Nothing is downloaded.
+
+Usage::
+
+    python benchmarks/fetch_verify.py [policy ...]
+
+"""
+import os
+import sys
+import time
+import tempfile
+
+from pooch import Pooch
+from pooch.core import VERIFY_POLICIES
+from pooch.utils import file_hash
+
+
+def best_time(function, number, repeat=3):
+    "The shortest time of a few runs of a function (in seconds per call)"
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return min(times)
+
+
+def main():
+    "Time all policies (or the ones given as arguments)"
+    policies = sys.argv[1:] or VERIFY_POLICIES
+    with tempfile.TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.bin")
+        with open(fname, "wb") as fout:
+            fout.write(os.urandom(2**20))
+        pup = Pooch(
+            path=path,
+            base_url="http://some.link.com/",
+            registry={"data.bin": file_hash(fname)},
+        )
+        for verify in policies:
+            pup.fetch("data.bin", verify=verify)
+            number = 200 if verify == "always" else 20000
+            seconds = best_time(lambda: pup.fetch("data.bin", verify=verify), number)
+            print("{:>18}{:>12.2f} us".format(verify, seconds * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare the memory used by a dictionary and a CompactRegistry.
+
+Builds a registry with 1 million SHA256 entries (or the number given as the
+first argument) as a plain dictionary (like Pooch.load_registry does) and as
+a pooch.CompactRegistry and prints the memory used per entry and the time
+taken by lookups.
+
+Usage::
+
+    python benchmarks/registry_memory.py [number_of_entries]
+
+"""
+import sys
+import time
+import hashlib
+import tracemalloc
+
+from pooch import CompactRegistry
+
+
+def entries(size):
+    "Generate file names and hashes that look like a real registry"
+    for i in range(size):
+        name = "data/station-{:07d}/measurements.csv".format(i)
+        digest = hashlib.sha256(name.encode()).hexdigest()
+        yield name, "sha256:" + digest
+
+
+def measure(build, size):
+    "Memory used by the object returned by build (in bytes)"
+    tracemalloc.start()
+    registry = build(entries(size))
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return registry, used
+
+
+def lookup_time(registry, names):
+    "Average time to look up and parse the hash of a file (in seconds)"
+    start = time.perf_counter()
+    for name in names:
+        known_hash = registry[name]
+        getattr(known_hash, "digest", None) or known_hash.split(":")[-1]
+    return (time.perf_counter() - start) / len(names)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    names = [name for name, _ in entries(size)][:: max(1, size // 10000)]
+    print("Registry with {} entries".format(size))
+    for label, build in [("dict", dict), ("CompactRegistry", CompactRegistry)]:
+        registry, used = measure(build, size)
+        print(
+            "{:>16}: {:7.1f} MB ({:5.1f} bytes per entry), "
+            "lookup {:.2f} us".format(
+                label,
+                used / 1024**2,
+                used / size,
+                lookup_time(registry, names) * 1e6,
+            )
+        )
+        del registry
+
+
+if __name__ == "__main__":
+    main()
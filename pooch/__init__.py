@@ -3,8 +3,10 @@
 from . import version
 from .core import Pooch, create
 from .utils import os_cache, file_hash, make_registry, check_version, get_logger
-from .downloaders import HTTPDownloader, FTPDownloader
+from .downloaders import HTTPDownloader, FTPDownloader, FileDownloader
 from .processors import Unzip, Untar, Decompress
+from .registry import SQLiteRegistry, CompactRegistry
+from .snapshot import warm_start, save_snapshot, load_snapshot
 
 
 def test(doctest=True, verbose=True, coverage=False):
@@ -0,0 +1,156 @@
+"""
+Command-line interface of Pooch.
+
+Run ``pooch --help`` (or ``python -m pooch --help``) for the commands.
+"""
+import sys
+import socket
+import logging
+import argparse
+
+from .core import create, VERIFY_POLICIES
+from .utils import get_logger
+
+
+def main(args=None):
+    """
+    Run the command-line interface.
+
+    Parameters
+    ----------
+    args : list of str or None
+        The command-line arguments. If None, will use :data:`sys.argv`.
+
+    """
+    parser = _parser()
+    args = parser.parse_args(args)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    get_logger().setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    return args.run(args)
+
+
+def _parser():
+    "Build the parser for the command-line arguments"
+    parser = argparse.ArgumentParser(
+        prog="pooch", description="Manage data files fetched with Pooch."
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Log every request."
+    )
+    commands = parser.add_subparsers(dest="command")
+    serve = commands.add_parser(
+        "serve",
+        help="Serve a local storage folder over HTTP as a mirror of the origin.",
+        description=(
+            "Serve the files in the registry over HTTP. Files that aren't in the "
+            "local storage are downloaded from BASE_URL the first time they're "
+            "requested. Point the base_url of other Pooches to this server to "
+            "download each file only once from the origin."
+        ),
+    )
+    serve.add_argument("path", help="The local storage folder.")
+    serve.add_argument(
+        "--base-url", required=True, help="Base URL of the origin of the data."
+    )
+    serve.add_argument(
+        "--registry",
+        action="append",
+        required=True,
+        help="Registry file with the files to serve (can be given more than once).",
+    )
+    serve.add_argument(
+        "--host", default="", help="Address to listen on (default: all interfaces)."
+    )
+    serve.add_argument(
+        "--port", type=int, default=8000, help="Port to listen on (default: 8000)."
+    )
+    serve.add_argument(
+        "--verify",
+        choices=VERIFY_POLICIES,
+        default="stat",
+        help="How files in the local storage are checked (default: stat).",
+    )
+    serve.add_argument(
+        "--cache-size",
+        type=int,
+        default=None,
+        help="Maximum size (in bytes) of the local storage.",
+    )
+    serve.set_defaults(run=_serve)
+    broker = commands.add_parser(
+        "broker",
+        help="Download files for all processes on this machine.",
+        description=(
+            "Listen on a Unix domain socket for fetch requests from Pooches that "
+            "use the broker. Each file is downloaded once, with a limit of "
+            "concurrent downloads and shared connections."
+        ),
+    )
+    broker.add_argument("socket", help="The Unix domain socket to listen on.")
+    broker.add_argument(
+        "--root",
+        action="append",
+        required=True,
+        help="Local storage folder that the broker can write to (can be given "
+        "more than once).",
+    )
+    broker.add_argument(
+        "--max-downloads",
+        type=int,
+        default=4,
+        help="Maximum number of files downloaded at the same time (default: 4).",
+    )
+    broker.set_defaults(run=_broker)
+    return parser
+
+
+def _serve(args):
+    "Run the mirror server until interrupted"
+    from .server import make_server  # pylint: disable=import-outside-toplevel
+
+    pup = create(path=args.path, base_url=args.base_url)
+    for registry in args.registry:
+        pup.load_registry(registry)
+    pup.verify = args.verify
+    pup.cache_size = args.cache_size
+    server = make_server(pup, host=args.host, port=args.port)
+    get_logger().warning(
+        "Serving %d files from '%s' at http://%s:%d/ (origin: %s).",
+        len(pup.registry),
+        str(pup.abspath),
+        args.host or socket.gethostname(),
+        server.server_address[1],
+        pup.base_url,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def _broker(args):
+    "Run the fetch broker until interrupted"
+    from .broker import FetchBroker  # pylint: disable=import-outside-toplevel
+
+    broker = FetchBroker(args.socket, args.root, max_downloads=args.max_downloads)
+    get_logger().warning(
+        "Fetching files into %s for requests on '%s'.",
+        ", ".join("'{}'".format(root) for root in broker.roots),
+        args.socket,
+    )
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+Content-addressed storage of files shared between local storage folders.
+"""
+import os
+import shutil
+
+from .utils import (
+    get_logger,
+    hash_algorithm,
+    hash_digest,
+    hash_matches,
+    temporary_file,
+    reflink,
+)
+from .index import HashIndex
+
+
+class BlobStore:
+    """
+    Shared storage of downloaded files indexed by their hashes.
+
+    Each file is stored once as a "blob" named after its hash. The files in
+    the local storage folders of any number of :class:`~pooch.Pooch` instances
+    (for example, different versions of the same project or different projects
+    using the same data) are hard links to the blobs. If hard links aren't
+    possible (for example, if the blob store is on a different file system), a
+    copy-on-write clone of the blob is made if the file system supports it and
+    a regular copy otherwise.
+
+    Blobs are checked against their hash before they're linked (using a
+    :class:`~pooch.index.HashIndex` to avoid hashing files that haven't
+    changed). Blobs that don't match are discarded.
+
+    Parameters
+    ----------
+    path : str or PathLike
+        The folder where the blobs are stored. Will be created if it doesn't
+        exist.
+
+    Examples
+    --------
+
+    >>> import tempfile
+    >>> from pooch.utils import file_hash
+    >>> with tempfile.TemporaryDirectory() as path:
+    ...     store = BlobStore(os.path.join(path, "blobs"))
+    ...     fname = os.path.join(path, "data.txt")
+    ...     with open(fname, "w") as fout:
+    ...         __ = fout.write("some data")
+    ...     known_hash = file_hash(fname)
+    ...     print(known_hash in store)
+    ...     __ = store.add(fname, known_hash)
+    ...     print(known_hash in store)
+    ...     # Place a link to the blob somewhere else
+    ...     copy = os.path.join(path, "copy.txt")
+    ...     print(store.link(known_hash, copy))
+    ...     print(os.path.samefile(copy, store.blob_path(known_hash)))
+    False
+    True
+    True
+    True
+
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(str(path)))
+        self._index = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_index"] = None
+        return state
+
+    def __contains__(self, known_hash):
+        return os.path.exists(self.blob_path(known_hash))
+
+    @property
+    def index(self):
+        "Index of the blobs that have been verified"
+        if self._index is None:
+            self._index = HashIndex(self.path)
+        return self._index
+
+    def blob_path(self, known_hash):
+        """
+        The path to the blob for a given hash.
+
+        Parameters
+        ----------
+        known_hash : str
+            The hash of the file. Optionally, prepend ``alg:`` to the hash to
+            specify the hashing algorithm. Default is SHA256.
+
+        Returns
+        -------
+        path : str
+            The path of the blob (which might not exist).
+
+        """
+        digest = hash_digest(known_hash).lower()
+        return os.path.join(self.path, hash_algorithm(known_hash), digest[:2], digest)
+
+    def _verify(self, blob, known_hash):
+        "Check the blob against its hash and discard it if it doesn't match"
+        matches = self.index.lookup(blob, known_hash)
+        if matches is None:
+            matches = hash_matches(blob, known_hash)
+            if matches:
+                self.index.record(blob, known_hash)
+        if not matches:
+            get_logger().warning("Discarding corrupted blob '%s'.", blob)
+            self.index.forget(blob)
+            try:
+                os.remove(blob)
+            except OSError:
+                pass
+        return matches
+
+    def link(self, known_hash, fname):
+        """
+        Place the blob for a given hash at a file name (if it exists).
+
+        Any existing file at *fname* is replaced atomically.
+
+        Parameters
+        ----------
+        known_hash : str
+            The hash of the file. Optionally, prepend ``alg:`` to the hash to
+            specify the hashing algorithm. Default is SHA256.
+        fname : str or PathLike
+            The path where the file should be placed.
+
+        Returns
+        -------
+        linked : bool
+            False if there is no valid blob for the hash.
+
+        """
+        blob = self.blob_path(known_hash)
+        if not os.path.exists(blob) or not self._verify(blob, known_hash):
+            return False
+        _place(blob, str(fname))
+        return True
+
+    def add(self, fname, known_hash):
+        """
+        Add a verified file to the store and replace it with a link to it.
+
+        If there already is a valid blob for the hash, only the file is
+        replaced.
+
+        Parameters
+        ----------
+        fname : str or PathLike
+            The path to the file. Its hash must have already been checked.
+        known_hash : str
+            The hash of the file. Optionally, prepend ``alg:`` to the hash to
+            specify the hashing algorithm. Default is SHA256.
+
+        Returns
+        -------
+        blob : str
+            The path of the blob.
+
+        """
+        fname = str(fname)
+        blob = self.blob_path(known_hash)
+        if not os.path.exists(blob) or not self._verify(blob, known_hash):
+            _place(fname, blob)
+            self.index.record(blob, known_hash)
+        elif not os.path.samefile(fname, blob):
+            _place(blob, fname)
+        return blob
+
+    def release(self, known_hash):
+        """
+        Remove the blob for a given hash if no file links to it anymore.
+
+        Used to free the disk space of files removed from a local storage
+        (see *cache_size* in :class:`~pooch.Pooch`). Blobs that are still
+        hard linked from other files are kept.
+
+        Parameters
+        ----------
+        known_hash : str
+            The hash of the file. Optionally, prepend ``alg:`` to the hash to
+            specify the hashing algorithm. Default is SHA256.
+
+        Returns
+        -------
+        removed : bool
+            True if the blob was removed.
+
+        """
+        blob = self.blob_path(known_hash)
+        try:
+            if os.stat(blob).st_nlink > 1:
+                return False
+            os.remove(blob)
+        except OSError:
+            return False
+        self.index.forget(blob)
+        return True
+
+
+def _place(source, destination):
+    """
+    Atomically replace *destination* with a link or copy of *source*.
+    """
+    directory = os.path.dirname(destination)
+    os.makedirs(directory, exist_ok=True)
+    with temporary_file(path=directory) as tmp:
+        os.remove(tmp)
+        clone_file(source, tmp)
+        os.replace(tmp, destination)
+
+
+def clone_file(source, destination):
+    """
+    Make *destination* share the content of *source* as cheaply as possible.
+
+    Tries a hard link first, then a copy-on-write clone (on Linux file systems
+    that support it, like Btrfs and XFS), and finally a regular copy.
+
+    Parameters
+    ----------
+    source : str
+        The existing file.
+    destination : str
+        The new file. Must not exist.
+
+    Returns
+    -------
+    method : str
+        How the file was placed: ``"link"``, ``"reflink"``, or ``"copy"``.
+
+    """
+    try:
+        os.link(source, destination)
+        return "link"
+    except OSError:
+        pass
+    if _reflink(source, destination):
+        return "reflink"
+    shutil.copyfile(source, destination)
+    return "copy"
+
+
+def _reflink(source, destination):
+    """
+    Try to make a copy-on-write clone of a file. Returns True on success.
+    """
+    with open(source, "rb") as fin:
+        with open(destination, "wb") as fout:
+            if reflink(fin.fileno(), fout.fileno()):
+                return True
+    os.remove(destination)
+    return False
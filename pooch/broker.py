@@ -0,0 +1,221 @@
+"""
+Daemon that downloads files for all processes using the same local storage.
+
+Only available on systems with Unix domain sockets. Not imported with pooch
+since it's only needed to run a broker (see ``pooch broker``) or when a
+:class:`~pooch.Pooch` is configured to use one.
+"""
+import os
+import json
+import socket
+import builtins
+import threading
+from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+
+from .utils import get_logger, parse_url
+from .downloaders import choose_downloader
+from .locking import SingleFlight
+
+
+class FetchBroker(ThreadingMixIn, UnixStreamServer):
+    """
+    Server that fetches files for other processes over a Unix domain socket.
+
+    Processes on the same machine (possibly in different environments and
+    with different :class:`~pooch.Pooch` instances) that use the same local
+    storage folder can send their downloads to a single broker by passing
+    the socket to the *broker* argument of :class:`~pooch.Pooch`. The broker
+    then:
+
+    * downloads each file only once, even if several processes ask for it at
+      the same time (requests for the same file and hash share the download);
+    * limits the number of downloads running at the same time on the machine
+      (*max_downloads*);
+    * keeps one downloader (and its pool of connections) per protocol for all
+      downloads.
+
+    Files are downloaded with :meth:`pooch.Pooch.fetch`, so they're verified
+    and recorded in the hash index of the local storage like any other fetch
+    and processes that don't use the broker still coordinate through the
+    download locks. Only files inside the *roots* folders (or their
+    subfolders, like the versioned folders made by :func:`pooch.create`) are
+    downloaded.
+
+    Each request is a line with a JSON object with the local storage folder
+    (``path``), the file name (``fname``), its hash (``known_hash``), and the
+    URL (``url``). The reply is a line with a JSON object with the absolute
+    path of the file (``path``) or the error that was raised (``error`` and
+    ``type``).
+
+    Parameters
+    ----------
+    socket_path : str or PathLike
+        The Unix domain socket to listen on. Removed if it already exists.
+    roots : list of str or PathLike
+        The local storage folders that the broker is allowed to write to
+        (including all folders inside of them).
+    max_downloads : int
+        Maximum number of files downloaded at the same time.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, roots, max_downloads=4):
+        self.roots = [os.path.realpath(os.path.expanduser(str(r))) for r in roots]
+        self.max_downloads = max_downloads
+        self._slots = threading.BoundedSemaphore(max_downloads)
+        self._flights = SingleFlight()
+        self._downloaders = dict()
+        socket_path = str(socket_path)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _BrokerRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+    def fetch(self, path, fname, known_hash, url):
+        """
+        Download a file to a local storage folder (if it's not there already).
+
+        Parameters
+        ----------
+        path : str
+            The local storage folder. Must be one of the *roots* or a folder
+            inside of them.
+        fname : str
+            The name of the file in the local storage (Unix separators).
+        known_hash : str or None
+            The hash of the file.
+        url : str
+            The URL of the file.
+
+        Returns
+        -------
+        full_path : str
+            The absolute path to the file.
+
+        """
+        root = os.path.realpath(path)
+        full_path = os.path.realpath(os.path.join(root, *fname.split("/")))
+        allowed = any(
+            os.path.join(root, "").startswith(os.path.join(allowed_root, ""))
+            for allowed_root in self.roots
+        )
+        if not allowed or not full_path.startswith(os.path.join(root, "")):
+            raise PermissionError(
+                "The broker can't write '{}' to '{}'.".format(fname, path)
+            )
+        return self._flights.run(
+            (root, fname, known_hash), self._fetch, root, fname, known_hash, url
+        )
+
+    def _fetch(self, root, fname, known_hash, url):
+        "Fetch the file with a Pooch for this request (see fetch)"
+        from .core import Pooch  # pylint: disable=import-outside-toplevel
+
+        pup = Pooch(
+            path=root,
+            base_url="",
+            registry={fname: known_hash},
+            urls={fname: url},
+        )
+        with self._slots:
+            return pup.fetch(fname, downloader=self._downloader(url))
+
+    def _downloader(self, url):
+        "The downloader shared by all requests for the protocol of the URL"
+        protocol = parse_url(url)["protocol"]
+        if protocol not in self._downloaders:
+            self._downloaders.setdefault(protocol, choose_downloader(url))
+        return self._downloaders[protocol]
+
+
+class _BrokerRequestHandler(StreamRequestHandler):
+    """
+    Answer the fetch requests sent through a connection (see FetchBroker).
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode("utf-8"))
+                reply = {
+                    "path": self.server.fetch(
+                        request["path"],
+                        request["fname"],
+                        request["known_hash"],
+                        request["url"],
+                    )
+                }
+            except Exception as error:  # pylint: disable=broad-except
+                get_logger().info("Broker request failed: %s", str(error))
+                reply = {"error": str(error), "type": _builtin_type(error)}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+def _builtin_type(error):
+    "Name of the first built-in exception class of an error"
+    for cls in type(error).__mro__:
+        if getattr(builtins, cls.__name__, None) is cls:
+            return cls.__name__
+    return "RuntimeError"
+
+
+def request_fetch(socket_path, path, fname, known_hash, url):
+    """
+    Ask a broker to fetch a file and wait for it.
+
+    Parameters
+    ----------
+    socket_path : str or PathLike
+        The Unix domain socket of the broker.
+    path : str or PathLike
+        The local storage folder.
+    fname : str
+        The name of the file in the local storage (Unix separators).
+    known_hash : str or None
+        The hash of the file.
+    url : str
+        The URL of the file.
+
+    Returns
+    -------
+    full_path : str
+        The absolute path to the file.
+
+    Raises
+    ------
+    ConnectionError
+        If the broker couldn't be reached or closed the connection without
+        replying.
+
+    """
+    request = {
+        "path": str(path),
+        "fname": fname,
+        "known_hash": known_hash,
+        "url": url,
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as fin:
+                line = fin.readline()
+        except OSError as error:
+            raise ConnectionError(
+                "Could not reach the broker at '{}': {}".format(socket_path, error)
+            )
+    if not line:
+        raise ConnectionError(
+            "The broker at '{}' closed the connection.".format(socket_path)
+        )
+    reply = json.loads(line.decode("utf-8"))
+    if "error" in reply:
+        exception = getattr(builtins, reply["type"], RuntimeError)
+        raise exception(reply["error"])
+    return reply["path"]
@@ -0,0 +1,410 @@
+"""
+Limit the size of the local storage by removing files that aren't needed.
+"""
+import os
+import json
+import time
+import socket
+from contextlib import contextmanager
+
+from .utils import get_logger, temporary_file, METADATA_DIR
+from .locking import FileLock, _read_owner, _pid_exists
+
+
+class CacheEntry:  # pylint: disable=too-few-public-methods
+    """
+    A file tracked by a :class:`CacheManager`.
+
+    Eviction policies receive entries and return a key used to sort them.
+    Entries with the lowest keys are removed first.
+
+    Attributes
+    ----------
+    name : str
+        The file name relative to the storage folder (Unix separators).
+    size : int
+        The size of the file in bytes.
+    last_access : float
+        Time of the last access to the file (seconds since the epoch).
+    count : int
+        Number of times the file was accessed.
+    age : float
+        Time (in seconds) since the last access.
+
+    """
+
+    def __init__(self, name, size, last_access, count, now=None):
+        self.name = name
+        self.size = size
+        self.last_access = last_access
+        self.count = count
+        if now is None:
+            now = time.time()
+        self.age = now - last_access
+
+    def __repr__(self):
+        return "CacheEntry(name={!r}, size={}, last_access={}, count={})".format(
+            self.name, self.size, self.last_access, self.count
+        )
+
+
+def lru(entry):
+    "Least recently used files are removed first"
+    return entry.last_access
+
+
+def lfu(entry):
+    "Least frequently used files are removed first (oldest first for ties)"
+    return (entry.count, entry.last_access)
+
+
+def size_weighted(entry):
+    "Large files that haven't been used in a while are removed first"
+    return -entry.size * entry.age
+
+
+POLICIES = {"lru": lru, "lfu": lfu, "size": size_weighted}
+
+
+class CacheManager:
+    """
+    Keep the files in a local storage folder below a maximum total size.
+
+    Accesses to files are recorded by appending a line to a log file in the
+    ``.pooch`` folder, which is cheap enough to do on every fetch. The log is
+    merged into the access statistics when it grows larger than
+    :attr:`max_log_size` bytes. When the files take more space than allowed,
+    the log is merged and files are removed in the order given by the
+    eviction policy until the total size is below the limit.
+
+    A file is never removed while it's pinned (see :meth:`pin`) by any process
+    (for example, while a processor runs on it during a fetch) or if it was
+    accessed less than *min_age* seconds ago. Only files whose access has been
+    recorded are considered. Files created by processors (like unpacked
+    archives) aren't counted.
+
+    Parameters
+    ----------
+    path : str or PathLike
+        The local storage folder.
+    max_size : int or None
+        Maximum total size (in bytes) of the files. If None, no files are ever
+        removed.
+    policy : str or callable
+        The eviction policy. One of ``"lru"`` (least recently used),
+        ``"lfu"`` (least frequently used), or ``"size"`` (large files not
+        used for a long time first). Can also be a function that takes a
+        :class:`CacheEntry` and returns a sort key. Files with the lowest keys
+        are removed first.
+    min_age : float
+        Files accessed less than this many seconds ago are never removed.
+    pin_timeout : float
+        Pins older than this many seconds that were made by processes on other
+        machines are ignored (pins from processes that died on this machine
+        are always ignored).
+
+    Examples
+    --------
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as path:
+    ...     cache = CacheManager(path, max_size=15, min_age=0)
+    ...     for name in ["first.txt", "second.txt"]:
+    ...         with open(os.path.join(path, name), "w") as fout:
+    ...             __ = fout.write("ten bytes!")
+    ...         cache.record_access(name)
+    ...     print(cache.usage())
+    ...     print(cache.evict())
+    ...     print(sorted(os.listdir(path)))
+    20
+    ['first.txt']
+    ['.pooch', 'second.txt']
+
+    """
+
+    # Size (in bytes) of the access log above which it's merged
+    max_log_size = 2**20
+
+    def __init__(
+        self, path, max_size=None, policy="lru", min_age=60, pin_timeout=24 * 3600
+    ):
+        if not callable(policy) and policy not in POLICIES:
+            raise ValueError(
+                "Invalid eviction policy '{}'. Must be one of {} or a function.".format(
+                    policy, list(POLICIES)
+                )
+            )
+        self.root = os.path.abspath(str(path))
+        self.max_size = max_size
+        self.policy = policy
+        self.min_age = min_age
+        self.pin_timeout = pin_timeout
+        self._metadata = os.path.join(self.root, METADATA_DIR)
+        self._log = os.path.join(self._metadata, "access.log")
+        self._state = os.path.join(self._metadata, "access.json")
+        self._pins = os.path.join(self._metadata, "pins")
+
+    def record_access(self, fname):
+        """
+        Record that a file was accessed.
+
+        Parameters
+        ----------
+        fname : str
+            The file name relative to the storage folder (Unix separators).
+
+        """
+        line = json.dumps([time.time(), fname]) + "\n"
+        try:
+            # Appending a single line is atomic for all practical purposes so
+            # processes don't need to coordinate.
+            with open(self._log, "a") as fout:
+                fout.write(line)
+                size = fout.tell()
+        except FileNotFoundError:
+            os.makedirs(self._metadata, exist_ok=True)
+            with open(self._log, "a") as fout:
+                fout.write(line)
+                size = fout.tell()
+        if size > self.max_log_size:
+            self.merge_log()
+
+    def merge_log(self):
+        """
+        Merge the access log into the access statistics.
+
+        Keeps the log from growing without bound when files are fetched many
+        times without downloads (which trigger :meth:`evict`). Does nothing if
+        another process is already merging the log or removing files.
+
+        """
+        lock = FileLock(os.path.join(self._metadata, "locks", "cache.lock"), timeout=0)
+        try:
+            lock.acquire()
+        except TimeoutError:
+            return
+        try:
+            state, merging = self._load()
+            self._save(state, merging)
+        finally:
+            lock.release()
+
+    @contextmanager
+    def pin(self, fname):
+        """
+        Context manager that stops a file from being removed while it's used.
+
+        Pins are seen by all processes using the same storage folder.
+
+        Parameters
+        ----------
+        fname : str
+            The file name relative to the storage folder (Unix separators).
+
+        """
+        os.makedirs(self._pins, exist_ok=True)
+        pin = os.path.join(self._pins, os.urandom(16).hex())
+        with open(pin, "w") as fout:
+            json.dump(
+                {"file": fname, "pid": os.getpid(), "host": socket.gethostname()},
+                fout,
+            )
+        try:
+            yield
+        finally:
+            os.remove(pin)
+
+    def pinned(self):
+        """
+        The names of the files that are currently pinned.
+
+        Returns
+        -------
+        names : set
+            The pinned file names.
+
+        """
+        try:
+            pins = os.listdir(self._pins)
+        except OSError:
+            return set()
+        names = set()
+        now = time.time()
+        for pin in pins:
+            pin = os.path.join(self._pins, pin)
+            owner = _read_owner(pin)
+            try:
+                age = now - os.stat(pin).st_mtime
+            except OSError:
+                continue
+            if owner.get("host") == socket.gethostname():
+                alive = _pid_exists(owner.get("pid"))
+            else:
+                alive = age < self.pin_timeout
+            if alive and "file" in owner:
+                names.add(owner["file"])
+            elif owner or age > 60:
+                # Clean up pins left by processes that crashed (but not the
+                # ones still being written)
+                try:
+                    os.remove(pin)
+                except OSError:
+                    pass
+        return names
+
+    def _load(self):
+        """
+        Read the access statistics, merging the log into the state file.
+
+        Must only be called while holding the eviction lock.
+        """
+        try:
+            with open(self._state) as fin:
+                state = json.load(fin)
+        except (OSError, ValueError):
+            state = {}
+        merging = self._log + ".merging"
+        # Leftovers from a merge that was interrupted
+        if os.path.exists(merging):
+            _merge_log(merging, state)
+            os.remove(merging)
+        # Move the log out of the way so that new accesses go to a new log
+        # while we read it.
+        try:
+            os.replace(self._log, merging)
+        except OSError:
+            pass
+        _merge_log(merging, state)
+        return state, merging
+
+    def _save(self, state, merging):
+        "Write the access statistics and remove the merged log"
+        with temporary_file(path=self._metadata) as tmp:
+            with open(tmp, "w") as fout:
+                json.dump(state, fout)
+            os.replace(tmp, self._state)
+        try:
+            os.remove(merging)
+        except OSError:
+            pass
+
+    def entries(self):
+        """
+        The files that are tracked and their access statistics.
+
+        Returns
+        -------
+        entries : list of :class:`CacheEntry`
+            The files that exist in the storage folder.
+
+        """
+        with FileLock(os.path.join(self._metadata, "locks", "cache.lock")):
+            state, merging = self._load()
+            entries = self._entries(state)
+            self._save(state, merging)
+        return entries
+
+    def _entries(self, state):
+        "Make entries for the files in the state and forget missing files"
+        entries = []
+        now = time.time()
+        for name, (last_access, count) in list(state.items()):
+            try:
+                size = os.path.getsize(os.path.join(self.root, name))
+            except OSError:
+                del state[name]
+                continue
+            entries.append(CacheEntry(name, size, last_access, count, now=now))
+        return entries
+
+    def usage(self):
+        """
+        The total size of the tracked files.
+
+        Returns
+        -------
+        size : int
+            The size in bytes.
+
+        """
+        return sum(entry.size for entry in self.entries())
+
+    def evict(self, keep=()):
+        """
+        Remove files until their total size is below the maximum.
+
+        Does nothing if another process is already removing files.
+
+        Parameters
+        ----------
+        keep : iterable of str
+            Names of files that shouldn't be removed.
+
+        Returns
+        -------
+        removed : list of str
+            The names of the files that were removed.
+
+        """
+        if self.max_size is None:
+            return []
+        policy = self.policy if callable(self.policy) else POLICIES[self.policy]
+        lock = FileLock(os.path.join(self._metadata, "locks", "cache.lock"), timeout=0)
+        try:
+            lock.acquire()
+        except TimeoutError:
+            return []
+        try:
+            state, merging = self._load()
+            entries = self._entries(state)
+            total = sum(entry.size for entry in entries)
+            removed = []
+            if total > self.max_size:
+                protected = set(keep) | self.pinned()
+                candidates = sorted(
+                    (
+                        entry
+                        for entry in entries
+                        if entry.name not in protected and entry.age >= self.min_age
+                    ),
+                    key=policy,
+                )
+                for entry in candidates:
+                    if total <= self.max_size:
+                        break
+                    try:
+                        os.remove(os.path.join(self.root, entry.name))
+                    except OSError:
+                        # Can happen on Windows if the file is open
+                        continue
+                    total -= entry.size
+                    del state[entry.name]
+                    removed.append(entry.name)
+                if removed:
+                    get_logger().info(
+                        "Removed %d files from '%s' to keep it under %d bytes.",
+                        len(removed),
+                        self.root,
+                        self.max_size,
+                    )
+            self._save(state, merging)
+        finally:
+            lock.release()
+        return removed
+
+
+def _merge_log(fname, state):
+    """
+    Add the accesses in a log file to the access statistics.
+    """
+    try:
+        with open(fname) as fin:
+            for line in fin:
+                try:
+                    accessed, name = json.loads(line)
+                except (ValueError, TypeError):
+                    continue
+                last_access, count = state.get(name, (0, 0))
+                state[name] = [max(last_access, accessed), count + 1]
+    except OSError:
+        pass
@@ -2,21 +2,34 @@
 The main Pooch class and a factory function for it.
 """
 import contextlib
+import functools
+import json
 import os
 from pathlib import Path
 import shutil
-import ftplib
 
-import requests
 from .utils import (
     check_version,
     parse_url,
     get_logger,
     make_local_storage,
+    hash_algorithm,
     hash_matches,
     temporary_file,
+    running_loop,
+    HashedWriter,
+    METADATA_DIR,
 )
-from .downloaders import choose_downloader
+from .downloaders import choose_downloader, FileDownloader
+from .index import HashIndex
+from .blobstore import BlobStore, _place
+from .cache import CacheManager
+from .registry import SQLiteRegistry, read_registry
+from .locking import FileLock, SingleFlight
+
+# Modules that are only needed for downloads (like asyncio) are imported where
+# they are used to keep importing pooch fast.
+# pylint: disable=import-outside-toplevel
 
 
 def create(
@@ -27,6 +40,9 @@ def create(
     env=None,
     registry=None,
     urls=None,
+    blob_store=None,
+    tiers=None,
+    broker=None,
 ):
     """
     Create a :class:`~pooch.Pooch` with sensible defaults to fetch data files.
@@ -79,6 +95,19 @@ def create(
         Not all files in *registry* need an entry in *urls*. If a file has an
         entry in *urls*, the *base_url* will be ignored when downloading it in
         favor of ``urls[fname]``.
+    blob_store : str, PathLike, or None
+        A folder where downloaded files are stored by their hashes and shared
+        between Pooch instances (for example, between versions of your
+        project). See :class:`~pooch.Pooch` for details. If None, files are
+        only stored in the local storage folder.
+    tiers : list of str or PathLike, or None
+        Other storage folders (like a shared cache) that are checked for a
+        file before downloading it. See :class:`~pooch.Pooch` for details.
+        The *version* is **not** appended to them.
+    broker : str, PathLike, or None
+        The Unix domain socket of a broker that downloads files for all
+        processes using the local storage. See :class:`~pooch.Pooch` for
+        details.
 
     Returns
     -------
@@ -158,7 +187,15 @@ def create(
         version = check_version(version, fallback=version_dev)
         base_url = base_url.format(version=version)
     path = make_local_storage(path, env, version)
-    pup = Pooch(path=path, base_url=base_url, registry=registry, urls=urls)
+    pup = Pooch(
+        path=path,
+        base_url=base_url,
+        registry=registry,
+        urls=urls,
+        blob_store=blob_store,
+        tiers=tiers,
+        broker=broker,
+    )
     return pup
 
 
@@ -182,17 +219,95 @@ class Pooch:
         the file names and the values should be their hashes. Only files
         in the registry can be fetched from the local storage. Files in
         subdirectories of *path* **must use Unix-style separators** (``'/'``)
-        even on Windows.
+        even on Windows. Can also be another mapping, like a
+        :class:`pooch.SQLiteRegistry` for very large registries.
     urls : dict or None
         Custom URLs for downloading individual files in the registry. A
         dictionary with the file names as keys and the custom URLs as values.
         Not all files in *registry* need an entry in *urls*. If a file has an
         entry in *urls*, the *base_url* will be ignored when downloading it in
-        favor of ``urls[fname]``.
+        favor of ``urls[fname]``. Dictionaries are copied but other mappings
+        (like :attr:`pooch.SQLiteRegistry.urls`) are used as they are.
+    blob_store : str, PathLike, :class:`~pooch.blobstore.BlobStore`, or None
+        A folder where downloaded files are stored by their hashes. Files in
+        the local storage are hard links to the files in the blob store, so
+        files with the same hash are only downloaded and stored once even if
+        they're used by several Pooch instances (for example, under different
+        names, in versioned folders, or in different projects). Before
+        downloading a file, the blob store is checked for a file with the
+        same hash. If None, files are only stored in the local storage folder.
+    tiers : list of str or PathLike, or None
+        Other storage folders with the same layout as *path* (for example, a
+        read-only cache shared by the nodes of a cluster on a parallel file
+        system) that are checked in order before downloading a file. The
+        first tier with a file that matches the registry is used instead of
+        the network and the file is promoted to *path* (which should be the
+        fastest storage) as a hard link, a copy-on-write clone, or a copy. If
+        a tier has a hash index (see :attr:`~pooch.Pooch.hash_index`), it's
+        used to avoid hashing the file. Otherwise, the file is hashed while
+        it's copied. Tiers are never written to and are only accessed when
+        the file isn't already in *path*.
+    broker : str, PathLike, or None
+        The Unix domain socket of a :class:`pooch.broker.FetchBroker` (see
+        ``pooch broker``). Files that have to be downloaded (and aren't in
+        the blob store or the *tiers*) are downloaded by the broker so that
+        all processes on the machine share the downloads, the limit of
+        concurrent downloads, and the connections. Fetches with a custom
+        downloader don't use the broker. If the broker can't be reached or
+        can't write to the local storage, the file is downloaded by this
+        process. If None, will use the socket in the ``POOCH_BROKER``
+        environment variable (if it's set).
+    cache_size : int or None
+        Maximum total size (in bytes) of the files fetched into the local
+        storage. After a download, the files that were fetched least
+        recently (or according to *eviction*) are removed until the total size
+        is below the limit. See :class:`pooch.cache.CacheManager` for details.
+        With a *blob_store*, the blobs of the removed files are also removed
+        unless other files still link to them. If None, files are never
+        removed.
+    eviction : str or callable
+        The policy used to choose which files to remove if *cache_size* is
+        exceeded: ``"lru"`` (least recently used), ``"lfu"`` (least
+        frequently used), ``"size"`` (large files not used in a long time), or
+        a function (see :class:`pooch.cache.CacheManager`).
+    verify : str
+        How files that are already in the local storage are checked against
+        the registry before :meth:`~pooch.Pooch.fetch` returns them (files
+        that are downloaded are always checked):
+
+        * ``"stat"``: hash the file unless it hasn't changed (same size,
+          modification time, and inode) since it was last verified (see
+          :attr:`~pooch.Pooch.hash_index`). This is the default.
+        * ``"always"``: hash the file every time.
+        * ``"once-per-process"``: like ``"stat"`` but each file is only
+          checked the first time it's fetched by this instance.
+        * ``"size-only"``: trust the file if its size is the same as when it
+          was last verified. Files that were never verified are hashed.
+        * ``"background"``: return the file right away and check it (like
+          ``"stat"``) in a background thread. If it doesn't match the
+          registry, the next fetch of the file raises a :class:`ValueError`
+          and the one after that downloads it again.
+        * ``"never"``: return files that exist without checking them.
+
+        Policies other than ``"stat"`` and ``"always"`` trade safety for
+        speed and are meant for local disks that can be trusted.
 
     """
 
-    def __init__(self, path, base_url, registry=None, urls=None):
+    def __init__(
+        self,
+        path,
+        base_url,
+        registry=None,
+        urls=None,
+        blob_store=None,
+        cache_size=None,
+        eviction="lru",
+        verify="stat",
+        tiers=None,
+        broker=None,
+    ):
+        _check_verify(verify)
         self.path = path
         self.base_url = base_url
         if registry is None:
@@ -200,19 +315,113 @@ class Pooch:
         self.registry = registry
         if urls is None:
             urls = dict()
-        self.urls = dict(urls)
+        if isinstance(urls, dict):
+            urls = dict(urls)
+        self.urls = urls
+        if blob_store is not None and not isinstance(blob_store, BlobStore):
+            blob_store = BlobStore(blob_store)
+        self.blob_store = blob_store
+        if tiers is None:
+            tiers = []
+        self.tiers = [os.path.abspath(os.path.expanduser(str(t))) for t in tiers]
+        if broker is None:
+            broker = os.environ.get("POOCH_BROKER") or None
+        self.broker = broker
+        self.cache_size = cache_size
+        self.eviction = eviction
+        self.verify = verify
+        self._cache = None
+        self._index = None
+        self._tier_indexes = None
+        self._abspath = None
+        self._paths = dict()
+        self._flights = SingleFlight()
+        self._downloaders = dict()
+        # Files verified (or being verified in the background) by this
+        # instance and errors found by background checks
+        self._verified = set()
+        self._failed = dict()
+        self._background = None
+
+    def __getstate__(self):
+        # Locks and caches can't be pickled and are rebuilt when needed
+        state = self.__dict__.copy()
+        state["_index"] = None
+        state["_tier_indexes"] = None
+        state["_cache"] = None
+        state["_abspath"] = None
+        state["_paths"] = dict()
+        state["_downloaders"] = dict()
+        state["_verified"] = set()
+        state["_failed"] = dict()
+        state["_background"] = None
+        del state["_flights"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._flights = SingleFlight()
 
     @property
     def abspath(self):
         "Absolute path to the local storage"
-        return Path(os.path.abspath(os.path.expanduser(str(self.path))))
+        # Cached since fetching a file that's already in the local storage
+        # shouldn't take longer than necessary. Relative paths depend on the
+        # current working directory.
+        path = str(self.path)
+        key = path if os.path.isabs(path) else (path, os.getcwd())
+        if self._abspath is None or self._abspath[0] != key:
+            self._abspath = (key, Path(os.path.abspath(os.path.expanduser(path))))
+            self._paths = dict()
+        return self._abspath[1]
+
+    def _full_path(self, fname):
+        "Absolute path to a file in the local storage as a string (cached)"
+        root = self.abspath
+        full_path = self._paths.get(fname)
+        if full_path is None:
+            full_path = self._paths[fname] = str(root / fname)
+        return full_path
+
+    @property
+    def hash_index(self):
+        """
+        Index of verified files in the local storage
+
+        A :class:`pooch.index.HashIndex` used to avoid hashing files again if
+        they haven't changed since they were last verified.
+        """
+        root = str(self.abspath)
+        if self._index is None or self._index.root != root:
+            self._index = HashIndex(root)
+        return self._index
+
+    @property
+    def cache(self):
+        """
+        Manager of the size of the local storage
+
+        A :class:`pooch.cache.CacheManager` that records which files are used
+        and removes files if they take more than *cache_size* bytes.
+        """
+        root = str(self.abspath)
+        if (
+            self._cache is None
+            or self._cache.root != root
+            or self._cache.max_size != self.cache_size
+            or self._cache.policy != self.eviction
+        ):
+            self._cache = CacheManager(
+                root, max_size=self.cache_size, policy=self.eviction
+            )
+        return self._cache
 
     @property
     def registry_files(self):
         "List of file names on the registry"
         return list(self.registry)
 
-    def fetch(self, fname, processor=None, downloader=None):
+    def fetch(self, fname, processor=None, downloader=None, verify=None):
         """
         Get the absolute path to a file in the local storage.
 
@@ -251,6 +460,10 @@ class Pooch:
             called to download a given URL to a provided local file name. By
             default, downloads are done through HTTP without authentication
             using :class:`pooch.HTTPDownloader`. See below for details.
+        verify : str or None
+            How to check the file if it's already in the local storage. If
+            None, will use the *verify* policy of this instance. See
+            :class:`~pooch.Pooch` for the available policies.
 
         Returns
         -------
@@ -311,6 +524,13 @@ class Pooch:
                 '''
                 ...
 
+        When called by :meth:`~pooch.Pooch.fetch`, downloaders receive a
+        binary file-like object (:class:`pooch.utils.HashedWriter`) as
+        *output_file*. Writing the data through its ``write`` method allows
+        the hash of the file to be checked without reading it back from disk.
+        The object is also path-like, so downloaders can still ``open`` it
+        instead, at the cost of an extra read of the file.
+
         **Authentication** through HTTP can be handled by
         :class:`pooch.HTTPDownloader`:
 
@@ -332,29 +552,590 @@ class Pooch:
 
         """
         self._assert_file_in_registry(fname)
+        if verify is None:
+            verify = self.verify
+        _check_verify(verify)
+        if processor is None and verify in ("never", "once-per-process", "background"):
+            # Files that this instance already verified (or that don't need
+            # to be) can be returned without waiting for other threads
+            full_path = self._full_path(fname)
+            key = (full_path, self.registry[fname])
+            if (
+                (verify == "never" or key in self._verified)
+                and key not in self._failed
+                and os.path.exists(full_path)
+            ):
+                if self.cache_size is not None:
+                    self._track_access(fname, "fetch")
+                return full_path
+        # Concurrent calls for the same file and processor in this process
+        # share a single download and processing
+        return self._flights.run(
+            (fname, id(processor)), self._fetch, fname, processor, downloader, verify
+        )
 
-        # Create the local data directory if it doesn't already exist
-        os.makedirs(str(self.abspath), exist_ok=True)
+    def _fetch(self, fname, processor, downloader, verify):
+        """
+        Fetch a file without coordinating with other threads (see fetch).
+        """
+        full_path = self.abspath / fname
+        known_hash = self.registry[fname]
+        action, verb = self._local_action(full_path, known_hash, verify)
+
+        brokered = False
+        if action in ("download", "update") and downloader is None:
+            brokered = self._fetch_with_broker(fname, full_path, known_hash, verb)
+
+        if action in ("download", "update") and not brokered:
+            # Create the local data directory if it doesn't already exist
+            os.makedirs(str(self.abspath), exist_ok=True)
+            url = self.get_url(fname)
+            with self._download_lock(fname) as lock:
+                # Another process might have downloaded the file while we
+                # waited for the lock
+                if lock.waited:
+                    action, verb = download_action(
+                        full_path, known_hash, index=self.hash_index
+                    )
+                if action in ("download", "update") and not (
+                    self._link_blob(fname, full_path, known_hash)
+                    or self._promote(fname, full_path, known_hash)
+                ):
+                    get_logger().info(
+                        "%s file '%s' from '%s' to '%s'.",
+                        verb,
+                        fname,
+                        url,
+                        str(self.abspath),
+                    )
 
-        url = self.get_url(fname)
+                    if downloader is None:
+                        downloader = self.default_downloader(url)
+
+                    stream_download(url, full_path, known_hash, downloader, pooch=self)
+                    self._store_blob(full_path, known_hash)
+                    self.hash_index.record(full_path, known_hash)
+                self._verified.add((str(full_path), known_hash))
+
+        if self.cache_size is not None:
+            self._track_access(fname, action)
+            if processor is not None:
+                with self.cache.pin(fname):
+                    return processor(str(full_path), action, self)
+
+        if processor is not None:
+            return processor(str(full_path), action, self)
+
+        return str(full_path)
+
+    def fetch_many(
+        self,
+        fnames,
+        processor=None,
+        downloader=None,
+        max_workers=None,
+        return_exceptions=False,
+    ):
+        """
+        Get the absolute paths to several files in the local storage at once.
+
+        Works like :meth:`~pooch.Pooch.fetch` but the files are downloaded,
+        verified, and processed concurrently by a pool of threads. This is
+        much faster than calling :meth:`~pooch.Pooch.fetch` in a loop when
+        fetching many small files since the time spent waiting on each server
+        response overlaps.
+
+        All files are fetched even if some of them fail. By default, the first
+        error (in the order of *fnames*) is raised once all files are done.
+        Use ``return_exceptions=True`` to get the exceptions in place of the
+        results instead.
+
+        Parameters
+        ----------
+        fnames : list of str
+            The file names (relative to the *base_url* of the remote data
+            storage) to fetch from the local storage. Repeated names are only
+            fetched once.
+        processor : None or callable
+            If not None, then a function (or callable object) that will be
+            called for each file before returning the full path and after the
+            file has been downloaded (if required). It must be safe to call it
+            from several threads at once. See :meth:`~pooch.Pooch.fetch`.
+        downloader : None or callable
+            If not None, then a function (or callable object) that will be
+            called to download a given URL to a provided local file name. It
+            must be safe to call it from several threads at once. See
+            :meth:`~pooch.Pooch.fetch`.
+        max_workers : int or None
+            The maximum number of threads used. If None, will use the default
+            of :class:`concurrent.futures.ThreadPoolExecutor`.
+        return_exceptions : bool
+            If True, exceptions raised while fetching a file are returned in
+            place of its result instead of being raised.
+
+        Returns
+        -------
+        results : list
+            The value that :meth:`~pooch.Pooch.fetch` returns for each file in
+            *fnames* (in the same order).
+
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait
+
+        fnames = list(fnames)
+        unique = list(dict.fromkeys(fnames))
+        for fname in unique:
+            self._assert_file_in_registry(fname)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                fname: executor.submit(
+                    self.fetch, fname, processor=processor, downloader=downloader
+                )
+                for fname in unique
+            }
+            wait(list(futures.values()))
+        results = []
+        for fname in fnames:
+            error = futures[fname].exception()
+            if error is not None and not return_exceptions:
+                raise error
+            results.append(error if error is not None else futures[fname].result())
+        return results
+
+    async def afetch(self, fname, processor=None, downloader=None, verify=None):
+        """
+        Get the absolute path to a file in the local storage (coroutine).
+
+        Asynchronous version of :meth:`~pooch.Pooch.fetch` for use with
+        :mod:`asyncio`. The arguments and return value are the same.
+
+        Pooch doesn't include an asynchronous downloader. With the default
+        downloaders (like :class:`pooch.HTTPDownloader`) and any other
+        regular downloader, this only runs :meth:`~pooch.Pooch.fetch` in the
+        default executor of the event loop, so each download takes up one of
+        the executor's threads. Only if *downloader* is a coroutine function
+        (``async def``) does the download run on the event loop itself
+        without threads. Checking the hash of local files and running the
+        *processor* are still done in the executor so that they don't block
+        the event loop.
+
+        Parameters
+        ----------
+        fname : str
+            The file name (relative to the *base_url* of the remote data
+            storage) to fetch from the local storage.
+        processor : None or callable
+            If not None, then a function (or callable object) that will be
+            called before returning the full path and after the file has been
+            downloaded (if required). See :meth:`~pooch.Pooch.fetch`.
+        downloader : None or callable
+            If not None, then a function, callable object, or coroutine
+            function that will be called to download a given URL to a provided
+            local file name. See below for asynchronous downloaders and
+            :meth:`~pooch.Pooch.fetch` for regular ones.
+        verify : str or None
+            How to check the file if it's already in the local storage (see
+            :meth:`~pooch.Pooch.fetch`).
+
+        Returns
+        -------
+        full_path : str
+            The absolute path (including the file name) of the file in the
+            local storage.
+
+        Notes
+        -----
+
+        **Asynchronous downloader** functions have the same arguments as
+        regular downloaders but are defined with ``async def``:
+
+        .. code:: python
+
+            async def mydownloader(url, output_file, pooch):
+                '''
+                Download a file from the given URL to the given local file.
+
+                The arguments are the same as for regular downloaders (see
+                pooch.Pooch.fetch). Write the data with output_file.write as it
+                arrives so that the hash is calculated without reading the file
+                back from disk. Avoid blocking the event loop for long.
+                '''
+                ...
+
+        """
+        self._assert_file_in_registry(fname)
+        if verify is None:
+            verify = self.verify
+        _check_verify(verify)
+        if downloader is None or not is_async_downloader(downloader):
+            return await running_loop().run_in_executor(
+                None,
+                functools.partial(self.fetch, fname, processor, downloader, verify),
+            )
+        return await self._flights.arun(
+            (fname, id(processor)), self._afetch, fname, processor, downloader, verify
+        )
+
+    async def _afetch(self, fname, processor, downloader, verify):
+        """
+        Fetch a file with an asynchronous downloader (see afetch).
+        """
+        loop = running_loop()
         full_path = self.abspath / fname
         known_hash = self.registry[fname]
-        action, verb = download_action(full_path, known_hash)
+        action, verb = await loop.run_in_executor(
+            None, self._local_action, full_path, known_hash, verify
+        )
 
         if action in ("download", "update"):
+            os.makedirs(str(self.abspath), exist_ok=True)
+            url = self.get_url(fname)
+            lock = self._download_lock(fname)
+            await loop.run_in_executor(None, lock.acquire)
+            try:
+                if lock.waited:
+                    action, verb = await loop.run_in_executor(
+                        None, download_action, full_path, known_hash, self.hash_index
+                    )
+                linked = action in ("download", "update") and (
+                    await loop.run_in_executor(
+                        None, self._link_blob, fname, full_path, known_hash
+                    )
+                    or await loop.run_in_executor(
+                        None, self._promote, fname, full_path, known_hash
+                    )
+                )
+                if action in ("download", "update") and not linked:
+                    get_logger().info(
+                        "%s file '%s' from '%s' to '%s'.",
+                        verb,
+                        fname,
+                        url,
+                        str(self.abspath),
+                    )
+                    await astream_download(
+                        url, full_path, known_hash, downloader, pooch=self
+                    )
+                    await loop.run_in_executor(
+                        None, self._store_blob, full_path, known_hash
+                    )
+                    self.hash_index.record(full_path, known_hash)
+                self._verified.add((str(full_path), known_hash))
+            finally:
+                lock.release()
+
+        if self.cache_size is not None:
+            await loop.run_in_executor(None, self._track_access, fname, action)
+            if processor is not None:
+                with self.cache.pin(fname):
+                    return await loop.run_in_executor(
+                        None, processor, str(full_path), action, self
+                    )
+
+        if processor is not None:
+            return await loop.run_in_executor(
+                None, processor, str(full_path), action, self
+            )
+
+        return str(full_path)
+
+    async def afetch_many(
+        self,
+        fnames,
+        processor=None,
+        downloader=None,
+        max_concurrency=None,
+        return_exceptions=False,
+    ):
+        """
+        Get the absolute paths to several files concurrently (coroutine).
+
+        Asynchronous version of :meth:`~pooch.Pooch.fetch_many`. Runs
+        :meth:`~pooch.Pooch.afetch` for all files concurrently on the event
+        loop.
+
+        Parameters
+        ----------
+        fnames : list of str
+            The file names (relative to the *base_url* of the remote data
+            storage) to fetch from the local storage. Repeated names are only
+            fetched once.
+        processor : None or callable
+            If not None, then a function (or callable object) that will be
+            called for each file. See :meth:`~pooch.Pooch.afetch`.
+        downloader : None or callable
+            If not None, then a function, callable object, or coroutine
+            function used to download the files. See
+            :meth:`~pooch.Pooch.afetch`.
+        max_concurrency : int or None
+            The maximum number of files fetched at the same time. If None,
+            there is no limit.
+        return_exceptions : bool
+            If True, exceptions raised while fetching a file are returned in
+            place of its result instead of being raised.
+
+        Returns
+        -------
+        results : list
+            The value that :meth:`~pooch.Pooch.afetch` returns for each file
+            in *fnames* (in the same order).
+
+        """
+        import asyncio
+
+        fnames = list(fnames)
+        unique = list(dict.fromkeys(fnames))
+        for fname in unique:
+            self._assert_file_in_registry(fname)
+        if max_concurrency is None:
+            max_concurrency = max(len(unique), 1)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def afetch_one(fname):
+            "Fetch a single file respecting the concurrency limit"
+            async with semaphore:
+                return await self.afetch(
+                    fname, processor=processor, downloader=downloader
+                )
+
+        results = await asyncio.gather(
+            *[afetch_one(fname) for fname in unique], return_exceptions=True
+        )
+        results = dict(zip(unique, results))
+        for fname in fnames:
+            if isinstance(results[fname], Exception) and not return_exceptions:
+                raise results[fname]
+        return [results[fname] for fname in fnames]
+
+    def default_downloader(self, url):
+        """
+        Get the downloader used for a URL when no custom downloader is given.
+
+        One downloader is created for each protocol (see
+        :func:`pooch.downloaders.choose_downloader`) and kept for later
+        downloads so that connections to the servers can be reused.
+
+        Parameters
+        ----------
+        url : str
+            A URL (including protocol).
+
+        Returns
+        -------
+        downloader
+            The downloader for the protocol of *url*.
+
+        """
+        protocol = parse_url(url)["protocol"]
+        if protocol not in self._downloaders:
+            self._downloaders.setdefault(protocol, choose_downloader(url))
+        return self._downloaders[protocol]
+
+    def _link_blob(self, fname, full_path, known_hash):
+        """
+        Place the file from the blob store if it has a file with the same hash.
+
+        Returns True if the file was placed and doesn't need to be downloaded.
+        """
+        if self.blob_store is None or known_hash is None:
+            return False
+        if not self.blob_store.link(known_hash, full_path):
+            return False
+        get_logger().info(
+            "Linking file '%s' from blob store '%s' to '%s'.",
+            fname,
+            self.blob_store.path,
+            str(self.abspath),
+        )
+        self.hash_index.record(full_path, known_hash)
+        return True
+
+    def _fetch_with_broker(self, fname, full_path, known_hash, verb):
+        """
+        Download the file through the broker (if there is one).
+
+        Returns True if the file was placed. False if there is no broker, it
+        can't be reached, or it refuses to write to the local storage and the
+        file must be downloaded by this process.
+        """
+        if self.broker is None:
+            return False
+        if self._link_blob(fname, full_path, known_hash) or self._promote(
+            fname, full_path, known_hash
+        ):
+            return True
+        try:
+            from .broker import request_fetch
+        except ImportError:
+            get_logger().warning("Brokers need Unix domain sockets. Ignoring it.")
+            return False
+        url = self.get_url(fname)
+        get_logger().info(
+            "%s file '%s' from '%s' to '%s' through broker '%s'.",
+            verb,
+            fname,
+            url,
+            str(self.abspath),
+            str(self.broker),
+        )
+        try:
+            request_fetch(self.broker, str(self.abspath), fname, known_hash, url)
+        except (ConnectionError, PermissionError) as error:
+            # ConnectionError is only raised if the broker can't be reached
+            # (errors of its downloads are sent back as OSError, ValueError,
+            # etc). PermissionError means that the broker can't write to this
+            # local storage.
+            get_logger().warning(
+                "Could not download '%s' through the broker: %s", fname, str(error)
+            )
+            return False
+        self._store_blob(full_path, known_hash)
+        self._verified.add((str(full_path), known_hash))
+        return True
+
+    def _promote(self, fname, full_path, known_hash):
+        """
+        Place the file from the first storage tier that has a valid copy.
+
+        Returns True if the file was placed and doesn't need to be downloaded.
+        """
+        if self._tier_indexes is None:
+            self._tier_indexes = [HashIndex(tier) for tier in self.tiers]
+        for index in self._tier_indexes:
+            source = os.path.join(index.root, *fname.split("/"))
+            if not os.path.isfile(source):
+                continue
+            try:
+                if known_hash is None:
+                    matches = True
+                else:
+                    matches = index.lookup(source, known_hash)
+                if matches:
+                    _place(source, str(full_path))
+                elif matches is None:
+                    # Hashed while it's copied (the tier isn't trusted)
+                    stream_download(source, full_path, known_hash, FileDownloader())
+                else:
+                    continue
+            except (OSError, ValueError) as error:
+                get_logger().warning(
+                    "Could not use file '%s' from storage tier '%s': %s",
+                    fname,
+                    index.root,
+                    str(error),
+                )
+                continue
             get_logger().info(
-                "%s file '%s' from '%s' to '%s'.", verb, fname, url, str(self.abspath),
+                "Promoting file '%s' from storage tier '%s' to '%s'.",
+                fname,
+                index.root,
+                str(self.abspath),
+            )
+            if known_hash is not None:
+                self.hash_index.record(full_path, known_hash)
+            return True
+        return False
+
+    def _store_blob(self, full_path, known_hash):
+        "Add a downloaded file to the blob store (if there is one)"
+        if self.blob_store is None or known_hash is None:
+            return
+        try:
+            self.blob_store.add(full_path, known_hash)
+        except OSError as error:
+            get_logger().warning(
+                "Could not add '%s' to blob store '%s': %s",
+                str(full_path),
+                self.blob_store.path,
+                str(error),
             )
 
-            if downloader is None:
-                downloader = choose_downloader(url)
+    def _local_action(self, full_path, known_hash, verify):
+        """
+        Determine the action needed to get a file using a verification policy.
 
-            stream_download(url, full_path, known_hash, downloader, pooch=self)
+        See *verify* in :class:`~pooch.Pooch` for the policies.
+        """
+        if verify == "always":
+            return download_action(full_path, known_hash)
+        if verify == "stat":
+            return download_action(full_path, known_hash, index=self.hash_index)
+        key = (str(full_path), known_hash)
+        if key in self._failed:
+            # A background check found that the file doesn't match. Raise the
+            # error once and then check the file again (and download it).
+            error = self._failed.pop(key)
+            if error is not None:
+                self._failed[key] = None
+                raise error
+            return download_action(full_path, known_hash, index=self.hash_index)
+        if verify == "never" or (verify != "size-only" and key in self._verified):
+            # Files can still be removed by others (or the cache manager)
+            if os.path.exists(key[0]):
+                return "fetch", "Fetching"
+            self._verified.discard(key)
+        if verify == "size-only" and self.hash_index.lookup(
+            full_path, known_hash, size_only=True
+        ):
+            return "fetch", "Fetching"
+        if verify == "background" and os.path.exists(key[0]):
+            self._verified.add(key)
+            self._check_in_background(key, full_path, known_hash)
+            return "fetch", "Fetching"
+        action, verb = download_action(full_path, known_hash, index=self.hash_index)
+        if action == "fetch":
+            self._verified.add(key)
+        return action, verb
+
+    def _check_in_background(self, key, full_path, known_hash):
+        """
+        Check a file in a background thread and keep the error if it fails.
+        """
+        from concurrent.futures import ThreadPoolExecutor
 
-        if processor is not None:
-            return processor(str(full_path), action, self)
+        def check():
+            "Check the file and record the error for the next fetch"
+            try:
+                action, __ = download_action(
+                    full_path, known_hash, index=self.hash_index
+                )
+                if action != "fetch":
+                    raise ValueError(
+                        "File '{}' doesn't match its hash in the registry '{}' "
+                        "(found by a background check). It will be downloaded "
+                        "again the next time it's fetched.".format(
+                            str(full_path), known_hash
+                        )
+                    )
+            except Exception as error:  # pylint: disable=broad-except
+                self._verified.discard(key)
+                self._failed[key] = error
 
-        return str(full_path)
+        if self._background is None:
+            self._background = ThreadPoolExecutor(max_workers=1)
+        self._background.submit(check)
+
+    def _track_access(self, fname, action):
+        """
+        Record the access to a file and remove others if the cache is full.
+        """
+        self.cache.record_access(fname)
+        if action in ("download", "update"):
+            for removed in self.cache.evict(keep=[fname]):
+                self.hash_index.forget(self.abspath / removed)
+                known_hash = self.registry.get(removed)
+                if self.blob_store is not None and known_hash is not None:
+                    # The disk space is only freed if the blob goes too
+                    self.blob_store.release(known_hash)
+
+    def _download_lock(self, fname):
+        """
+        Lock used to make sure only one process downloads a file at a time.
+
+        The lock files are kept in the ``.pooch/locks`` folder of the local
+        storage.
+        """
+        return FileLock(self.abspath / METADATA_DIR / "locks" / (fname + ".lock"))
 
     def _assert_file_in_registry(self, fname):
         """
@@ -390,40 +1171,28 @@ class Pooch:
         Only one file per line is allowed. Custom download URLs for individual
         files can be specified as a third element on the line.
 
+        Registry files compressed with gzip, LZMA (xz), or bzip2 are
+        decompressed automatically (see :func:`pooch.registry.read_registry`).
+
         Parameters
         ----------
         fname : str | fileobj
             Path (or open file object) to the registry file.
 
+        Raises
+        ------
+        OSError
+            If any line of the file is invalid. The message lists all invalid
+            lines and nothing is added to the registry.
+
         """
+        hashes, urls = read_registry(fname)
         with contextlib.ExitStack() as stack:
-            if hasattr(fname, "read"):
-                # It's a file object
-                fin = fname
-            else:
-                # It's a file path
-                fin = stack.enter_context(open(fname))
-
-            for linenum, line in enumerate(fin):
-                if isinstance(line, bytes):
-                    line = line.decode("utf-8")
-
-                elements = line.strip().split()
-                if not len(elements) in [0, 2, 3]:
-                    raise OSError(
-                        "Invalid entry in Pooch registry file '{}': "
-                        "expected 2 or 3 elements in line {} but got {}. "
-                        "Offending entry: '{}'".format(
-                            fname, linenum + 1, len(elements), line
-                        )
-                    )
-                if elements:
-                    file_name = elements[0]
-                    file_checksum = elements[1]
-                    if len(elements) == 3:
-                        file_url = elements[2]
-                        self.urls[file_name] = file_url
-                    self.registry[file_name] = file_checksum
+            if isinstance(self.registry, SQLiteRegistry):
+                # Committing each entry separately would be very slow
+                stack.enter_context(self.registry.transaction())
+            self.urls.update(urls)
+            self.registry.update(hashes)
 
     def is_available(self, fname):
         """
@@ -449,20 +1218,40 @@ class Pooch:
         parsed_url = parse_url(source)
         if parsed_url["protocol"] == "ftp":
             directory = os.path.dirname(parsed_url["path"])
-            ftp = ftplib.FTP()
-            ftp.connect(host=parsed_url["netloc"])
-            try:
-                ftp.login()
+            downloader = self.default_downloader(source)
+            with downloader.connection(parsed_url["netloc"]) as ftp:
                 available = parsed_url["path"] in ftp.nlst(directory)
-            finally:
-                ftp.close()
+        elif parsed_url["protocol"] == "file":
+            downloader = self.default_downloader(source)
+            available = os.path.isfile(downloader.local_path(source))
         else:
-            response = requests.head(source, allow_redirects=True)
+            session = self.default_downloader(source).session
+            response = session.head(source, allow_redirects=True)
             available = bool(response.status_code == 200)
         return available
 
 
-def download_action(path, known_hash):
+VERIFY_POLICIES = (
+    "stat",
+    "always",
+    "once-per-process",
+    "size-only",
+    "background",
+    "never",
+)
+
+
+def _check_verify(verify):
+    "Raise an exception if the verification policy is unknown"
+    if verify not in VERIFY_POLICIES:
+        raise ValueError(
+            "Invalid verification policy '{}'. Must be one of {}.".format(
+                verify, list(VERIFY_POLICIES)
+            )
+        )
+
+
+def download_action(path, known_hash, index=None):
     """
     Determine the action that is needed to get the file on disk.
 
@@ -476,6 +1265,10 @@ def download_action(path, known_hash):
         will assume it's a SHA256 hash. To specify a different hashing method,
         prepend the hash with ``algorithm:``, for example
         ``md5:pw9co2iun29juoh`` or ``sha1:092odwhi2ujdp2du2od2odh2wod2``.
+    index : :class:`pooch.index.HashIndex` or None
+        If given, the index is checked before hashing the file. The file is
+        only hashed if it changed since it was recorded in the index. Files
+        that are hashed and match *known_hash* are added to the index.
 
     Returns
     -------
@@ -488,10 +1281,17 @@ def download_action(path, known_hash):
 
 
     """
-    if not path.exists():
+    matches = None
+    if index is not None:
+        matches = index.lookup(path, known_hash)
+    if matches is None and path.exists():
+        matches = hash_matches(str(path), known_hash)
+        if matches and index is not None:
+            index.record(path, known_hash)
+    if matches is None:
         action = "download"
         verb = "Downloading"
-    elif not hash_matches(str(path), known_hash):
+    elif not matches:
         action = "update"
         verb = "Updating"
     else:
@@ -508,15 +1308,151 @@ def stream_download(url, fname, known_hash, downloader, pooch=None):
     It will be moved to the desired file name only if the hash matches the
     known hash. Otherwise, the temporary file is deleted.
 
+    The downloader is given a :class:`~pooch.utils.HashedWriter` as the output
+    file. If the downloader writes to it like a file object, the hash is
+    calculated while downloading and the file is never read back. Otherwise,
+    the hash is calculated from the downloaded file.
+
+    If the downloader has a ``resumable`` attribute set to True, the file is
+    downloaded to ``<fname>.part`` instead. If the download is interrupted,
+    the partial file is kept (along with the downloader's ``resume_info`` in
+    ``<fname>.part.json``) and the next call resumes from where it stopped. The
+    partial file is only deleted once it's complete or if its hash doesn't
+    match. Partial files left by previous downloads are also deleted if the
+    file is downloaded with a downloader that isn't resumable.
+
     """
     # Ensure the parent directory exists in case the file is in a subdirectory.
     # Otherwise, move will cause an error.
-    if not fname.parent.exists():
-        os.makedirs(str(fname.parent))
+    os.makedirs(str(fname.parent), exist_ok=True)
+    algorithm = hash_algorithm(known_hash)
+
+    if getattr(downloader, "resumable", False):
+        with partial_download(fname, known_hash) as output:
+            downloader(url, output, pooch)
+        return
 
     # Stream the file to a temporary so that we can safely check its hash
     # before overwriting the original.
     with temporary_file(path=str(fname.parent)) as tmp:
-        downloader(url, tmp, pooch)
-        hash_matches(tmp, known_hash, strict=True)
+        with HashedWriter(tmp, alg=algorithm) as output:
+            downloader(url, output, pooch)
+        hash_matches(tmp, known_hash, strict=True, new_hash=output.hexdigest())
+        shutil.move(tmp, str(fname))
+    _remove_partial(fname)
+
+
+@contextlib.contextmanager
+def partial_download(fname, known_hash):
+    """
+    Download to a partial file that is kept if the download is interrupted.
+
+    Yields a :class:`~pooch.utils.HashedWriter` for ``<fname>.part`` that
+    resumes any previous download. At the end, the hash is checked and the
+    file is moved to *fname*. If the hash doesn't match, the partial file is
+    deleted and :class:`ValueError` is raised. If an exception is raised
+    inside the context, the partial file and its ``resume_info`` are kept.
+    Downloaders that call :meth:`~pooch.utils.HashedWriter.save_resume_info`
+    store it in ``<fname>.part.json`` right away, so that the download can be
+    resumed even if the process is killed.
+
+    """
+    part = fname.with_name(fname.name + ".part")
+    info_file = fname.with_name(fname.name + ".part.json")
+    resume_info = None
+    if part.exists():
+        try:
+            with open(str(info_file)) as fin:
+                resume_info = json.load(fin)
+        except (OSError, ValueError):
+            resume_info = None
+        get_logger().info("Resuming partial download '%s'.", str(part))
+    output = HashedWriter(
+        part,
+        alg=hash_algorithm(known_hash),
+        resume=resume_info is not None,
+        resume_info=resume_info,
+        info_file=info_file,
+    )
+    try:
+        with output:
+            yield output
+    except BaseException:
+        if output.resume_info and part.exists():
+            with open(str(info_file), "w") as fout:
+                json.dump(output.resume_info, fout)
+        else:
+            _remove_files(part, info_file)
+        raise
+    try:
+        hash_matches(str(part), known_hash, strict=True, new_hash=output.hexdigest())
+        shutil.move(str(part), str(fname))
+    finally:
+        _remove_files(part, info_file)
+
+
+def _remove_files(*fnames):
+    "Delete the files if they exist"
+    for fname in fnames:
+        if fname.exists():
+            os.remove(str(fname))
+
+
+def _remove_partial(fname):
+    """
+    Delete the partial download of a file that was downloaded some other way.
+
+    Left by interrupted downloads with a resumable downloader when the file
+    is then downloaded with one that isn't.
+    """
+    _remove_files(
+        fname.with_name(fname.name + ".part"),
+        fname.with_name(fname.name + ".part.json"),
+    )
+
+
+async def astream_download(url, fname, known_hash, downloader, pooch=None):
+    """
+    Stream the file with an asynchronous downloader and check its hash.
+
+    Coroutine version of :func:`~pooch.core.stream_download` for downloaders
+    that are coroutine functions. The download runs on the event loop. If the
+    hash has to be calculated from the downloaded file, that is done in a
+    thread so that the event loop isn't blocked.
+
+    """
+    loop = running_loop()
+    os.makedirs(str(fname.parent), exist_ok=True)
+    with temporary_file(path=str(fname.parent)) as tmp:
+        with HashedWriter(tmp, alg=hash_algorithm(known_hash)) as output:
+            await downloader(url, output, pooch)
+        new_hash = output.hexdigest()
+        if new_hash is None:
+            await loop.run_in_executor(None, hash_matches, tmp, known_hash, True)
+        else:
+            hash_matches(tmp, known_hash, strict=True, new_hash=new_hash)
         shutil.move(tmp, str(fname))
+    _remove_partial(fname)
+
+
+def is_async_downloader(downloader):
+    """
+    Check if a downloader is a coroutine function (or has one as ``__call__``).
+
+    Examples
+    --------
+
+    >>> async def download(url, output_file, pooch):
+    ...     pass
+    >>> is_async_downloader(download)
+    True
+    >>> from pooch import HTTPDownloader
+    >>> is_async_downloader(HTTPDownloader())
+    False
+
+    """
+    import inspect
+
+    return inspect.iscoroutinefunction(downloader) or inspect.iscoroutinefunction(
+        getattr(downloader, "__call__", None)
+    )
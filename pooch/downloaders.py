@@ -1,16 +1,28 @@
 """
 Download hooks for Pooch.fetch
 """
+import os
 import sys
-import ftplib
-import requests
+import time
+import threading
+from contextlib import contextmanager
+
 from .utils import parse_url
 
 
-try:
-    from tqdm import tqdm
-except ImportError:
-    tqdm = None
+# Dependencies like requests, tqdm, and ftplib are only imported when files are
+# downloaded so that importing pooch to use files that are already in the
+# local storage stays fast.
+# pylint: disable=import-outside-toplevel
+
+
+def _tqdm():
+    "Import the tqdm progress bar class (None if tqdm isn't installed)"
+    try:
+        from tqdm import tqdm
+    except ImportError:
+        tqdm = None
+    return tqdm
 
 
 def choose_downloader(url):
@@ -25,8 +37,8 @@ def choose_downloader(url):
     Returns
     -------
     downloader
-        A downloader class (either :class:`pooch.HTTPDownloader` or
-        :class:`pooch.FTPDownloader`).
+        A downloader class (:class:`pooch.HTTPDownloader`,
+        :class:`pooch.FTPDownloader`, or :class:`pooch.FileDownloader`).
 
     Examples
     --------
@@ -40,9 +52,13 @@ def choose_downloader(url):
     >>> downloader = choose_downloader("ftp://something.com")
     >>> print(downloader.__class__.__name__)
     FTPDownloader
+    >>> downloader = choose_downloader("file:///mnt/mirror/data.txt")
+    >>> print(downloader.__class__.__name__)
+    FileDownloader
 
     """
     known_downloaders = {
+        "file": FileDownloader,
         "ftp": FTPDownloader,
         "https": HTTPDownloader,
         "http": HTTPDownloader,
@@ -77,9 +93,43 @@ class HTTPDownloader:  # pylint: disable=too-few-public-methods
     chunk_size : int
         Files are streamed *chunk_size* bytes at a time instead of loading
         everything into memory at one. Usually doesn't need to be changed.
+    pool_size : int
+        Maximum number of connections kept open to each host. Set it to at
+        least the number of threads downloading at the same time (for example,
+        with :meth:`pooch.Pooch.fetch_many`).
+    keep_alive : bool
+        If True, connections are kept open and reused by later downloads from
+        the same host, saving the TCP and TLS handshakes. If False, every
+        download uses a new connection.
+    resume : bool
+        If True, interrupted downloads made through :meth:`pooch.Pooch.fetch`
+        are kept and resumed by the next fetch using HTTP range requests. Only
+        possible if the server supports ranges and provides an ETag or
+        Last-Modified header. The resumed file is still checked against the
+        known hash.
+    segments : int
+        Number of parts in which large files are split. The parts are
+        downloaded at the same time over separate connections and written to
+        their place in the output file. This can be much faster than a single
+        connection if the throughput of each connection is limited. Only used
+        if the server reports the file size and supports range requests and if
+        the output is a file name (or path-like object). Otherwise, the file is
+        downloaded in a single stream. Segmented downloads can't be resumed
+        and the hash of the file is calculated after it's complete.
+    segment_threshold : int
+        Minimum size (in bytes) of a file for it to be downloaded in segments.
     **kwargs
         All keyword arguments given when creating an instance of this class
-        will be passed to :func:`requests.get`.
+        will be passed to :meth:`requests.Session.get`.
+
+    Notes
+    -----
+
+    Each instance owns a :class:`requests.Session` that pools connections
+    between calls. The session is created on the first download and can be
+    shared safely by several threads. :class:`pooch.Pooch` keeps the default
+    downloader for each protocol, so files fetched without a custom downloader
+    reuse the same connections.
 
     Examples
     --------
@@ -133,18 +183,71 @@ class HTTPDownloader:  # pylint: disable=too-few-public-methods
 
     """
 
-    def __init__(self, progressbar=False, chunk_size=1024, **kwargs):
+    def __init__(
+        self,
+        progressbar=False,
+        chunk_size=1024,
+        pool_size=10,
+        keep_alive=True,
+        resume=True,
+        segments=1,
+        segment_threshold=100 * 1024**2,
+        **kwargs
+    ):
         self.kwargs = kwargs
         self.progressbar = progressbar
         self.chunk_size = chunk_size
-        if self.progressbar and tqdm is None:
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.resume = resume
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+        if self.progressbar and _tqdm() is None:
             raise ValueError("Missing package 'tqdm' required for progress bars.")
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sessions and locks can't be shared with other processes
+        state = self.__dict__.copy()
+        state["_session"] = None
+        del state["_session_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._session_lock = threading.Lock()
+
+    @property
+    def resumable(self):
+        "True if interrupted downloads can be resumed (see *resume*)"
+        return self.resume
+
+    @property
+    def session(self):
+        """
+        The :class:`requests.Session` used for all requests (created if needed)
+        """
+        with self._session_lock:
+            if self._session is None:
+                import requests
+
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=self.pool_size, pool_maxsize=self.pool_size
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                if not self.keep_alive:
+                    session.headers["Connection"] = "close"
+                self._session = session
+        return self._session
 
     def __call__(self, url, output_file, pooch):
         """
         Download the given URL over HTTP to the given output file.
 
-        Uses :func:`requests.get`.
+        Uses :meth:`requests.Session.get` with the pooled session.
 
         Parameters
         ----------
@@ -158,21 +261,54 @@ class HTTPDownloader:  # pylint: disable=too-few-public-methods
         """
         kwargs = self.kwargs.copy()
         kwargs.setdefault("stream", True)
+        resume_info = getattr(output_file, "resume_info", None)
+        offset = 0
+        if self.resume and resume_info and resume_info.get("url") == url:
+            offset = output_file.tell()
+        elif hasattr(output_file, "restart") and output_file.tell() > 0:
+            # The partial file was left by a download that can't be resumed
+            output_file.restart()
+        if self.segments > 1 and not offset and hasattr(output_file, "__fspath__"):
+            if hasattr(output_file, "restart"):
+                # Segments are written to the file by name so the writer can't
+                # have it open (or its hash would be of the data written to it)
+                output_file.restart()
+            if self._download_segments(url, output_file, kwargs):
+                if resume_info is not None:
+                    resume_info.clear()
+                return
         ispath = not hasattr(output_file, "write")
         if ispath:
             output_file = open(output_file, "w+b")
         try:
-            response = requests.get(url, **kwargs)
+            if offset:
+                headers = dict(kwargs.get("headers") or {})
+                headers["Range"] = "bytes={}-".format(offset)
+                headers["If-Range"] = resume_info["validator"]
+                kwargs["headers"] = headers
+            response = self.session.get(url, **kwargs)
+            if offset and response.status_code == 416:
+                # Nothing left to download. The hash check will tell if the
+                # partial file is really complete.
+                response.close()
+                return
             response.raise_for_status()
+            if offset and not _resumes_at(response, offset):
+                # The server sent the whole file instead of the missing part
+                output_file.restart()
+                offset = 0
+            if self.resume and hasattr(output_file, "save_resume_info"):
+                output_file.save_resume_info(_resume_info(url, response))
             content = response.iter_content(chunk_size=self.chunk_size)
             if self.progressbar:
-                total = int(response.headers.get("content-length", 0))
+                total = int(response.headers.get("content-length", 0)) + offset
                 # Need to use ascii characters on Windows because there isn't
                 # always full unicode support
                 # (see https://github.com/tqdm/tqdm/issues/454)
                 use_ascii = bool(sys.platform == "win32")
-                progress = tqdm(
+                progress = _tqdm()(
                     total=total,
+                    initial=offset,
                     ncols=79,
                     ascii=use_ascii,
                     unit="B",
@@ -200,6 +336,261 @@ class HTTPDownloader:  # pylint: disable=too-few-public-methods
             if ispath:
                 output_file.close()
 
+    def _download_segments(self, url, output_file, kwargs):
+        """
+        Download the file in segments over parallel connections.
+
+        Returns False without downloading anything if the file is too small or
+        the server doesn't support range requests.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        import requests
+
+        kwargs = {key: value for key, value in kwargs.items() if key != "stream"}
+        probe = self.session.head(url, allow_redirects=True, **kwargs)
+        if probe.status_code != 200:
+            return False
+        headers = probe.headers
+        size = int(headers.get("content-length", 0))
+        if (
+            size < max(self.segment_threshold, self.segments)
+            or headers.get("accept-ranges", "none").lower() != "bytes"
+            or headers.get("content-encoding", "identity").lower() != "identity"
+        ):
+            return False
+        # Use the final URL in case of redirects and make sure all segments
+        # come from the same version of the file
+        url = probe.url
+        validator = headers.get("etag")
+        if validator is None or validator.startswith("W/"):
+            validator = headers.get("last-modified")
+        fname = os.fspath(output_file)
+        with open(fname, "wb") as fout:
+            fout.truncate(size)
+        step = -(-size // self.segments)
+        bounds = [(start, min(start + step, size)) for start in range(0, size, step)]
+        progress = None
+        if self.progressbar:
+            use_ascii = bool(sys.platform == "win32")
+            progress = _tqdm()(
+                total=size,
+                ncols=79,
+                ascii=use_ascii,
+                unit="B",
+                unit_scale=True,
+                leave=True,
+            )
+        lock = threading.Lock()
+
+        def download_segment(start, end):
+            "Download a range of bytes into its place in the file"
+            headers = dict(kwargs.get("headers") or {})
+            headers["Range"] = "bytes={}-{}".format(start, end - 1)
+            if validator is not None:
+                headers["If-Range"] = validator
+            segment_kwargs = dict(kwargs, headers=headers, stream=True)
+            with self.session.get(url, **segment_kwargs) as response:
+                response.raise_for_status()
+                if not _resumes_at(response, start):
+                    raise requests.exceptions.ContentDecodingError(
+                        "Server didn't send the requested range of '{}'.".format(url)
+                    )
+                with open(fname, "r+b") as fout:
+                    fout.seek(start)
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        fout.write(chunk)
+                        if progress is not None:
+                            with lock:
+                                progress.update(len(chunk))
+                    if fout.tell() != end:
+                        raise requests.exceptions.ChunkedEncodingError(
+                            "Incomplete segment of '{}'.".format(url)
+                        )
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.segments) as executor:
+                futures = [
+                    executor.submit(download_segment, start, end)
+                    for start, end in bounds
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            if progress is not None:
+                progress.close()
+        return True
+
+
+def _resumes_at(response, offset):
+    """
+    Check if the response is the part of the file starting at the offset.
+    """
+    if response.status_code != 206:
+        return False
+    content_range = response.headers.get("content-range", "")
+    try:
+        start = int(content_range.split()[1].split("-")[0])
+    except (IndexError, ValueError):
+        return False
+    return start == offset
+
+
+def _resume_info(url, response):
+    """
+    Information needed to resume the download of the response later.
+
+    Empty if the server doesn't support range requests, doesn't provide a
+    validator (strong ETag or Last-Modified) to make sure the file hasn't
+    changed, or compresses the data (ranges would refer to compressed bytes).
+    """
+    headers = response.headers
+    if headers.get("accept-ranges", "none").lower() != "bytes" and (
+        response.status_code != 206
+    ):
+        return {}
+    if headers.get("content-encoding", "identity").lower() != "identity":
+        return {}
+    validator = headers.get("etag")
+    if validator is None or validator.startswith("W/"):
+        validator = headers.get("last-modified")
+    if validator is None:
+        return {}
+    return {"url": url, "validator": validator}
+
+
+class FTPConnectionPool:
+    """
+    Pool of logged in FTP connections that can be reused between downloads.
+
+    Connections are kept separately for each host, port, and user name. Before
+    an idle connection is reused, it's checked with a ``NOOP`` command and
+    discarded if the server doesn't answer. Connections that have been idle for
+    longer than *idle_timeout* are closed instead of reused. The pool can be
+    shared by several threads, each of which gets its own connection.
+
+    Parameters
+    ----------
+    max_idle : int
+        Maximum number of idle connections kept for each host, port, and user.
+        Extra connections are closed when they are returned to the pool.
+    idle_timeout : float
+        Time (in seconds) after which idle connections are closed. Most
+        servers close connections that are idle for a few minutes.
+    timeout : float or None
+        Timeout in seconds for ftp socket operations, use None to mean no
+        timeout.
+
+    """
+
+    def __init__(self, max_idle=4, idle_timeout=60, timeout=None):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, key):
+        """
+        Get a healthy idle connection for the key. None if there isn't one.
+        """
+        import ftplib
+
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                ftp, since = idle.pop()
+            if time.monotonic() - since > self.idle_timeout:
+                _close_ftp(ftp)
+                continue
+            try:
+                ftp.voidcmd("NOOP")
+            except ftplib.all_errors:
+                _close_ftp(ftp)
+                continue
+            return ftp
+
+    def _checkin(self, key, ftp):
+        "Return a connection to the pool or close it if the pool is full"
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((ftp, time.monotonic()))
+                return
+        _close_ftp(ftp)
+
+    @contextmanager
+    def connection(self, host, port=21, username="anonymous", password="", account=""):
+        """
+        Context manager that provides a logged in connection from the pool.
+
+        The connection is returned to the pool at the end. If an exception is
+        raised inside the context, the connection is closed instead since its
+        state is unknown.
+
+        Parameters
+        ----------
+        host : str
+            The host name of the FTP server.
+        port : int
+            Port used for the FTP connection.
+        username : str
+            User name used to login to the server.
+        password : str
+            Password used to login to the server.
+        account : str
+            Some servers also require an "account" name for authentication.
+
+        Yields
+        ------
+        ftp : :class:`ftplib.FTP`
+            The connection. Its ``reused`` attribute is True if it came from
+            the pool.
+
+        """
+        import ftplib
+
+        key = (host, port, username)
+        ftp = self._checkout(key)
+        if ftp is None:
+            ftp = ftplib.FTP(timeout=self.timeout)
+            ftp.connect(host=host, port=port)
+            try:
+                ftp.login(user=username, passwd=password, acct=account)
+            except BaseException:
+                _close_ftp(ftp)
+                raise
+            ftp.reused = False
+        else:
+            ftp.reused = True
+        try:
+            yield ftp
+        except BaseException:
+            _close_ftp(ftp)
+            raise
+        self._checkin(key, ftp)
+
+    def close(self):
+        "Close all idle connections"
+        with self._lock:
+            idle = [
+                ftp for connections in self._idle.values() for ftp, _ in connections
+            ]
+            self._idle = {}
+        for ftp in idle:
+            _close_ftp(ftp)
+
+
+def _close_ftp(ftp):
+    "Close an FTP connection politely if possible"
+    import ftplib
+
+    try:
+        ftp.quit()
+    except ftplib.all_errors:
+        ftp.close()
+
 
 class FTPDownloader:  # pylint: disable=too-few-public-methods
     """
@@ -234,6 +625,11 @@ class FTPDownloader:  # pylint: disable=too-few-public-methods
     chunk_size : int
         Files are streamed *chunk_size* bytes at a time instead of loading
         everything into memory at one. Usually doesn't need to be changed.
+    pool : :class:`pooch.downloaders.FTPConnectionPool` or None
+        The pool of connections used for downloads. Connections are logged in
+        once and reused for later downloads from the same server. If None, a
+        new pool is created for this downloader. Pass the same pool to several
+        downloaders to share the connections between them.
 
     """
 
@@ -246,6 +642,7 @@ class FTPDownloader:  # pylint: disable=too-few-public-methods
         timeout=None,
         progressbar=False,
         chunk_size=1024,
+        pool=None,
     ):
 
         self.port = port
@@ -255,13 +652,51 @@ class FTPDownloader:  # pylint: disable=too-few-public-methods
         self.timeout = timeout
         self.progressbar = progressbar
         self.chunk_size = chunk_size
-        if self.progressbar and tqdm is None:
+        if self.progressbar and _tqdm() is None:
             raise ValueError("Missing package 'tqdm' required for progress bars.")
+        if pool is None:
+            pool = FTPConnectionPool(timeout=timeout)
+        self.pool = pool
+
+    def __getstate__(self):
+        # Connections can't be shared with other processes
+        state = self.__dict__.copy()
+        state["pool"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pool = FTPConnectionPool(timeout=self.timeout)
+
+    def connection(self, host):
+        """
+        Context manager that provides a logged in connection from the pool.
+
+        Uses the port and login information of this downloader. See
+        :meth:`pooch.downloaders.FTPConnectionPool.connection`.
+
+        Parameters
+        ----------
+        host : str
+            The host name of the FTP server.
+
+        """
+        return self.pool.connection(
+            host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            account=self.account,
+        )
 
     def __call__(self, url, output_file, pooch):
         """
         Download the given URL over FTP to the given output file.
 
+        If a connection from the pool fails before any data is received (for
+        example, if the server closed it in the meantime), the download is
+        retried once with a new connection.
+
         Parameters
         ----------
         url : str
@@ -271,38 +706,147 @@ class FTPDownloader:  # pylint: disable=too-few-public-methods
         pooch : :class:`~pooch.Pooch`
             The instance of :class:`~pooch.Pooch` that is calling this method.
         """
+        import ftplib
 
         parsed_url = parse_url(url)
-        ftp = ftplib.FTP(timeout=self.timeout)
-        ftp.connect(host=parsed_url["netloc"], port=self.port)
         ispath = not hasattr(output_file, "write")
         if ispath:
             output_file = open(output_file, "w+b")
         try:
-            ftp.login(user=self.username, passwd=self.password, acct=self.account)
-            command = "RETR {}".format(parsed_url["path"])
-            if self.progressbar:
-                size = int(ftp.size(parsed_url["path"]))
-                use_ascii = bool(sys.platform == "win32")
-                progress = tqdm(
-                    total=size,
-                    ncols=79,
-                    ascii=use_ascii,
-                    unit="B",
-                    unit_scale=True,
-                    leave=True,
-                )
-                with progress:
-
-                    def callback(data):
-                        "Update the progress bar and write to output"
-                        progress.update(len(data))
-                        output_file.write(data)
-
-                    ftp.retrbinary(command, callback, blocksize=self.chunk_size)
-            else:
-                ftp.retrbinary(command, output_file.write, blocksize=self.chunk_size)
+            while True:
+                received = []
+                ftp = None
+                try:
+                    with self.connection(parsed_url["netloc"]) as ftp:
+                        self._retrieve(ftp, parsed_url["path"], output_file, received)
+                    break
+                except ftplib.all_errors:
+                    if received or ftp is None or not ftp.reused:
+                        raise
         finally:
-            ftp.quit()
             if ispath:
                 output_file.close()
+
+    def _retrieve(self, ftp, path, output_file, received):
+        """
+        Download the file over the connection and write it to the output.
+
+        The amount of data received is appended to *received*.
+        """
+
+        def write(data):
+            "Keep track of the data received and write to output"
+            received.append(len(data))
+            output_file.write(data)
+
+        command = "RETR {}".format(path)
+        if self.progressbar:
+            size = int(ftp.size(path))
+            use_ascii = bool(sys.platform == "win32")
+            progress = _tqdm()(
+                total=size,
+                ncols=79,
+                ascii=use_ascii,
+                unit="B",
+                unit_scale=True,
+                leave=True,
+            )
+            with progress:
+
+                def callback(data):
+                    "Update the progress bar and write to output"
+                    progress.update(len(data))
+                    write(data)
+
+                ftp.retrbinary(command, callback, blocksize=self.chunk_size)
+        else:
+            ftp.retrbinary(command, write, blocksize=self.chunk_size)
+
+
+class FileDownloader:  # pylint: disable=too-few-public-methods
+    """
+    Download manager for copying files from a local or mounted file system.
+
+    Used for ``file://`` URLs and for URLs without a protocol (plain paths),
+    for example, a mirror of the data on a network file system (like NFS or
+    Lustre) mounted on the local machine.
+
+    The file is copied by the kernel without passing the data through Python:
+    with a copy-on-write clone if the file system supports it (like Btrfs and
+    XFS) or with :func:`os.copy_file_range` or :func:`os.sendfile`. When used
+    with :meth:`pooch.Pooch.fetch`, the hash of the file is calculated in the
+    same pass (see :meth:`pooch.utils.HashedWriter.copy_from`).
+
+    Examples
+    --------
+
+    >>> import os
+    >>> import tempfile
+    >>> from pooch.utils import HashedWriter
+    >>> with tempfile.TemporaryDirectory() as path:
+    ...     source = os.path.join(path, "source.txt")
+    ...     with open(source, "w") as fout:
+    ...         __ = fout.write("content of the file")
+    ...     output = HashedWriter(os.path.join(path, "output.txt"))
+    ...     downloader = FileDownloader()
+    ...     # Not using with Pooch.fetch so there is no instance of Pooch
+    ...     downloader("file://" + source, output, pooch=None)
+    ...     output.close()
+    ...     print(output.hexdigest())
+    0fc74468e6a9a829f103d069aeb2bb4f8646bad58bf146bb0e3379b759ec4a00
+
+    """
+
+    @staticmethod
+    def local_path(url):
+        """
+        The path to the file in the local file system given by a URL.
+
+        Parameters
+        ----------
+        url : str
+            A ``file://`` URL or a path.
+
+        Returns
+        -------
+        path : str
+            The path to the file.
+
+        """
+        if not url.startswith("file:"):
+            return url
+        from urllib.request import url2pathname
+
+        parsed_url = parse_url(url)
+        if parsed_url["netloc"] not in ("", "localhost"):
+            raise ValueError(
+                "Can't copy files from remote host '{}' in '{}'.".format(
+                    parsed_url["netloc"], url
+                )
+            )
+        return url2pathname(parsed_url["path"])
+
+    def __call__(self, url, output_file, pooch):
+        """
+        Copy the file given by the URL to the given output file.
+
+        Parameters
+        ----------
+        url : str
+            The ``file://`` URL or path of the file you want to copy.
+        output_file : str or file-like object
+            Path (and file name) to which the file will be copied.
+        pooch : :class:`~pooch.Pooch`
+            The instance of :class:`~pooch.Pooch` that is calling this method.
+        """
+        import shutil
+
+        source = self.local_path(url)
+        if hasattr(output_file, "copy_from"):
+            output_file.copy_from(source)
+        elif hasattr(output_file, "write"):
+            with open(source, "rb") as fin:
+                shutil.copyfileobj(fin, output_file)
+        else:
+            # Uses the same system calls on platforms that have them
+            shutil.copyfile(source, str(output_file))
@@ -0,0 +1,312 @@
+"""
+Persistent record of the files in the local storage that have been verified.
+"""
+import os
+import json
+import threading
+
+from .utils import (
+    get_logger,
+    hash_algorithm,
+    hash_digest,
+    temporary_file,
+    METADATA_DIR,
+)
+
+
+class HashIndex:
+    """
+    On-disk index of files whose hashes have been verified.
+
+    Stores the hash of each verified file along with a signature of the file
+    (size, modification time in nanoseconds, and inode number). As long as the
+    signature doesn't change, the file doesn't need to be hashed again to
+    check it against the registry. The index is saved inside the local
+    storage folder so that it survives between sessions and is shared with
+    other processes.
+
+    Changes are appended to a journal file (``index.journal``) so that
+    recording a file takes the same time no matter how many files are in the
+    index. Once the journal has more lines than the index file has entries,
+    it's compacted into the JSON index file (``index.json``), which is replaced
+    atomically. Entries are only trusted if the signature matches exactly.
+    Failures to write are logged but never raised, since the index is only
+    used to avoid extra work (changes that couldn't be written are kept in
+    memory).
+
+    Parameters
+    ----------
+    path : str or PathLike
+        The local storage folder. File names are stored relative to it and the
+        index file is placed in its ``.pooch`` subfolder.
+
+    Examples
+    --------
+
+    >>> import tempfile
+    >>> from pooch.utils import file_hash
+    >>> with tempfile.TemporaryDirectory() as path:
+    ...     fname = os.path.join(path, "data.txt")
+    ...     with open(fname, "w") as fout:
+    ...         __ = fout.write("some data")
+    ...     known_hash = "md5:{}".format(file_hash(fname, alg="md5"))
+    ...     index = HashIndex(path)
+    ...     print(index.lookup(fname, known_hash))
+    ...     index.record(fname, known_hash)
+    ...     # A new index for the same folder will read the record from disk
+    ...     print(HashIndex(path).lookup(fname, known_hash))
+    ...     print(HashIndex(path).lookup(fname, "md5:some-other-hash"))
+    None
+    True
+    False
+
+    """
+
+    version = 2
+    # The journal is only compacted if it has more lines than this
+    min_journal_size = 1000
+
+    def __init__(self, path):
+        self.root = os.path.abspath(str(path))
+        self.fname = os.path.join(self.root, METADATA_DIR, "index.json")
+        self.journal = os.path.join(self.root, METADATA_DIR, "index.journal")
+        self._entries = {}
+        # Changes made by this instance that couldn't be written to disk
+        self._unsaved = {}
+        self._loaded_signature = None
+        self._token = None
+        self._journal_ino = None
+        self._journal_offset = 0
+        self._journal_lines = 0
+        # Number of entries in the index file
+        self._compacted = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The lock can't be pickled (used by pooch.snapshot)
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _key(self, path):
+        "Name of the file relative to the storage folder (Unix separators)"
+        path = str(path)
+        prefix = os.path.join(self.root, "")
+        # Much faster than relpath for the usual case of a normalized path
+        if path.startswith(prefix) and os.pardir not in path:
+            key = path[len(prefix) :]
+        else:
+            key = os.path.relpath(path, self.root)
+        return key.replace(os.sep, "/")
+
+    def _reload(self):
+        """
+        Read the changes made to the index files since the last read.
+
+        The entries are read again from scratch if the index file was replaced
+        (by a compaction) and only the new lines of the journal are read
+        otherwise. Changes that couldn't be written are kept on top.
+        """
+        try:
+            stat = os.stat(self.fname)
+            signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        except OSError:
+            signature = None
+        if signature != self._loaded_signature:
+            self._entries = {}
+            self._token = None
+            self._journal_ino = None
+            try:
+                if signature is not None:
+                    with open(self.fname) as fin:
+                        content = json.load(fin)
+                    if content.get("version") == self.version:
+                        self._entries = dict(content["files"])
+                        self._token = content["journal"]
+                        self._compacted = len(self._entries)
+            except (OSError, ValueError, KeyError, AttributeError, TypeError):
+                get_logger().debug("Ignoring unreadable hash index '%s'.", self.fname)
+            self._loaded_signature = signature
+            for key, entry in self._unsaved.items():
+                if entry is None:
+                    self._entries.pop(key, None)
+                else:
+                    self._entries[key] = entry
+        self._read_journal()
+
+    def _read_journal(self):
+        "Apply the lines appended to the journal since it was last read"
+        if self._token is None:
+            return
+        try:
+            with open(self.journal, "rb") as fin:
+                ino = os.fstat(fin.fileno()).st_ino
+                if ino != self._journal_ino:
+                    # A new journal (only valid if it goes with the index file)
+                    self._journal_ino = ino
+                    self._journal_lines = 0
+                    header = fin.readline()
+                    self._journal_offset = len(header)
+                    if json.loads(header.decode()) != self._token:
+                        self._journal_offset = None
+                if self._journal_offset is None:
+                    return
+                fin.seek(self._journal_offset)
+                for line in fin:
+                    if not line.endswith(b"\n"):
+                        # Still being written by another process
+                        break
+                    key, entry = json.loads(line.decode())
+                    self._journal_offset += len(line)
+                    self._journal_lines += 1
+                    if key in self._unsaved:
+                        continue
+                    if entry is None:
+                        self._entries.pop(key, None)
+                    else:
+                        self._entries[key] = entry
+        except (OSError, ValueError, TypeError):
+            get_logger().debug("Ignoring unreadable journal '%s'.", self.journal)
+
+    def _write(self, key, entry):
+        """
+        Append a change to the journal (or compact it if it's time to).
+
+        *entry* is None for files that were removed from the index.
+        """
+        self._unsaved[key] = entry
+        try:
+            if self._journal_offset is None or self._journal_ino is None:
+                # There's no journal for the current index file
+                self._compact()
+                return
+            with open(self.journal, "a") as fout:
+                fout.write(json.dumps([key, entry]) + "\n")
+            del self._unsaved[key]
+            if self._journal_lines > max(self.min_journal_size, self._compacted):
+                self._compact()
+        except OSError as error:
+            get_logger().debug(
+                "Could not write hash index '%s': %s", self.fname, str(error)
+            )
+
+    def _compact(self):
+        "Write all entries to a new index file and start an empty journal"
+        token = os.urandom(8).hex()
+        content = {"version": self.version, "journal": token, "files": self._entries}
+        directory = os.path.dirname(self.fname)
+        os.makedirs(directory, exist_ok=True)
+        with temporary_file(path=directory) as index_tmp:
+            with temporary_file(path=directory) as journal_tmp:
+                with open(journal_tmp, "w") as fout:
+                    fout.write(json.dumps(token) + "\n")
+                with open(index_tmp, "w") as fout:
+                    json.dump(content, fout)
+                # Readers ignore the old journal once the index is replaced
+                os.replace(index_tmp, self.fname)
+                os.replace(journal_tmp, self.journal)
+        stat = os.stat(self.fname)
+        self._loaded_signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        self._token = token
+        self._journal_ino = os.stat(self.journal).st_ino
+        self._journal_offset = len(json.dumps(token)) + 1
+        self._journal_lines = 0
+        self._compacted = len(self._entries)
+        self._unsaved = {}
+
+    @staticmethod
+    def _signature(path):
+        "The size, modification time, and inode of the file"
+        stat = os.stat(str(path))
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    def lookup(self, path, known_hash, size_only=False):
+        """
+        Check a file against a known hash using the index.
+
+        Parameters
+        ----------
+        path : str or PathLike
+            The path to the file. Must be inside the local storage folder.
+        known_hash : str
+            The known hash. Optionally, prepend ``alg:`` to the hash to specify
+            the hashing algorithm. Default is SHA256.
+        size_only : bool
+            If True, only the size of the file is compared with the signature
+            in the index (changes to the modification time or inode are
+            ignored).
+
+        Returns
+        -------
+        matches : bool or None
+            True or False if the file is in the index and its signature hasn't
+            changed since it was recorded. None if the file must be hashed to
+            know if it matches.
+
+        """
+        key = self._key(path)
+        try:
+            signature = self._signature(path)
+        except OSError:
+            return None
+        if size_only:
+            signature = signature[:1]
+        algorithm = hash_algorithm(known_hash)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[: len(signature)] != signature:
+                self._reload()
+                entry = self._entries.get(key)
+        if (
+            entry is None
+            or entry[: len(signature)] != signature
+            or entry[3] != algorithm
+        ):
+            return None
+        return entry[4] == hash_digest(known_hash)
+
+    def record(self, path, known_hash):
+        """
+        Add a file that has just been verified to the index.
+
+        Parameters
+        ----------
+        path : str or PathLike
+            The path to the file. Must be inside the local storage folder.
+        known_hash : str
+            The hash of the file. Optionally, prepend ``alg:`` to the hash to
+            specify the hashing algorithm. Default is SHA256.
+
+        """
+        key = self._key(path)
+        try:
+            signature = self._signature(path)
+        except OSError:
+            return
+        entry = signature + [hash_algorithm(known_hash), hash_digest(known_hash)]
+        with self._lock:
+            self._reload()
+            if self._entries.get(key) == entry:
+                return
+            self._entries[key] = entry
+            self._write(key, entry)
+
+    def forget(self, path):
+        """
+        Remove a file from the index.
+
+        Parameters
+        ----------
+        path : str or PathLike
+            The path to the file. Must be inside the local storage folder.
+
+        """
+        key = self._key(path)
+        with self._lock:
+            self._reload()
+            if self._entries.pop(key, None) is not None:
+                self._write(key, None)
@@ -0,0 +1,354 @@
+"""
+Locks to coordinate downloads between processes and threads.
+"""
+import os
+import json
+import time
+import socket
+import threading
+
+from .utils import get_logger, running_loop
+
+
+class FileLock:
+    """
+    Inter-process lock based on the exclusive creation of a lock file.
+
+    Only one :class:`FileLock` (in any process) can hold the lock for a given
+    lock file at a time. The others wait until it's released. Works across
+    processes on the same machine and on shared file systems.
+
+    The lock file records the process ID, host name, and a unique token of the
+    owner. While the lock is held, a background thread updates the
+    modification time of the file every few seconds. A lock is considered
+    stale and is broken if its owner was a process on this machine that is no
+    longer running or if the file hasn't been updated in *stale_after*
+    seconds (for example, if the owner was on another machine that crashed).
+
+    Parameters
+    ----------
+    fname : str or PathLike
+        The path of the lock file. Its parent directory will be created if it
+        doesn't exist.
+    timeout : float or None
+        Maximum time (in seconds) to wait for the lock before raising a
+        :class:`TimeoutError`. If None, will wait as long as the lock is held
+        by a live process.
+    stale_after : float
+        Time (in seconds) since the last update of the lock file after which
+        the lock is considered stale.
+    poll_interval : float
+        Time (in seconds) between attempts to acquire the lock.
+
+    Examples
+    --------
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as path:
+    ...     fname = os.path.join(path, "data.txt.lock")
+    ...     with FileLock(fname) as lock:
+    ...         print(lock.is_locked, os.path.exists(fname))
+    ...         # Other locks on the same file have to wait
+    ...         try:
+    ...             FileLock(fname, timeout=0).acquire()
+    ...         except TimeoutError:
+    ...             print("Timed out")
+    ...     print(lock.is_locked, os.path.exists(fname))
+    True True
+    Timed out
+    False False
+
+    """
+
+    def __init__(self, fname, timeout=None, stale_after=120, poll_interval=0.1):
+        self.fname = str(fname)
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self._token = None
+        self._heartbeat = None
+        self.waited = False
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    @property
+    def is_locked(self):
+        "True if this object currently holds the lock"
+        return self._token is not None
+
+    def acquire(self):
+        """
+        Wait until the lock is acquired.
+
+        After the lock is acquired, the attribute ``waited`` is True if the
+        lock was held by someone else when we first tried to acquire it.
+
+        Raises
+        ------
+        TimeoutError
+            If the lock couldn't be acquired in *timeout* seconds.
+
+        """
+        if self.is_locked:
+            raise RuntimeError("Lock '{}' is already held.".format(self.fname))
+        os.makedirs(os.path.dirname(os.path.abspath(self.fname)), exist_ok=True)
+        token = os.urandom(16).hex()
+        content = json.dumps(
+            {"pid": os.getpid(), "host": socket.gethostname(), "token": token}
+        )
+        self.waited = False
+        start = time.monotonic()
+        while True:
+            try:
+                fd = os.open(self.fname, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                self.waited = True
+                self._break_if_stale()
+            else:
+                with os.fdopen(fd, "w") as fout:
+                    fout.write(content)
+                break
+            if self.timeout is not None and time.monotonic() - start >= self.timeout:
+                raise TimeoutError(
+                    "Timed out waiting for lock '{}'.".format(self.fname)
+                )
+            time.sleep(self.poll_interval)
+        self._token = token
+        self._heartbeat = _Heartbeat(self.fname, interval=self.stale_after / 4)
+        self._heartbeat.start()
+
+    def release(self):
+        """
+        Release the lock (if it's held by this object).
+        """
+        if not self.is_locked:
+            return
+        self._heartbeat.stop()
+        self._heartbeat = None
+        if _read_owner(self.fname).get("token") == self._token:
+            try:
+                os.remove(self.fname)
+            except FileNotFoundError:
+                pass
+        self._token = None
+
+    def _is_stale(self, owner):
+        "Check if the owner of the lock is dead or hasn't updated the lock"
+        if (
+            owner
+            and owner.get("host") == socket.gethostname()
+            and not _pid_exists(owner.get("pid"))
+        ):
+            return True
+        try:
+            age = time.time() - os.stat(self.fname).st_mtime
+        except FileNotFoundError:
+            return False
+        return age > self.stale_after
+
+    def _break_if_stale(self):
+        """
+        Remove the lock file if it's stale.
+
+        Processes take turns to break a lock by exclusively creating a
+        ``<fname>.break`` file. The owner is read again while holding it, so
+        that a lock taken by a new owner after another process broke the
+        stale one is never removed. Break files left by processes that
+        crashed while breaking a lock are removed after *stale_after*
+        seconds.
+        """
+        # Most waits are for live owners so check before taking turns
+        if not self._is_stale(_read_owner(self.fname)):
+            return
+        breaking = self.fname + ".break"
+        try:
+            fd = os.open(breaking, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(breaking).st_mtime > self.stale_after:
+                    os.remove(breaking)
+            except OSError:
+                pass
+            return
+        os.close(fd)
+        try:
+            # The owner can be empty if the lock was just created or if the
+            # owner crashed before writing to it. Only the age of the file is
+            # used then.
+            owner = _read_owner(self.fname)
+            if self._is_stale(owner):
+                get_logger().info(
+                    "Breaking stale lock '%s' held by process %s on '%s'.",
+                    self.fname,
+                    owner.get("pid"),
+                    owner.get("host"),
+                )
+                try:
+                    os.remove(self.fname)
+                except FileNotFoundError:
+                    pass
+        finally:
+            os.remove(breaking)
+
+
+class _Heartbeat(threading.Thread):
+    """
+    Daemon thread that periodically updates the modification time of a file.
+    """
+
+    def __init__(self, fname, interval):
+        super().__init__(daemon=True)
+        self.fname = fname
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                os.utime(self.fname)
+            except OSError:
+                pass
+
+    def stop(self):
+        "Stop updating the file and wait for the thread to finish"
+        self._stopped.set()
+        self.join()
+
+
+def _read_owner(fname):
+    """
+    Read the owner information from a lock file. Empty if it can't be read.
+    """
+    try:
+        with open(fname) as fin:
+            owner = json.load(fin)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(owner, dict):
+        return {}
+    return owner
+
+
+def _pid_exists(pid):
+    """
+    Check if a process with the given ID is running on this machine.
+
+    Always True if we can't tell (for example, on Windows).
+    """
+    if not isinstance(pid, int) or os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SingleFlight:
+    """
+    Make concurrent calls with the same key share a single execution.
+
+    The first caller for a key runs the function. Callers that arrive with the
+    same key while it's running wait for it to finish and get the same result
+    (or have the same exception raised). Once the call finishes, the next call
+    with the key runs the function again.
+
+    Works with threads (:meth:`run`) and with coroutines running on the same
+    event loop (:meth:`arun`).
+
+    Examples
+    --------
+
+    >>> flights = SingleFlight()
+    >>> print(flights.run("key", sum, [1, 2, 3]))
+    6
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._futures = {}
+
+    def run(self, key, function, *args, **kwargs):
+        """
+        Call the function or wait for a running call with the same key.
+
+        Parameters
+        ----------
+        key : hashable
+            Calls with the same key are shared.
+        function : callable
+            The function to call. Any other arguments are passed to it.
+
+        Returns
+        -------
+        result
+            The return value of the function.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def arun(self, key, function, *args, **kwargs):
+        """
+        Await the coroutine function or a running call with the same key.
+
+        Parameters
+        ----------
+        key : hashable
+            Calls with the same key on the same event loop are shared.
+        function : coroutine function
+            The function to call. Any other arguments are passed to it.
+
+        Returns
+        -------
+        result
+            The return value of the coroutine.
+
+        """
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        key = (id(running_loop()), key)
+        future = self._futures.get(key)
+        if future is None:
+            future = asyncio.ensure_future(function(*args, **kwargs))
+            self._futures[key] = future
+            future.add_done_callback(lambda future: self._futures.pop(key, None))
+        return await asyncio.shield(future)
+
+
+class _Call:  # pylint: disable=too-few-public-methods
+    """
+    A call in progress in :class:`SingleFlight`.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
@@ -3,12 +3,8 @@
 Post-processing hooks for Pooch.fetch
 """
 import os
-import bz2
-import gzip
-import lzma
 import shutil
-from zipfile import ZipFile
-from tarfile import TarFile
+import importlib
 
 from .utils import get_logger
 
@@ -114,6 +110,8 @@ class Unzip(ExtractorProcessor):  # pylint: disable=too-few-public-methods
         This method receives an argument for the archive to extract and the
         destination path.
         """
+        from zipfile import ZipFile  # pylint: disable=import-outside-toplevel
+
         with ZipFile(fname, "r") as zip_file:
             if self.members is None:
                 get_logger().info(
@@ -159,6 +157,8 @@ class Untar(ExtractorProcessor):  # pylint: disable=too-few-public-methods
         This method receives an argument for the archive to extract and the
         destination path.
         """
+        from tarfile import TarFile  # pylint: disable=import-outside-toplevel
+
         with TarFile.open(fname, "r") as tar_file:
             if self.members is None:
                 get_logger().info(
@@ -207,7 +207,8 @@ class Decompress:  # pylint: disable=too-few-public-methods
 
     """
 
-    modules = {"lzma": lzma, "xz": lzma, "gzip": gzip, "bzip2": bz2}
+    # Modules are imported only when they're used
+    modules = {"lzma": "lzma", "xz": "lzma", "gzip": "gzip", "bzip2": "bz2"}
 
     def __init__(self, method="auto"):
         self.method = method
@@ -276,4 +277,4 @@ class Decompress:  # pylint: disable=too-few-public-methods
                     method, list(self.modules.keys())
                 )
             )
-        return self.modules[method]
+        return importlib.import_module(self.modules[method])
@@ -0,0 +1,661 @@
+"""
+Reading registry files and storage backends for the registry.
+"""
+import io
+import os
+import locale
+import threading
+import contextlib
+import importlib
+from array import array
+from itertools import accumulate
+from collections.abc import MutableMapping
+
+from .utils import KnownHash
+
+
+# Magic numbers at the start of compressed files and the modules used to read
+# them (imported only when needed)
+COMPRESSION = {
+    b"\x1f\x8b": "gzip",
+    b"\xfd7zXZ\x00": "lzma",
+    b"BZh": "bz2",
+}
+
+
+@contextlib.contextmanager
+def _open_binary(fname):
+    """
+    Open a registry file for reading bytes, decompressing it if needed.
+
+    Yields the file object and the encoding of the text. File objects opened
+    in text mode are yielded as they are with None as the encoding.
+    """
+    with contextlib.ExitStack() as stack:
+        if hasattr(fname, "read"):
+            # It's a file object
+            fin = fname
+            encoding = "utf-8"
+        else:
+            # It's a file path. Use the same encoding as opening it in text
+            # mode would.
+            fin = stack.enter_context(open(fname, "rb"))
+            encoding = locale.getpreferredencoding(False)
+        if isinstance(fin, io.TextIOBase):
+            yield fin, None
+            return
+        if not hasattr(fin, "peek"):
+            fin = stack.enter_context(io.BufferedReader(_Unclosable(fin)))
+        magic = fin.peek(6)
+        for start, module in COMPRESSION.items():
+            if magic.startswith(start):
+                module = importlib.import_module(module)
+                fin = stack.enter_context(module.open(fin, mode="rb"))
+                break
+        yield fin, encoding
+
+
+class _Unclosable(io.RawIOBase):
+    """
+    Wrapper that reads from a binary file object without closing it.
+    """
+
+    def __init__(self, fileobj):
+        super().__init__()
+        self.fileobj = fileobj
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.fileobj.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+@contextlib.contextmanager
+def open_registry(fname):
+    """
+    Open a registry file for reading text, decompressing it if needed.
+
+    Files compressed with gzip, LZMA (xz), or bzip2 are recognized by their
+    contents (not by their extension).
+
+    Parameters
+    ----------
+    fname : str | fileobj
+        Path (or open file object) to the registry file. Files opened in
+        binary mode are decoded as UTF-8.
+
+    Yields
+    ------
+    fin : file object
+        The registry opened in text mode.
+
+    """
+    with _open_binary(fname) as (fin, encoding):
+        if encoding is None:
+            yield fin
+            return
+        text = io.TextIOWrapper(fin, encoding=encoding)
+        try:
+            yield text
+        finally:
+            # Don't close the file object that was passed in
+            text.detach()
+
+
+def iter_registry(fname):
+    """
+    Read the entries of a registry file one at a time.
+
+    Each line of the file should have file name and its hash separated by
+    a space. Custom download URLs for individual files can be specified as a
+    third element on the line. Empty lines are skipped. Compressed files are
+    decompressed (see :func:`open_registry`).
+
+    Invalid lines are skipped and all of them are reported in the exception
+    raised after the last entry (so that they can be fixed at once).
+
+    Parameters
+    ----------
+    fname : str | fileobj
+        Path (or open file object) to the registry file.
+
+    Yields
+    ------
+    entry : tuple
+        The file name, its hash, and its custom URL (None if not given).
+
+    Raises
+    ------
+    OSError
+        If any line doesn't have 2 or 3 elements. The message lists all of
+        them.
+
+    """
+    errors = []
+    with open_registry(fname) as fin:
+        for linenum, line in enumerate(fin, start=1):
+            elements = line.split()
+            if len(elements) == 2:
+                yield elements[0], elements[1], None
+            elif len(elements) == 3:
+                yield elements[0], elements[1], elements[2]
+            elif elements:
+                errors.append((linenum, len(elements), line.strip()))
+    if errors:
+        shown = ", ".join(
+            "line {} has {} ('{}')".format(*error) for error in errors[:10]
+        )
+        if len(errors) > 10:
+            shown += ", and {} more".format(len(errors) - 10)
+        raise OSError(
+            "Invalid entries in Pooch registry file '{}': expected 2 or 3 "
+            "elements per line but {}.".format(fname, shown)
+        )
+
+
+def read_registry(fname):
+    """
+    Read all the entries of a registry file at once.
+
+    See :func:`iter_registry` for the format and errors.
+
+    Parameters
+    ----------
+    fname : str | fileobj
+        Path (or open file object) to the registry file.
+
+    Returns
+    -------
+    hashes : dict
+        The hashes of the files in the registry.
+    urls : dict
+        The custom URLs of the files that have them.
+
+    Raises
+    ------
+    OSError
+        If any line doesn't have 2 or 3 elements. The message lists all of
+        them.
+
+    """
+    hashes = {}
+    urls = {}
+    for name, known_hash, url in iter_registry(fname):
+        hashes[name] = known_hash
+        if url is not None:
+            urls[name] = url
+    return hashes, urls
+
+
+class SQLiteRegistry(MutableMapping):
+    """
+    Registry of file names and hashes stored in an SQLite database.
+
+    A drop-in replacement for the ``registry`` dictionary of
+    :class:`~pooch.Pooch` for registries with millions of files. Entries are
+    looked up in an indexed database file when they're needed instead of
+    being loaded into memory when the program starts. Custom download URLs
+    are stored in the same database and are available as a mapping through
+    the :attr:`urls` attribute (pass it as the ``urls`` argument of
+    :class:`~pooch.Pooch`).
+
+    Each thread (and process) uses its own connection to the database, so the
+    registry can be used by :meth:`pooch.Pooch.fetch_many`.
+
+    Parameters
+    ----------
+    fname : str or PathLike
+        The database file. Will be created if it doesn't exist.
+
+    Examples
+    --------
+
+    >>> import io
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as path:
+    ...     registry = SQLiteRegistry(os.path.join(path, "registry.db"))
+    ...     registry["data.txt"] = "md5:1a2b3c"
+    ...     registry.load(
+    ...         io.StringIO("other.txt 4d5e6f http://some.link.com/other.txt")
+    ...     )
+    ...     print(len(registry), registry["data.txt"], "other.txt" in registry)
+    ...     print(dict(registry.urls))
+    2 md5:1a2b3c True
+    {'other.txt': 'http://some.link.com/other.txt'}
+
+    """
+
+    def __init__(self, fname):
+        self.fname = str(fname)
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {"fname": self.fname}
+
+    def __setstate__(self, state):
+        self.__init__(state["fname"])
+
+    def __repr__(self):
+        return "SQLiteRegistry({!r})".format(self.fname)
+
+    @property
+    def connection(self):
+        "The connection to the database used by the current thread"
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            # Commit changes as soon as they are made unless a transaction is
+            # started explicitly
+            import sqlite3  # pylint: disable=import-outside-toplevel
+
+            connection = sqlite3.connect(self.fname, isolation_level=None)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS registry "
+                "(name TEXT PRIMARY KEY, hash TEXT, url TEXT) WITHOUT ROWID"
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @property
+    def urls(self):
+        "Mapping of file names to custom download URLs"
+        return SQLiteURLs(self)
+
+    def _get(self, column, name):
+        "Get the value of a column for a file (None if not set)"
+        row = self.connection.execute(
+            "SELECT {} FROM registry WHERE name = ?".format(column), (name,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def _set(self, column, name, value):
+        "Set the value of a column for a file, adding it if needed"
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO registry (name) VALUES (?)", (name,)
+            )
+            connection.execute(
+                "UPDATE registry SET {} = ? WHERE name = ?".format(column),
+                (value, name),
+            )
+
+    def _iter(self, column):
+        "Iterate over the names of the files that have the column set"
+        cursor = self.connection.execute(
+            "SELECT name FROM registry WHERE {} IS NOT NULL ORDER BY name".format(
+                column
+            )
+        )
+        for (name,) in cursor:
+            yield name
+
+    def _len(self, column):
+        "Count the files that have the column set"
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM registry WHERE {} IS NOT NULL".format(column)
+        ).fetchone()[0]
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager that groups changes to the registry in a transaction.
+
+        The changes are committed at the end or rolled back if there is an
+        exception. Much faster than committing each change on its own.
+
+        Yields
+        ------
+        connection : :class:`sqlite3.Connection`
+            The connection of the current thread.
+
+        """
+        connection = self.connection
+        if connection.in_transaction:
+            yield connection
+            return
+        connection.execute("BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def __getitem__(self, name):
+        value = self._get("hash", name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, known_hash):
+        self._set("hash", name, known_hash)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.connection.execute("DELETE FROM registry WHERE name = ?", (name,))
+
+    def __contains__(self, name):
+        return self._get("hash", name) is not None
+
+    def __iter__(self):
+        return self._iter("hash")
+
+    def __len__(self):
+        return self._len("hash")
+
+    def load(self, fname):
+        """
+        Add the entries of a registry file in a single transaction.
+
+        Uses the same format as :meth:`pooch.Pooch.load_registry`. Custom URLs
+        are added to :attr:`urls`.
+
+        Parameters
+        ----------
+        fname : str | fileobj
+            Path (or open file object) to the registry file.
+
+        """
+        with self.transaction() as connection:
+            for name, known_hash, url in iter_registry(fname):
+                connection.execute(
+                    "INSERT OR REPLACE INTO registry (name, hash, url) "
+                    "VALUES (?, ?, COALESCE(?, "
+                    "(SELECT url FROM registry WHERE name = ?)))",
+                    (name, known_hash, url, name),
+                )
+
+
+class SQLiteURLs(MutableMapping):
+    """
+    Mapping of file names to custom URLs stored in a :class:`SQLiteRegistry`.
+
+    Parameters
+    ----------
+    registry : :class:`SQLiteRegistry`
+        The registry where the URLs are stored.
+
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __getitem__(self, name):
+        value = self.registry._get("url", name)  # pylint: disable=protected-access
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, url):
+        self.registry._set("url", name, url)  # pylint: disable=protected-access
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.registry._set("url", name, None)  # pylint: disable=protected-access
+
+    def __iter__(self):
+        return self.registry._iter("url")  # pylint: disable=protected-access
+
+    def __len__(self):
+        return self.registry._len("url")  # pylint: disable=protected-access
+
+
+class CompactRegistry(MutableMapping):
+    """
+    Registry of file names and hashes that uses little memory.
+
+    A drop-in replacement for the ``registry`` dictionary of
+    :class:`~pooch.Pooch` that takes several times less memory than a
+    dictionary of strings. The file names are stored sorted and encoded in a
+    single block of bytes, the hexadecimal digests are stored as raw bytes in
+    another, and the algorithms are stored as small integer IDs into a table
+    of the few algorithms in use. Lookups are binary searches.
+
+    The values are returned as :class:`pooch.utils.KnownHash` strings that
+    are equal to the hashes that were stored but carry the algorithm and
+    digest already parsed, so checking files against them needs no parsing.
+
+    New entries are kept in a dictionary until there are enough of them to
+    be worth merging into the compact storage (or until :meth:`compact` is
+    called).
+
+    Parameters
+    ----------
+    entries : mapping or iterable or None
+        Initial entries of the registry (anything accepted by :class:`dict`).
+
+    Examples
+    --------
+
+    >>> registry = CompactRegistry({"data.txt": "md5:1a2b3c", "c.txt": "4d5e"})
+    >>> registry["other.txt"] = "sha1:7f8a"
+    >>> print(len(registry), sorted(registry))
+    3 ['c.txt', 'data.txt', 'other.txt']
+    >>> print(registry["data.txt"], registry["data.txt"].algorithm)
+    md5:1a2b3c md5
+    >>> print(registry["c.txt"], registry["c.txt"].algorithm)
+    4d5e sha256
+
+    """
+
+    def __init__(self, entries=None):
+        # Sorted file names in UTF-8 and the position where each one starts
+        self._names = b""
+        self._name_offsets = array("Q", [0])
+        # The hexadecimal digests as raw bytes (or the UTF-8 encoded hash if
+        # it's not in lower case hexadecimal)
+        self._digests = b""
+        self._digest_offsets = array("Q", [0])
+        # Index into the table of kinds of hashes for each file. The kinds are
+        # the "alg:" part of the hash (if any), the algorithm, and whether the
+        # digest is stored as raw bytes. The first kind is for hashes that are
+        # stored as they are.
+        self._kinds = array("B")
+        self._kind_table = [("", None, False)]
+        self._kind_ids = {}
+        # New entries and the stored entries that were deleted
+        self._pending = {}
+        self._removed = set()
+        if entries is not None:
+            self._pending = dict(entries)
+            for known_hash in self._pending.values():
+                _check_hash(known_hash)
+            self.compact()
+
+    def __repr__(self):
+        return "CompactRegistry({} entries)".format(len(self))
+
+    def __getstate__(self):
+        self.compact()
+        return self.__dict__.copy()
+
+    def _find(self, name):
+        "The position of an encoded name in the compact storage (or None)"
+        names = self._names
+        offsets = self._name_offsets
+        low, high = 0, len(offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            current = names[offsets[middle] : offsets[middle + 1]]
+            if current < name:
+                low = middle + 1
+            elif current > name:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _kind(self, prefix):
+        "The ID of the kind of hash with a given prefix (added if needed)"
+        kind = self._kind_ids.get(prefix)
+        if kind is None:
+            if len(self._kind_table) > 255:
+                return 0
+            algorithm = prefix.split(":")[0] if prefix else "sha256"
+            kind = len(self._kind_table)
+            self._kind_table.append((prefix, algorithm, True))
+            self._kind_ids[prefix] = kind
+        return kind
+
+    def _encode(self, known_hash):
+        "Split a hash into the ID of its kind and the digest as bytes"
+        prefix, colon, digest = known_hash.rpartition(":")
+        try:
+            raw = bytes.fromhex(digest)
+        except ValueError:
+            raw = None
+        # Only store digests as bytes if the hash can be recreated exactly
+        if raw is not None and raw.hex() == digest:
+            kind = self._kind(prefix + colon)
+            if kind != 0:
+                return kind, raw
+        return 0, known_hash.encode("utf-8")
+
+    def _decode(self, index):
+        "Make the hash of the file at a position in the compact storage"
+        prefix, algorithm, raw = self._kind_table[self._kinds[index]]
+        digest = self._digests[
+            self._digest_offsets[index] : self._digest_offsets[index + 1]
+        ]
+        if not raw:
+            return KnownHash(digest.decode("utf-8"))
+        digest = digest.hex()
+        return KnownHash(prefix + digest, algorithm, digest)
+
+    def compact(self):
+        """
+        Merge the new and deleted entries into the compact storage.
+        """
+        if not self._pending and not self._removed:
+            return
+        pending = {
+            name.encode("utf-8"): self._encode(value)
+            for name, value in self._pending.items()
+        }
+        removed = {name.encode("utf-8") for name in self._removed}
+        entries = []
+        names, name_offsets = self._names, self._name_offsets
+        digests, digest_offsets = self._digests, self._digest_offsets
+        for index, kind in enumerate(self._kinds):
+            name = names[name_offsets[index] : name_offsets[index + 1]]
+            if name in removed or name in pending:
+                continue
+            digest = digests[digest_offsets[index] : digest_offsets[index + 1]]
+            entries.append((name, kind, digest))
+        entries.extend((name, kind, digest) for name, (kind, digest) in pending.items())
+        entries.sort(key=lambda entry: entry[0])
+        self._names = b"".join(entry[0] for entry in entries)
+        self._digests = b"".join(entry[2] for entry in entries)
+        self._kinds = array("B", (entry[1] for entry in entries))
+        self._name_offsets = _offsets(
+            (entry[0] for entry in entries), total=len(self._names)
+        )
+        self._digest_offsets = _offsets(
+            (entry[2] for entry in entries), total=len(self._digests)
+        )
+        self._pending = {}
+        self._removed = set()
+
+    def __getitem__(self, name):
+        value = self._pending.get(name)
+        if value is not None:
+            return value
+        index = self._find(name.encode("utf-8"))
+        if index is None or name in self._removed:
+            raise KeyError(name)
+        return self._decode(index)
+
+    def __setitem__(self, name, known_hash):
+        _check_hash(known_hash)
+        self._pending[name] = known_hash
+        self._compact_if_needed()
+
+    def update(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        "Add many entries at once (faster than adding them one by one)"
+        entries = dict(*args, **kwargs)
+        for known_hash in entries.values():
+            _check_hash(known_hash)
+        self._pending.update(entries)
+        self._compact_if_needed()
+
+    def _compact_if_needed(self):
+        """
+        Merge the new entries once there are as many as stored ones.
+
+        This way, the total cost of building a large registry is linear.
+        """
+        if len(self._pending) > max(4096, len(self._kinds)):
+            self.compact()
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self._pending.pop(name, None)
+        if self._find(name.encode("utf-8")) is not None:
+            self._removed.add(name)
+
+    def __contains__(self, name):
+        if name in self._pending:
+            return True
+        if not isinstance(name, str) or name in self._removed:
+            return False
+        return self._find(name.encode("utf-8")) is not None
+
+    def __iter__(self):
+        self.compact()
+        names, offsets = self._names, self._name_offsets
+        for index in range(len(offsets) - 1):
+            yield names[offsets[index] : offsets[index + 1]].decode("utf-8")
+
+    def __len__(self):
+        self.compact()
+        return len(self._kinds)
+
+
+def _offsets(sequence, total):
+    """
+    The positions of each item of a sequence of bytes if joined together.
+
+    Uses 4 byte integers if the total size of the items allows it.
+    """
+    offsets = array("I" if total < 2**32 else "Q", [0])
+    offsets.extend(accumulate(map(len, sequence)))
+    return offsets
+
+
+def _check_hash(known_hash):
+    "Raise an exception if the hash isn't a string"
+    if not isinstance(known_hash, str):
+        raise TypeError(
+            "Registry values must be strings, not {}.".format(type(known_hash))
+        )
+
+
+def convert_registry(source, destination):
+    """
+    Convert a registry text file to an SQLite database.
+
+    Parameters
+    ----------
+    source : str | fileobj
+        Path (or open file object) to the registry text file (in the format
+        used by :meth:`pooch.Pooch.load_registry`).
+    destination : str or PathLike
+        The database file. Entries are added to it if it already exists.
+
+    Returns
+    -------
+    registry : :class:`SQLiteRegistry`
+        The registry backed by the new database.
+
+    """
+    registry = SQLiteRegistry(destination)
+    registry.load(source)
+    return registry
@@ -0,0 +1,226 @@
+"""
+HTTP server that mirrors a remote data source through a Pooch.
+
+Not imported with pooch since it's only needed to run a mirror (see ``pooch
+serve``).
+"""
+import os
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, unquote
+
+from .utils import get_logger, hash_digest
+
+
+class MirrorServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server that serves the files in the registry of a Pooch.
+
+    Each request is handled in a thread. Files that aren't in the local
+    storage yet are fetched from the *base_url* of the Pooch with
+    :meth:`pooch.Pooch.fetch` before they're served. Since requests for the
+    same file that arrive during the download wait for it (and other
+    processes using the same local storage wait on the download lock), each
+    file is only downloaded from the origin once. Files are verified against
+    the registry like any other fetch.
+
+    Only files in the registry are served (under their names in the
+    registry). Single range requests (``Range: bytes=...``) are supported so
+    that interrupted downloads can be resumed and large files downloaded in
+    segments (see :class:`pooch.HTTPDownloader`). The hash of the file in
+    the registry is used as the ETag. The data is sent with
+    :meth:`socket.socket.sendfile` so that it doesn't pass through Python on
+    systems that support it.
+
+    Use :func:`make_server` to create a server.
+
+    Parameters
+    ----------
+    address : tuple
+        The host name and port to listen on.
+    pooch : :class:`~pooch.Pooch`
+        The Pooch used to get the files.
+    downloader : None or callable
+        The downloader used to fetch files from the origin. If None, will use
+        the default downloader for the URL (see :meth:`pooch.Pooch.fetch`).
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, pooch, downloader=None):
+        self.pooch = pooch
+        self.downloader = downloader
+        super().__init__(address, _MirrorRequestHandler)
+
+    @property
+    def url(self):
+        "Base URL of the server to use as the *base_url* of other Pooches"
+        host, port = self.server_address[:2]
+        if host in ("", "0.0.0.0"):
+            host = "127.0.0.1"
+        return "http://{}:{}/".format(host, port)
+
+
+class _MirrorRequestHandler(BaseHTTPRequestHandler):
+    """
+    Send the files in the registry of the server's Pooch (see MirrorServer).
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        "Log requests with the pooch logger instead of printing to stderr"
+        get_logger().debug("%s - %s", self.address_string(), format % args)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        "Send a file or the range of it that was requested"
+        self._send_file(send_body=True)
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        "Send the headers for a file (fetching it from the origin if needed)"
+        self._send_file(send_body=False)
+
+    def _send_file(self, send_body):
+        "Fetch the file with the Pooch and send it"
+        pooch = self.server.pooch
+        fname = unquote(urlsplit(self.path).path).lstrip("/")
+        if fname not in pooch.registry:
+            self.send_error(404, "File not in the registry")
+            return
+        known_hash = pooch.registry[fname]
+        try:
+            path = pooch.fetch(fname, downloader=self.server.downloader)
+            fin = open(path, "rb")
+        except Exception as error:  # pylint: disable=broad-except
+            get_logger().error("Could not fetch '%s': %s", fname, str(error))
+            self.send_error(502, "Could not fetch the file from the origin")
+            return
+        with fin:
+            size = os.fstat(fin.fileno()).st_size
+            if known_hash is None:
+                etag = '"{}-{}"'.format(size, os.fstat(fin.fileno()).st_mtime_ns)
+            else:
+                etag = '"{}"'.format(hash_digest(known_hash))
+            status, start, end = 200, 0, size
+            requested = parse_range(self.headers.get("Range"), size)
+            if requested is not None and self.headers.get("If-Range", etag) == etag:
+                status, (start, end) = 206, requested
+                if start >= end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", "bytes */{}".format(size))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start))
+            self.send_header("ETag", etag)
+            self.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                self.send_header(
+                    "Content-Range", "bytes {}-{}/{}".format(start, end - 1, size)
+                )
+            self.end_headers()
+            if send_body and end > start:
+                self.wfile.flush()
+                self.connection.sendfile(fin, start, end - start)
+
+
+def parse_range(header, size):
+    """
+    Get the byte range requested by a ``Range`` header.
+
+    Only single ranges in bytes are supported. Other headers are ignored (the
+    whole file should be sent).
+
+    Parameters
+    ----------
+    header : str or None
+        The value of the ``Range`` header of the request.
+    size : int
+        The size of the file in bytes.
+
+    Returns
+    -------
+    byte_range : tuple or None
+        The first byte and one past the last byte of the range. If the first
+        byte isn't before the last, the range can't be satisfied. None if the
+        header should be ignored.
+
+    Examples
+    --------
+
+    >>> print(parse_range("bytes=10-19", 100))
+    (10, 20)
+    >>> print(parse_range("bytes=90-", 100))
+    (90, 100)
+    >>> print(parse_range("bytes=-5", 100))
+    (95, 100)
+    >>> print(parse_range("bytes=200-", 100))
+    (200, 100)
+    >>> print(parse_range("bytes=0-1,5-9", 100))
+    None
+
+    """
+    if header is None or not header.startswith("bytes=") or "," in header:
+        return None
+    first, __, last = header[len("bytes=") :].strip().partition("-")
+    try:
+        if not first:
+            # The last bytes of the file (a length of zero can't be satisfied)
+            length = int(last)
+            return (max(size - length, 0), size) if length > 0 else (size, size)
+        start = int(first)
+        end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if last and end <= start:
+        return None
+    return start, min(end, size)
+
+
+def make_server(pooch, host="127.0.0.1", port=8000, downloader=None):
+    """
+    Create an HTTP server that mirrors the files of a Pooch.
+
+    Other Pooches (for example, on the nodes of a cluster or the computers in
+    a lab) can use the server as their *base_url* so that each file is only
+    downloaded once from the origin for all of them. The files are stored in
+    the local storage of *pooch*. See :class:`pooch.server.MirrorServer` for
+    details.
+
+    Call ``serve_forever`` on the server to start it (or use ``pooch serve``
+    from the command line).
+
+    Parameters
+    ----------
+    pooch : :class:`~pooch.Pooch`
+        The Pooch used to get the files. Its *base_url* (or *urls*) should
+        point to the origin of the data.
+    host : str
+        The host name or address to listen on. Use ``""`` for all interfaces.
+    port : int
+        The port to listen on. Use 0 to choose a free port.
+    downloader : None or callable
+        The downloader used to fetch files from the origin.
+
+    Returns
+    -------
+    server : :class:`pooch.server.MirrorServer`
+        The server (not started yet).
+
+    Examples
+    --------
+
+    >>> import tempfile
+    >>> from pooch import Pooch
+    >>> with tempfile.TemporaryDirectory() as path:
+    ...     pup = Pooch(path=path, base_url="http://some.link.com/")
+    ...     server = make_server(pup, port=0)
+    ...     print(server.url.startswith("http://127.0.0.1:"))
+    ...     server.server_close()
+    True
+
+    """
+    return MirrorServer((host, port), pooch, downloader=downloader)
@@ -0,0 +1,209 @@
+"""
+Save fully configured Pooch instances to disk to start short-lived processes.
+"""
+import os
+import sys
+
+from .utils import get_logger, temporary_file, file_hash
+from .version import full_version
+
+# pickle is only imported when snapshots are used
+# pylint: disable=import-outside-toplevel
+
+
+def save_snapshot(pooch, fname, sources=(), key=None):
+    """
+    Save a configured :class:`~pooch.Pooch` to a snapshot file.
+
+    The snapshot includes the registry, the custom URLs, and the record of
+    files in the local storage that have already been verified (see
+    :attr:`pooch.Pooch.hash_index`). It's tied to the files in *sources*
+    (usually the registry files loaded with :meth:`pooch.Pooch.load_registry`)
+    and to a *key* describing the rest of the configuration, and is only
+    restored by :func:`load_snapshot` if none of them changed.
+
+    Failures to write the snapshot are logged but never raised, since the
+    snapshot is only used to avoid extra work.
+
+    Parameters
+    ----------
+    pooch : :class:`~pooch.Pooch`
+        The Pooch to save.
+    fname : str or PathLike
+        The snapshot file. It's replaced atomically if it already exists.
+    sources : list of str or PathLike
+        The files used to configure the Pooch. The snapshot is invalidated if
+        any of them is modified.
+    key : str, tuple, or None
+        The configuration of the Pooch that isn't in *sources* (like the
+        *version*, *path*, or *base_url* given to :func:`pooch.create`). The
+        snapshot is only restored with the same key. Must be picklable.
+
+    """
+    import pickle
+
+    fname = os.path.abspath(str(fname))
+    try:
+        header = {
+            "version": _snapshot_version(),
+            "sources": [_fingerprint(source) for source in sources],
+            "key": key,
+        }
+        index = pooch._index  # pylint: disable=protected-access
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with temporary_file(path=os.path.dirname(fname)) as tmp:
+            with open(tmp, "wb") as fout:
+                # The header is read on its own to check if the snapshot is
+                # valid without unpickling the (possibly large) registry.
+                pickle.dump(header, fout, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump((pooch, index), fout, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, fname)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError) as error:
+        get_logger().debug("Could not write snapshot '%s': %s", fname, str(error))
+
+
+def load_snapshot(fname, sources=(), key=None):
+    """
+    Restore a :class:`~pooch.Pooch` from a snapshot file.
+
+    The snapshot is only used if it was saved with the same *key* and from
+    the same *sources* and none of them changed since. A source is unchanged
+    if its size and modification time are the same as when the snapshot was
+    saved. Files that were touched but not modified (for example, when
+    checking out a repository again) are recognized by their SHA256 hash.
+
+    Parameters
+    ----------
+    fname : str or PathLike
+        The snapshot file written by :func:`save_snapshot`.
+    sources : list of str or PathLike
+        The files used to configure the Pooch. Must be the same files passed
+        to :func:`save_snapshot`.
+    key : str, tuple, or None
+        Must be equal to the *key* passed to :func:`save_snapshot`.
+
+    Returns
+    -------
+    pooch : :class:`~pooch.Pooch` or None
+        The restored Pooch. None if the snapshot doesn't exist, can't be read,
+        or is out of date.
+
+    """
+    import pickle
+
+    fname = str(fname)
+    try:
+        with open(fname, "rb") as fin:
+            header = pickle.load(fin)
+            if not _is_valid(header, sources, key):
+                get_logger().debug("Ignoring out of date snapshot '%s'.", fname)
+                return None
+            pooch, index = pickle.load(fin)
+    except FileNotFoundError:
+        return None
+    except Exception as error:  # pylint: disable=broad-except
+        # Unpickling can raise almost anything if the file is corrupted
+        get_logger().debug("Ignoring unreadable snapshot '%s': %s", fname, str(error))
+        return None
+    if index is not None and index.root == pooch.hash_index.root:
+        pooch._index = index  # pylint: disable=protected-access
+    return pooch
+
+
+def warm_start(fname, setup, sources=(), key=None):
+    """
+    Restore a :class:`~pooch.Pooch` from a snapshot or create and snapshot it.
+
+    Creating a Pooch with :func:`pooch.create` checks that the local storage
+    is writable and loading a large registry file takes time. For programs
+    that run many times (like command-line tools), this can take longer than
+    the actual work. With a snapshot, this only happens when the registry
+    files change and all other runs start from the saved Pooch.
+
+    Large registries are restored much faster if they're stored in a
+    :class:`pooch.CompactRegistry` (a few large arrays) instead of a
+    dictionary (millions of small strings).
+
+    Parameters
+    ----------
+    fname : str or PathLike
+        The snapshot file. Created if it doesn't exist or is out of date.
+    setup : callable
+        Function without arguments that creates and configures the
+        :class:`~pooch.Pooch`. Only called if the snapshot can't be used.
+    sources : list of str or PathLike
+        The files read by *setup* (usually the registry files). The snapshot
+        is made again if any of them is modified.
+    key : str, tuple, or None
+        The arguments of *setup* that can change between runs (for example,
+        the *version* passed to :func:`pooch.create`). The snapshot is made
+        again if it changes.
+
+    Returns
+    -------
+    pooch : :class:`~pooch.Pooch`
+        The Pooch restored from the snapshot or created by *setup*.
+
+    Examples
+    --------
+
+    >>> import tempfile
+    >>> from pooch import create
+    >>> def setup():
+    ...     print("Creating the Pooch")
+    ...     pup = create(path=path, base_url="http://some.link.com/")
+    ...     pup.load_registry(registry)
+    ...     return pup
+    >>> with tempfile.TemporaryDirectory() as path:
+    ...     registry = os.path.join(path, "registry.txt")
+    ...     with open(registry, "w") as fout:
+    ...         __ = fout.write("data.txt 9081wo2eb2gc0u\\n")
+    ...     snapshot = os.path.join(path, "pooch.snapshot")
+    ...     pup = warm_start(snapshot, setup, sources=[registry])
+    ...     pup = warm_start(snapshot, setup, sources=[registry])
+    ...     print(pup.registry)
+    Creating the Pooch
+    {'data.txt': '9081wo2eb2gc0u'}
+
+    """
+    pooch = load_snapshot(fname, sources, key)
+    if pooch is None:
+        pooch = setup()
+        save_snapshot(pooch, fname, sources, key)
+    return pooch
+
+
+def _snapshot_version():
+    "Pooch and Python versions that must match to restore a snapshot"
+    return [full_version, list(sys.version_info[:2])]
+
+
+def _fingerprint(source):
+    "The absolute path, size, modification time, and SHA256 hash of a file"
+    source = os.path.abspath(str(source))
+    stat = os.stat(source)
+    return [source, stat.st_size, stat.st_mtime_ns, file_hash(source)]
+
+
+def _is_valid(header, sources, key):
+    "Check that the snapshot was made from the current versions of the sources"
+    if header.get("version") != _snapshot_version() or header.get("key") != key:
+        return False
+    saved = header.get("sources", [])
+    sources = list(sources)
+    if len(saved) != len(sources):
+        return False
+    for (path, size, mtime, sha256), source in zip(saved, sources):
+        source = os.path.abspath(str(source))
+        if path != source:
+            return False
+        try:
+            stat = os.stat(source)
+            if stat.st_size != size:
+                return False
+            # Only hash files that might have been modified
+            if stat.st_mtime_ns != mtime and file_hash(source) != sha256:
+                return False
+        except OSError:
+            return False
+    return True
@@ -0,0 +1,102 @@
+"""
+Test the content-addressed blob store.
+"""
+import os
+import pickle
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from .. import create
+from ..core import Pooch
+from ..blobstore import BlobStore, clone_file
+from ..utils import file_hash
+
+from .utils import pooch_test_registry, check_tiny_data, serve_directory
+
+DATA_DIR = str(Path(__file__).parent / "data")
+REGISTRY = pooch_test_registry()
+
+
+def write_file(fname, content):
+    "Write a text file and return its SHA256 hash"
+    with open(fname, "w") as fout:
+        fout.write(content)
+    return file_hash(fname)
+
+
+def test_blob_store_add_and_link():
+    "Added files should be replaced by links to their blobs"
+    with TemporaryDirectory() as path:
+        store = BlobStore(os.path.join(path, "blobs"))
+        fname = os.path.join(path, "data.txt")
+        known_hash = write_file(fname, "some data")
+        assert store.link(known_hash, os.path.join(path, "copy.txt")) is False
+        blob = store.add(fname, known_hash)
+        assert blob == store.blob_path("sha256:" + known_hash.upper())
+        assert blob.startswith(os.path.join(path, "blobs", "sha256"))
+        assert os.path.samefile(fname, blob)
+        # Adding another file with the same content links it to the blob
+        other = os.path.join(path, "other.txt")
+        write_file(other, "some data")
+        assert store.add(other, known_hash) == blob
+        assert os.path.samefile(other, blob)
+        assert store.link(known_hash, os.path.join(path, "sub", "copy.txt"))
+        assert os.path.samefile(os.path.join(path, "sub", "copy.txt"), blob)
+
+
+def test_blob_store_discards_corrupted_blobs():
+    "Blobs that don't match their hash should be removed"
+    with TemporaryDirectory() as path:
+        store = BlobStore(os.path.join(path, "blobs"))
+        fname = os.path.join(path, "data.txt")
+        known_hash = write_file(fname, "some data")
+        blob = store.add(fname, known_hash)
+        # Modifying a linked file modifies the blob
+        with open(fname, "a") as fout:
+            fout.write("more data")
+        assert not store.link(known_hash, os.path.join(path, "copy.txt"))
+        assert not os.path.exists(blob)
+        assert not os.path.exists(os.path.join(path, "copy.txt"))
+        # Pickling shouldn't include the index
+        assert pickle.loads(pickle.dumps(store)).path == store.path
+
+
+def test_clone_file():
+    "Files should be linked if possible and copied otherwise"
+    with TemporaryDirectory() as path:
+        source = os.path.join(path, "source.txt")
+        write_file(source, "some data")
+        destination = os.path.join(path, "destination.txt")
+        assert clone_file(source, destination) in ("link", "reflink", "copy")
+        with open(destination) as fin:
+            assert fin.read() == "some data"
+
+
+def test_pooch_blob_store_skips_download():
+    "Files already in the blob store shouldn't be downloaded again"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            blobs = os.path.join(local_store, "blobs")
+            pup = create(
+                path=[local_store, "v1"],
+                base_url=server.url,
+                registry=REGISTRY,
+                blob_store=blobs,
+            )
+            fname = pup.fetch("tiny-data.txt")
+            check_tiny_data(fname)
+            assert len(server.requests) == 1
+            # Same content under a different name
+            subdir = pup.fetch("subdir/tiny-data.txt")
+            check_tiny_data(subdir)
+            # Same file in another storage folder
+            other = Pooch(
+                path=os.path.join(local_store, "v2"),
+                base_url=server.url,
+                registry=REGISTRY,
+                blob_store=blobs,
+            )
+            check_tiny_data(other.fetch("tiny-data.txt"))
+            assert len(server.requests) == 1
+            assert os.path.samefile(fname, subdir)
+            assert os.path.samefile(fname, other.fetch("tiny-data.txt"))
@@ -0,0 +1,130 @@
+"""
+Test downloading files through a fetch broker.
+"""
+import os
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from contextlib import contextmanager
+
+import pytest
+
+from .. import Pooch
+from ..broker import FetchBroker
+
+from .utils import (
+    pooch_test_registry,
+    check_tiny_data,
+    check_large_data,
+    capture_log,
+    serve_directory,
+)
+
+DATA_DIR = str(Path(__file__).parent / "data")
+REGISTRY = pooch_test_registry()
+
+
+@contextmanager
+def broker(roots):
+    "Run a broker for the given folders and yield its socket"
+    with TemporaryDirectory() as path:
+        socket_path = os.path.join(path, "broker.sock")
+        server = FetchBroker(socket_path, roots, max_downloads=2)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield socket_path
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        assert not os.path.exists(socket_path)
+
+
+def test_broker_downloads_once():
+    "Files should be downloaded once for all Pooches using the broker"
+    with serve_directory(DATA_DIR) as origin:
+        with TemporaryDirectory() as local_store:
+            with broker([local_store]) as socket_path:
+                results = []
+
+                def fetch(fname):
+                    "Fetch the file with a new Pooch"
+                    pup = Pooch(
+                        path=local_store,
+                        base_url=origin.url,
+                        registry=REGISTRY,
+                        broker=socket_path,
+                    )
+                    results.append(pup.fetch(fname))
+
+                threads = [
+                    threading.Thread(target=fetch, args=(fname,))
+                    for fname in ["tiny-data.txt", "large-data.txt"] * 4
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            assert len(results) == 8
+            check_tiny_data(os.path.join(local_store, "tiny-data.txt"))
+            check_large_data(os.path.join(local_store, "large-data.txt"))
+            assert sorted(path for __, path, __ in origin.requests) == [
+                "/large-data.txt",
+                "/tiny-data.txt",
+            ]
+
+
+def test_broker_errors():
+    "Errors of the broker's downloads should be raised by fetch"
+    registry = dict(REGISTRY)
+    registry["tiny-data.txt"] = registry["large-data.txt"]
+    base_url = DATA_DIR + os.sep
+    with TemporaryDirectory() as local_store, TemporaryDirectory() as other:
+        with broker([local_store]) as socket_path:
+            pup = Pooch(
+                path=local_store,
+                base_url=base_url,
+                registry=registry,
+                broker=socket_path,
+            )
+            with pytest.raises(ValueError):
+                pup.fetch("tiny-data.txt")
+            # The broker only writes to its roots so the file is downloaded by
+            # this process instead
+            pup = Pooch(
+                path=other, base_url=base_url, registry=registry, broker=socket_path
+            )
+            with capture_log() as log_file:
+                check_large_data(pup.fetch("large-data.txt"))
+                assert "The broker can't write 'large-data.txt'" in (
+                    log_file.getvalue()
+                )
+
+
+def test_broker_subfolders():
+    "The broker should write to folders inside its roots"
+    with TemporaryDirectory() as local_store:
+        with broker([local_store]) as socket_path:
+            pup = Pooch(
+                path=os.path.join(local_store, "v1"),
+                base_url=DATA_DIR + os.sep,
+                registry=REGISTRY,
+                broker=socket_path,
+            )
+            with capture_log() as log_file:
+                check_tiny_data(pup.fetch("tiny-data.txt"))
+                assert "through broker" in log_file.getvalue()
+                assert "Could not download" not in log_file.getvalue()
+
+
+def test_broker_unavailable(monkeypatch):
+    "Files should be downloaded by the process if the broker can't be reached"
+    with TemporaryDirectory() as local_store:
+        monkeypatch.setenv("POOCH_BROKER", os.path.join(local_store, "missing.sock"))
+        pup = Pooch(path=local_store, base_url=DATA_DIR + os.sep, registry=REGISTRY)
+        with capture_log() as log_file:
+            check_tiny_data(pup.fetch("tiny-data.txt"))
+            assert "Could not download 'tiny-data.txt' through the broker" in (
+                log_file.getvalue()
+            )
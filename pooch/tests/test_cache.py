@@ -0,0 +1,166 @@
+"""
+Test the management of the size of the local storage.
+"""
+import os
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from ..core import Pooch
+from ..cache import CacheManager, CacheEntry, lru, lfu, size_weighted
+
+from .utils import pooch_test_registry, check_large_data, serve_directory
+
+DATA_DIR = str(Path(__file__).parent / "data")
+REGISTRY = pooch_test_registry()
+
+
+def write_file(path, name, size):
+    "Write a file with the given number of bytes"
+    with open(os.path.join(path, name), "wb") as fout:
+        fout.write(b"x" * size)
+
+
+def test_cache_policies():
+    "The policies should order the entries as documented"
+    old = CacheEntry("old", size=10, last_access=0, count=5, now=100)
+    rare = CacheEntry("rare", size=10, last_access=50, count=1, now=100)
+    large = CacheEntry("large", size=1000, last_access=90, count=5, now=100)
+    entries = [large, rare, old]
+    assert sorted(entries, key=lru) == [old, rare, large]
+    assert sorted(entries, key=lfu) == [rare, old, large]
+    assert sorted(entries, key=size_weighted) == [large, old, rare]
+
+
+def test_cache_invalid_policy():
+    "Should raise an exception for unknown policies"
+    with pytest.raises(ValueError):
+        CacheManager(".", policy="fifo")
+
+
+@pytest.mark.parametrize("policy,expected", [("lru", "a.txt"), ("lfu", "b.txt")])
+def test_cache_evict(policy, expected):
+    "Should remove files in the order of the policy until under the limit"
+    with TemporaryDirectory() as path:
+        cache = CacheManager(path, max_size=250, policy=policy, min_age=0)
+        for name in ["a.txt", "b.txt", "c.txt"]:
+            write_file(path, name, 100)
+        for name in ["a.txt", "a.txt", "b.txt", "c.txt"]:
+            cache.record_access(name)
+        assert cache.usage() == 300
+        assert cache.evict(keep=["c.txt"]) == [expected]
+        assert not os.path.exists(os.path.join(path, expected))
+        assert cache.usage() == 200
+        assert cache.evict() == []
+        # Statistics are kept after the log is merged
+        counts = {"a.txt": 2, "b.txt": 1, "c.txt": 1}
+        del counts[expected]
+        assert {entry.name: entry.count for entry in cache.entries()} == counts
+
+
+def test_cache_evict_respects_min_age():
+    "Files accessed recently shouldn't be removed"
+    with TemporaryDirectory() as path:
+        cache = CacheManager(path, max_size=10, min_age=60)
+        write_file(path, "a.txt", 100)
+        cache.record_access("a.txt")
+        assert cache.evict() == []
+        assert os.path.exists(os.path.join(path, "a.txt"))
+
+
+def test_cache_merges_large_log(monkeypatch):
+    "The access log should be merged when it gets too large"
+    monkeypatch.setattr(CacheManager, "max_log_size", 200)
+    with TemporaryDirectory() as path:
+        cache = CacheManager(path)
+        write_file(path, "a.txt", 100)
+        log = os.path.join(path, ".pooch", "access.log")
+        for _ in range(20):
+            cache.record_access("a.txt")
+            assert not os.path.exists(log) or os.path.getsize(log) <= 200
+        assert [entry.count for entry in cache.entries()] == [20]
+
+
+def test_cache_pins():
+    "Pinned files shouldn't be removed unless the pinning process is gone"
+    with TemporaryDirectory() as path:
+        cache = CacheManager(path, max_size=10, min_age=0)
+        write_file(path, "a.txt", 100)
+        cache.record_access("a.txt")
+        with cache.pin("a.txt"):
+            assert cache.pinned() == {"a.txt"}
+            assert cache.evict() == []
+        assert cache.pinned() == set()
+        # A pin left behind by a process that no longer exists
+        pins = os.path.join(path, ".pooch", "pins")
+        with open(os.path.join(pins, "crashed"), "w") as fout:
+            json.dump({"file": "a.txt", "pid": 2**22 + 1, "host": "other"}, fout)
+        os.utime(os.path.join(pins, "crashed"), (0, 0))
+        assert cache.pinned() == set()
+        assert os.listdir(pins) == []
+        assert cache.evict() == ["a.txt"]
+
+
+def test_pooch_cache_size():
+    "Fetching files should remove others when over the limit"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(
+                path=local_store,
+                base_url=server.url,
+                registry=REGISTRY,
+                cache_size=102200,
+            )
+            pup.cache.min_age = 0
+            for fname in ["tiny-data.txt", "tiny-data.txt.gz", "tiny-data.txt.bz2"]:
+                pup.fetch(fname)
+            # Fetching from the cache counts as an access
+            pup.fetch("tiny-data.txt")
+            check_large_data(pup.fetch("large-data.txt"))
+            assert sorted(os.listdir(local_store)) == [
+                ".pooch",
+                "large-data.txt",
+                "tiny-data.txt",
+            ]
+            assert pup.cache.usage() <= 102200
+            # The file being processed is never removed
+            pup.cache_size = 10
+            pup.cache.min_age = 0
+
+            def processor(fname, action, pooch):
+                "Check that the file is pinned"
+                assert pooch.cache.pinned() == {"tiny-data.txt.gz"}
+                return fname
+
+            fname = pup.fetch("tiny-data.txt.gz", processor=processor)
+            assert sorted(os.listdir(local_store)) == [".pooch", "tiny-data.txt.gz"]
+
+
+def test_pooch_cache_size_blob_store():
+    "Removing files should also remove their blobs if nothing else uses them"
+    with TemporaryDirectory() as local_store:
+        blobs = os.path.join(local_store, "blobs")
+        pup = Pooch(
+            path=os.path.join(local_store, "data"),
+            base_url=DATA_DIR + os.sep,
+            registry=REGISTRY,
+            blob_store=blobs,
+            cache_size=100,
+        )
+        pup.cache.min_age = 0
+        blob = pup.blob_store.blob_path(REGISTRY["tiny-data.txt"])
+        pup.fetch("tiny-data.txt")
+        assert os.path.exists(blob)
+        # Linked from another storage folder so it has to be kept
+        other = os.path.join(local_store, "other.txt")
+        os.link(blob, other)
+        pup.fetch("tiny-data.txt.gz")
+        assert not os.path.exists(os.path.join(pup.abspath, "tiny-data.txt"))
+        assert os.path.exists(blob)
+        os.remove(other)
+        blob = pup.blob_store.blob_path(REGISTRY["tiny-data.txt.gz"])
+        pup.fetch("tiny-data.txt.bz2")
+        assert not os.path.exists(os.path.join(pup.abspath, "tiny-data.txt.gz"))
+        assert not os.path.exists(blob)
@@ -1,16 +1,21 @@
 """
 Test the core class and factory function.
 """
+import asyncio
 import hashlib
 import os
+import shutil
+import threading
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
 import pytest
 
 from ..core import Pooch, download_action, stream_download
-from ..utils import file_hash, get_logger, temporary_file
+from ..utils import file_hash, get_logger, temporary_file, HashedWriter
+from ..utils import hash_matches
 from ..downloaders import HTTPDownloader
+from ..index import HashIndex
 
 from .utils import (
     pooch_test_url,
@@ -18,6 +23,7 @@ from .utils import (
     check_tiny_data,
     check_large_data,
     capture_log,
+    copy_downloader,
 )
 
 # FTP doesn't work on Travis CI so need to be able to skip tests there
@@ -320,3 +326,282 @@ def test_stream_download(fname):
         stream_download(url, destination, known_hash, downloader, pooch=None)
         assert destination.exists()
         check_tiny_data(str(destination))
+
+
+def test_stream_download_hashes_while_writing(monkeypatch):
+    "Downloaders that write to the file object shouldn't cause a second read"
+    source = os.path.join(DATA_DIR, "tiny-data.txt")
+    known_hash = REGISTRY["tiny-data.txt"]
+
+    def download(url, output_file, pup):  # pylint: disable=unused-argument
+        "Copy the local file through the file object interface"
+        assert isinstance(output_file, HashedWriter)
+        with open(url, "rb") as fin:
+            output_file.write(fin.read())
+
+    def fail_file_hash(*args, **kwargs):  # pylint: disable=unused-argument
+        "The file should never be hashed from disk"
+        raise AssertionError("File was read back from disk.")
+
+    monkeypatch.setattr("pooch.utils.file_hash", fail_file_hash)
+    with TemporaryDirectory() as local_store:
+        destination = Path(local_store) / "tiny-data.txt"
+        stream_download(source, destination, known_hash, download, pooch=None)
+        check_tiny_data(str(destination))
+
+
+def test_stream_download_path_downloader():
+    "Downloaders that only use file names should still be verified"
+    source = os.path.join(DATA_DIR, "tiny-data.txt")
+
+    def download(url, output_file, pup):  # pylint: disable=unused-argument
+        "Copy the local file by opening the output file name"
+        with open(url, "rb") as fin:
+            with open(output_file, "wb") as fout:
+                fout.write(fin.read())
+
+    with TemporaryDirectory() as local_store:
+        destination = Path(local_store) / "tiny-data.txt"
+        stream_download(
+            source, destination, REGISTRY["tiny-data.txt"], download, pooch=None
+        )
+        check_tiny_data(str(destination))
+        # A wrong hash should be caught and the file not moved into place
+        destination = Path(local_store) / "corrupted.txt"
+        with pytest.raises(ValueError):
+            stream_download(
+                source,
+                destination,
+                REGISTRY_CORRUPTED["tiny-data.txt"],
+                download,
+                pooch=None,
+            )
+        assert not destination.exists()
+        assert os.listdir(local_store) == ["tiny-data.txt"]
+
+
+def test_fetch_many():
+    "Fetch several files concurrently and get the results in order"
+    fnames = ["tiny-data.txt", "large-data.txt", "subdir/tiny-data.txt"]
+    registry = {fname: REGISTRY[fname] for fname in fnames}
+    base_url = os.path.join(DATA_DIR, "store", "")
+    urls = {"large-data.txt": os.path.join(DATA_DIR, "large-data.txt")}
+    # All downloads must be running at the same time to get past the barrier
+    barrier = threading.Barrier(len(fnames), timeout=10)
+
+    def download(url, output_file, pup):
+        "Wait for all other downloads to start"
+        barrier.wait()
+        copy_downloader(url, output_file, pup)
+
+    with TemporaryDirectory() as local_store:
+        pup = Pooch(path=local_store, base_url=base_url, registry=registry, urls=urls)
+        paths = pup.fetch_many(fnames + fnames[:1], downloader=download)
+        assert paths == [
+            str(Path(local_store) / fname) for fname in fnames + fnames[:1]
+        ]
+        check_tiny_data(paths[0])
+        check_large_data(paths[1])
+        check_tiny_data(paths[2])
+        # Processors should be called with the right arguments for each file
+        actions = pup.fetch_many(
+            fnames, processor=lambda fname, action, pup: (fname, action)
+        )
+        assert actions == [(path, "fetch") for path in paths[:3]]
+
+
+def test_fetch_many_errors():
+    "All files should be fetched even if some of them fail"
+    registry = dict(REGISTRY_CORRUPTED)
+    registry["subdir/tiny-data.txt"] = REGISTRY["subdir/tiny-data.txt"]
+    base_url = os.path.join(DATA_DIR, "store", "")
+    with TemporaryDirectory() as local_store:
+        pup = Pooch(path=local_store, base_url=base_url, registry=registry)
+        fnames = ["tiny-data.txt", "subdir/tiny-data.txt"]
+        with pytest.raises(ValueError):
+            pup.fetch_many(fnames, downloader=copy_downloader)
+        check_tiny_data(os.path.join(local_store, "subdir", "tiny-data.txt"))
+        results = pup.fetch_many(
+            fnames, downloader=copy_downloader, return_exceptions=True
+        )
+        assert isinstance(results[0], ValueError)
+        check_tiny_data(results[1])
+        # Files not in the registry are an error before anything is fetched
+        with pytest.raises(ValueError):
+            pup.fetch_many(["not-in-the-registry.txt"], downloader=copy_downloader)
+
+
+def run_coroutine(coroutine):
+    "Run a coroutine in a new event loop and return the result"
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_afetch_async_downloader():
+    "Fetch files with an asynchronous downloader running on the event loop"
+    fnames = ["tiny-data.txt", "subdir/tiny-data.txt"]
+    registry = {fname: REGISTRY[fname] for fname in fnames}
+    base_url = os.path.join(DATA_DIR, "store", "")
+    started = []
+
+    async def download(url, output_file, pup):  # pylint: disable=unused-argument
+        "Copy the file in chunks once all downloads have started"
+        started.append(url)
+        while len(started) < len(fnames):
+            await asyncio.sleep(0.01)
+        with open(url, "rb") as fin:
+            for chunk in iter(lambda: fin.read(10), b""):
+                output_file.write(chunk)
+                await asyncio.sleep(0)
+
+    with TemporaryDirectory() as local_store:
+        pup = Pooch(path=local_store, base_url=base_url, registry=registry)
+        paths = run_coroutine(
+            pup.afetch_many(fnames, downloader=download, max_concurrency=2)
+        )
+        assert paths == [str(Path(local_store) / fname) for fname in fnames]
+        for path in paths:
+            check_tiny_data(path)
+        # Existing files are verified and processed without downloading
+        result = run_coroutine(
+            pup.afetch(
+                "tiny-data.txt",
+                processor=lambda fname, action, pup: action,
+                downloader=download,
+            )
+        )
+        assert result == "fetch"
+        assert len(started) == 2
+
+
+def test_afetch_sync_downloader():
+    "Regular downloaders should also work with afetch"
+    base_url = os.path.join(DATA_DIR, "store", "")
+    with TemporaryDirectory() as local_store:
+        pup = Pooch(path=local_store, base_url=base_url, registry=REGISTRY_CORRUPTED)
+        with pytest.raises(ValueError):
+            run_coroutine(pup.afetch("tiny-data.txt", downloader=copy_downloader))
+        pup.registry = dict(REGISTRY)
+        fname = run_coroutine(pup.afetch("tiny-data.txt", downloader=copy_downloader))
+        check_tiny_data(fname)
+        results = run_coroutine(
+            pup.afetch_many(
+                ["tiny-data.txt", "large-data.txt"],
+                downloader=copy_downloader,
+                return_exceptions=True,
+            )
+        )
+        assert results[0] == fname
+        # large-data.txt isn't in the store folder
+        assert isinstance(results[1], OSError)
+
+
+def test_fetch_verify_invalid():
+    "Should raise an exception for unknown verification policies"
+    with pytest.raises(ValueError):
+        Pooch(path=DATA_DIR, base_url="", registry=REGISTRY, verify="sometimes")
+    pup = Pooch(path=DATA_DIR, base_url="", registry=REGISTRY)
+    with pytest.raises(ValueError):
+        pup.fetch("tiny-data.txt", verify="sometimes")
+
+
+@pytest.mark.parametrize("verify", ["never", "once-per-process", "size-only"])
+def test_fetch_verify_without_hashing(verify, monkeypatch):
+    "Files verified before shouldn't be hashed again by the faster policies"
+    base_url = os.path.join(DATA_DIR, "store", "")
+    with TemporaryDirectory() as local_store:
+        pup = Pooch(path=local_store, base_url=base_url, registry=REGISTRY)
+        fname = pup.fetch("tiny-data.txt", downloader=copy_downloader)
+        hashed = []
+
+        def counting_hash(*args, **kwargs):
+            "Keep track of the files that are hashed"
+            hashed.append(args[0])
+            return hash_matches(*args, **kwargs)
+
+        monkeypatch.setattr("pooch.core.hash_matches", counting_hash)
+        pup.verify = verify
+        for __ in range(3):
+            assert pup.fetch("tiny-data.txt") == fname
+        assert not hashed
+        # Modified files are only caught by checking the size (or the hash)
+        with open(fname, "a") as fout:
+            fout.write("extra data")
+        if verify == "size-only":
+            pup.fetch("tiny-data.txt", downloader=copy_downloader)
+            assert hashed
+            check_tiny_data(fname)
+        else:
+            assert pup.fetch("tiny-data.txt") == fname
+            assert not hashed
+        # The default policy can still be used for a single call
+        pup.fetch("tiny-data.txt", downloader=copy_downloader, verify="always")
+        check_tiny_data(fname)
+
+
+def test_fetch_verify_background():
+    "Files that fail the background check should raise once and be downloaded"
+    base_url = os.path.join(DATA_DIR, "store", "")
+    with TemporaryDirectory() as local_store:
+        path = os.path.join(local_store, "tiny-data.txt")
+        with open(path, "w") as fout:
+            fout.write("different data")
+        pup = Pooch(
+            path=local_store, base_url=base_url, registry=REGISTRY, verify="background"
+        )
+        # The file is returned right away and checked in the background
+        assert pup.fetch("tiny-data.txt", downloader=copy_downloader) == path
+        pup._background.shutdown(wait=True)  # pylint: disable=protected-access
+        with pytest.raises(ValueError):
+            pup.fetch("tiny-data.txt", downloader=copy_downloader)
+        assert pup.fetch("tiny-data.txt", downloader=copy_downloader) == path
+        check_tiny_data(path)
+
+
+def test_pooch_tiers():
+    "Files should be promoted from the first tier with a valid copy"
+    with TemporaryDirectory() as corrupted, TemporaryDirectory() as shared:
+        with open(os.path.join(corrupted, "tiny-data.txt"), "w") as fout:
+            fout.write("different data")
+        shutil.copy(os.path.join(DATA_DIR, "tiny-data.txt"), shared)
+        downloaded = []
+
+        def download(url, output_file, pooch):
+            "Keep track of the downloads"
+            downloaded.append(url)
+            copy_downloader(url, output_file, pooch)
+
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(
+                path=local_store,
+                base_url=os.path.join(DATA_DIR, ""),
+                registry=REGISTRY,
+                tiers=[corrupted, shared],
+            )
+            with capture_log() as log_file:
+                fname = pup.fetch("tiny-data.txt", downloader=download)
+                logs = log_file.getvalue()
+            assert fname == os.path.join(local_store, "tiny-data.txt")
+            check_tiny_data(fname)
+            assert "Could not use file 'tiny-data.txt'" in logs
+            assert "Promoting file 'tiny-data.txt'" in logs
+            # Files that aren't in any tier are downloaded
+            check_large_data(pup.fetch("large-data.txt", downloader=download))
+            assert downloaded == [os.path.join(DATA_DIR, "large-data.txt")]
+        # Files in the hash index of a tier are linked without hashing them
+        HashIndex(shared).record(
+            os.path.join(shared, "tiny-data.txt"), REGISTRY["tiny-data.txt"]
+        )
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(
+                path=local_store,
+                base_url=os.path.join(DATA_DIR, ""),
+                registry=REGISTRY,
+                tiers=[shared],
+            )
+            fname = pup.fetch("tiny-data.txt", downloader=download)
+            assert os.path.samefile(fname, os.path.join(shared, "tiny-data.txt"))
+            assert len(downloaded) == 1
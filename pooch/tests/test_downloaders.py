@@ -1,24 +1,45 @@
 """
 Test the downloader classes and functions separately from the Pooch core.
 """
+import io
 import os
+import json
 import sys
+import ftplib
+import pickle
+from pathlib import Path
 from tempfile import TemporaryDirectory
 
 import pytest
+import requests
 
 try:
     import tqdm
 except ImportError:
     tqdm = None
 
-from ..downloaders import HTTPDownloader, FTPDownloader, choose_downloader
-from .utils import pooch_test_url, check_large_data
+from ..core import Pooch
+from ..utils import HashedWriter
+from ..downloaders import (
+    HTTPDownloader,
+    FTPDownloader,
+    FileDownloader,
+    choose_downloader,
+)
+from .utils import (
+    pooch_test_url,
+    pooch_test_registry,
+    check_large_data,
+    check_tiny_data,
+    serve_directory,
+)
 
 
 # FTP doesn't work on Travis CI so need to be able to skip tests there
 ON_TRAVIS = bool(os.environ.get("TRAVIS", None))
 BASEURL = pooch_test_url()
+DATA_DIR = str(Path(__file__).parent / "data")
+REGISTRY = pooch_test_registry()
 
 
 def test_unsupported_protocol():
@@ -27,6 +48,33 @@ def test_unsupported_protocol():
         choose_downloader("httpup://some-invalid-url.com")
 
 
+@pytest.mark.parametrize("uri", [True, False], ids=["uri", "path"])
+def test_file_downloader(uri):
+    "Files in the local file system should be fetched with FileDownloader"
+    store = Path(DATA_DIR) / "store"
+    base_url = store.as_uri() + "/" if uri else str(store) + os.sep
+    with TemporaryDirectory() as local_store:
+        pup = Pooch(path=local_store, base_url=base_url, registry=REGISTRY)
+        assert isinstance(pup.default_downloader(base_url), FileDownloader)
+        check_tiny_data(pup.fetch("tiny-data.txt"))
+        assert pup.is_available("tiny-data.txt")
+        assert not pup.is_available("large-data.txt")
+        # Plain file names and file objects as outputs
+        outfile = os.path.join(local_store, "copy.txt")
+        FileDownloader()(base_url + "tiny-data.txt", outfile, None)
+        check_tiny_data(outfile)
+        with open(outfile, "wb") as fout:
+            FileDownloader()(base_url + "tiny-data.txt", fout, None)
+        check_tiny_data(outfile)
+
+
+def test_file_downloader_remote_host():
+    "Should raise ValueError for file URLs on other hosts"
+    assert FileDownloader.local_path("file://localhost/data.txt") == "/data.txt"
+    with pytest.raises(ValueError):
+        FileDownloader.local_path("file://some.host/data.txt")
+
+
 # https://blog.travis-ci.com/2018-07-23-the-tale-of-ftp-at-travis-ci
 @pytest.mark.skipif(ON_TRAVIS, reason="FTP is not allowed on Travis CI")
 def test_ftp_downloader():
@@ -91,3 +139,335 @@ def test_downloader_progressbar_ftp(capsys):
         assert printed[:25] == progress
         # Check that the file was actually downloaded
         assert os.path.exists(outfile)
+
+
+@pytest.mark.parametrize("keep_alive", [True, False])
+def test_http_downloader_reuses_connections(keep_alive):
+    "Downloads from the same server should share a connection"
+    with serve_directory(DATA_DIR) as server:
+        download = HTTPDownloader(keep_alive=keep_alive)
+        with TemporaryDirectory() as local_store:
+            for fname in ["tiny-data.txt", "large-data.txt", "tiny-data.txt"]:
+                outfile = os.path.join(local_store, fname)
+                download(server.url + fname, outfile, None)
+            check_tiny_data(os.path.join(local_store, "tiny-data.txt"))
+            check_large_data(os.path.join(local_store, "large-data.txt"))
+        if keep_alive:
+            assert len(server.connections) == 1
+        else:
+            assert len(server.connections) == 3
+    # Downloaders can be pickled but the session isn't shared
+    copy = pickle.loads(pickle.dumps(download))
+    assert copy.session is not download.session
+
+
+def test_pooch_reuses_default_downloader():
+    "Pooch should keep the default downloader between fetches"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            downloader = pup.default_downloader(server.url)
+            assert isinstance(downloader, HTTPDownloader)
+            assert pup.default_downloader(server.url + "other") is downloader
+            assert pup.is_available("tiny-data.txt")
+            check_tiny_data(pup.fetch("tiny-data.txt"))
+            check_large_data(pup.fetch("large-data.txt"))
+            assert not pup.is_available("subdir/tiny-data.txt")
+        assert len(server.connections) == 1
+
+
+class FakeFTP:
+    """
+    Mimic the parts of ftplib.FTP used by the downloader (for offline tests).
+    """
+
+    instances = []
+    files = {"/data/tiny-data.txt": b"# A tiny data file for test purposes only\n"}
+
+    def __init__(self, timeout=None):  # pylint: disable=unused-argument
+        self.logins = 0
+        self.commands = []
+        self.alive = True
+        self.instances.append(self)
+
+    def connect(self, host, port):  # pylint: disable=unused-argument,no-self-use
+        "Pretend to connect"
+        return "220 Welcome"
+
+    def login(self, user, passwd, acct):  # pylint: disable=unused-argument
+        "Count the logins"
+        self.logins += 1
+
+    def voidcmd(self, command):
+        "Fail if the server dropped the connection"
+        if not self.alive:
+            raise EOFError("Connection closed")
+        self.commands.append(command)
+
+    def retrbinary(self, command, callback, blocksize):
+        "Send the file to the callback in chunks"
+        if not self.alive:
+            raise ftplib.error_temp("421 Timeout")
+        self.commands.append(command)
+        data = self.files[command.split()[-1]]
+        for i in range(0, len(data), blocksize):
+            callback(data[i : i + blocksize])
+
+    def nlst(self, directory):
+        "List the files in the directory"
+        return [name for name in self.files if name.startswith(directory)]
+
+    def quit(self):
+        "Close the connection"
+        self.alive = False
+
+    close = quit
+
+
+@pytest.fixture
+def fake_ftp(monkeypatch):
+    "Replace ftplib.FTP with FakeFTP"
+    FakeFTP.instances = []
+    monkeypatch.setattr(ftplib, "FTP", FakeFTP)
+    return FakeFTP
+
+
+def test_ftp_downloader_reuses_connections(fake_ftp):
+    "Downloads from the same server should share a logged in connection"
+    download = FTPDownloader(chunk_size=10)
+    with TemporaryDirectory() as local_store:
+        outfile = os.path.join(local_store, "tiny-data.txt")
+        for _ in range(3):
+            download("ftp://some.server/data/tiny-data.txt", outfile, None)
+            with open(outfile) as fin:
+                assert fin.read().startswith("# A tiny data file")
+    assert len(fake_ftp.instances) == 1
+    assert fake_ftp.instances[0].logins == 1
+    assert fake_ftp.instances[0].commands.count("NOOP") == 2
+    # Different servers and users get different connections
+    download("ftp://other.server/data/tiny-data.txt", io.BytesIO(), None)
+    other_user = FTPDownloader(username="doggo", pool=download.pool)
+    other_user("ftp://some.server/data/tiny-data.txt", io.BytesIO(), None)
+    assert len(fake_ftp.instances) == 3
+
+
+def test_ftp_downloader_reconnects(fake_ftp):
+    "Dead and expired connections should be replaced by new ones"
+    download = FTPDownloader()
+    output = io.BytesIO()
+    download("ftp://some.server/data/tiny-data.txt", output, None)
+
+    def dropped(*args, **kwargs):  # pylint: disable=unused-argument
+        "The server closed the connection after the NOOP check"
+        raise EOFError("Connection closed")
+
+    fake_ftp.instances[0].retrbinary = dropped
+    output = io.BytesIO()
+    download("ftp://some.server/data/tiny-data.txt", output, None)
+    assert output.getvalue() == FakeFTP.files["/data/tiny-data.txt"]
+    assert len(fake_ftp.instances) == 2
+    # Idle connections are closed after the timeout
+    download.pool.idle_timeout = 0
+    download("ftp://some.server/data/tiny-data.txt", io.BytesIO(), None)
+    assert len(fake_ftp.instances) == 3
+    assert not fake_ftp.instances[1].alive
+    download.pool.close()
+    assert not fake_ftp.instances[2].alive
+
+
+def test_ftp_is_available_uses_pool(fake_ftp):
+    "Checking availability should reuse the download connections"
+    pup = Pooch(
+        path=DATA_DIR,
+        base_url="ftp://some.server/data/",
+        registry={"tiny-data.txt": "somehash", "missing.txt": "somehash"},
+    )
+    assert pup.is_available("tiny-data.txt")
+    assert not pup.is_available("missing.txt")
+    assert len(fake_ftp.instances) == 1
+
+
+def test_http_downloader_resumes_interrupted_download():
+    "Interrupted downloads should be resumed from where they stopped"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            server.interrupt_after = 5000
+            with pytest.raises(requests.exceptions.RequestException):
+                pup.fetch("large-data.txt")
+            part = os.path.join(local_store, "large-data.txt.part")
+            # Only complete chunks are written to the file
+            size = os.path.getsize(part)
+            assert 0 < size <= 5000
+            assert os.path.exists(part + ".json")
+            fname = pup.fetch("large-data.txt")
+            check_large_data(fname)
+            assert sorted(os.listdir(local_store)) == [".pooch", "large-data.txt"]
+            method, _, headers = server.requests[-1]
+            assert method == "GET"
+            assert headers["Range"] == "bytes={}-".format(size)
+            assert headers["If-Range"].startswith('"')
+
+
+def test_http_downloader_restarts_changed_file():
+    "If the remote file changed, the partial download should start over"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            part = os.path.join(local_store, "large-data.txt.part")
+            with open(part, "w") as fout:
+                fout.write("garbage that isn't the start of the file")
+            with open(part + ".json", "w") as fout:
+                json.dump(
+                    {"url": server.url + "large-data.txt", "validator": '"old"'}, fout
+                )
+            check_large_data(pup.fetch("large-data.txt"))
+            _, _, headers = server.requests[-1]
+            assert headers["If-Range"] == '"old"'
+            assert not os.path.exists(part)
+            assert not os.path.exists(part + ".json")
+
+
+def test_http_downloader_restarts_other_download():
+    "A partial file left by a download from another URL should be discarded"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            part = os.path.join(local_store, "large-data.txt.part")
+            with open(part, "w") as fout:
+                fout.write("start of a file from a different URL")
+            with open(part + ".json", "w") as fout:
+                json.dump({"url": server.url + "other.txt", "validator": '"a"'}, fout)
+            check_large_data(pup.fetch("large-data.txt"))
+            _, _, headers = server.requests[-1]
+            assert "Range" not in headers
+            assert not os.path.exists(part)
+
+
+def test_http_downloader_saves_resume_info():
+    "The information to resume should be saved when the response arrives"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            part = os.path.join(local_store, "large-data.txt.part")
+            server.interrupt_after = 5000
+            writer = HashedWriter(part, info_file=part + ".json")
+            # No cleanup by partial_download, like a process that was killed
+            with pytest.raises(requests.exceptions.RequestException):
+                HTTPDownloader()(server.url + "large-data.txt", writer, None)
+            writer.close()
+            with open(part + ".json") as fin:
+                info = json.load(fin)
+            assert info["url"] == server.url + "large-data.txt"
+            assert info == writer.resume_info
+            size = os.path.getsize(part)
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            check_large_data(pup.fetch("large-data.txt"))
+            _, _, headers = server.requests[-1]
+            assert headers["Range"] == "bytes={}-".format(size)
+
+
+def test_http_downloader_removes_partial_files():
+    "Partial files should be deleted if a non-resumable download completes"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            server.interrupt_after = 5000
+            with pytest.raises(requests.exceptions.RequestException):
+                pup.fetch("large-data.txt")
+            part = os.path.join(local_store, "large-data.txt.part")
+            assert os.path.exists(part) and os.path.exists(part + ".json")
+            downloader = HTTPDownloader(resume=False)
+            check_large_data(pup.fetch("large-data.txt", downloader=downloader))
+            assert sorted(os.listdir(local_store)) == [".pooch", "large-data.txt"]
+
+
+def test_http_downloader_no_ranges():
+    "Downloads from servers without range support can't be resumed"
+    with serve_directory(DATA_DIR) as server:
+        server.ranges = False
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            server.interrupt_after = 5000
+            with pytest.raises(requests.exceptions.RequestException):
+                pup.fetch("large-data.txt")
+            assert sorted(os.listdir(local_store)) == [".pooch"]
+            check_large_data(pup.fetch("large-data.txt"))
+            _, _, headers = server.requests[-1]
+            assert "Range" not in headers
+
+
+def test_http_downloader_resume_disabled():
+    "Partial files shouldn't be kept if resuming is disabled"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            server.interrupt_after = 5000
+            with pytest.raises(requests.exceptions.RequestException):
+                pup.fetch("large-data.txt", downloader=HTTPDownloader(resume=False))
+            assert sorted(os.listdir(local_store)) == [".pooch"]
+
+
+def test_http_downloader_segments():
+    "Large files should be downloaded in parallel segments"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            downloader = HTTPDownloader(segments=4, segment_threshold=1000)
+            check_large_data(pup.fetch("large-data.txt", downloader=downloader))
+            assert sorted(os.listdir(local_store)) == [".pooch", "large-data.txt"]
+            methods = [method for method, _, _ in server.requests]
+            assert methods == ["HEAD"] + ["GET"] * 4
+            ranges = sorted(
+                tuple(int(i) for i in headers["Range"][6:].split("-"))
+                for _, _, headers in server.requests[1:]
+            )
+            size = os.path.getsize(os.path.join(DATA_DIR, "large-data.txt"))
+            assert ranges[0][0] == 0
+            assert ranges[-1][1] == size - 1
+            for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+                assert start == end + 1
+
+
+def test_http_downloader_segments_after_interruption():
+    "Segments should replace a partial file left by an interrupted download"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            server.interrupt_after = 5000
+            with pytest.raises(requests.exceptions.RequestException):
+                pup.fetch("large-data.txt")
+            part = os.path.join(local_store, "large-data.txt.part")
+            assert os.path.getsize(part) > 0
+            # The same server under another URL so the download can't resume
+            pup.base_url = server.url.replace("127.0.0.1", "localhost")
+            downloader = HTTPDownloader(segments=4, segment_threshold=1000)
+            check_large_data(pup.fetch("large-data.txt", downloader=downloader))
+            assert sorted(os.listdir(local_store)) == [".pooch", "large-data.txt"]
+            methods = [method for method, _, _ in server.requests]
+            assert methods == ["GET", "HEAD"] + ["GET"] * 4
+
+
+@pytest.mark.parametrize("ranges,threshold", [(False, 1000), (True, 10**6)])
+def test_http_downloader_segments_fallback(ranges, threshold):
+    "Small files or servers without range support use a single stream"
+    with serve_directory(DATA_DIR) as server:
+        server.ranges = ranges
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            downloader = HTTPDownloader(segments=4, segment_threshold=threshold)
+            check_large_data(pup.fetch("large-data.txt", downloader=downloader))
+            methods = [method for method, _, _ in server.requests]
+            assert methods == ["HEAD", "GET"]
+            assert "Range" not in server.requests[-1][2]
+
+
+def test_http_downloader_segments_interrupted():
+    "Interrupted segmented downloads don't leave partial files behind"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+            downloader = HTTPDownloader(segments=4, segment_threshold=1000)
+            server.interrupt_after = 5000
+            with pytest.raises(requests.exceptions.RequestException):
+                pup.fetch("large-data.txt", downloader=downloader)
+            assert sorted(os.listdir(local_store)) == [".pooch"]
@@ -0,0 +1,75 @@
+"""
+Test that importing pooch is fast and doesn't load dependencies early.
+"""
+import os
+import sys
+import subprocess
+
+import pytest
+
+import pooch
+
+# Modules that should only be imported when files are downloaded or processed
+LAZY_MODULES = [
+    "requests",
+    "tqdm",
+    "ftplib",
+    "asyncio",
+    "concurrent.futures.thread",
+    "packaging.version",
+    "tarfile",
+    "sqlite3",
+    "pickle",
+]
+# Maximum time (in seconds) that importing pooch can take. It's generous to
+# avoid failures on slow machines but importing requests alone exceeds it.
+IMPORT_TIME_BUDGET = 0.1
+# Timing tests depend on the machine and its load so they only run on request
+# (test_import_is_lazy checks the same thing deterministically)
+RUN_BENCHMARKS = bool(os.environ.get("POOCH_BENCHMARK", None))
+
+
+def run_python(*args):
+    "Run Python in a new process with the same pooch and return stdout, stderr"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(pooch.__file__))
+    process = subprocess.run(
+        [sys.executable] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=env,
+        check=True,
+    )
+    return process.stdout, process.stderr
+
+
+def import_time():
+    """
+    Time (in seconds) to import pooch according to ``python -X importtime``.
+
+    Getting the version runs git in development checkouts and isn't counted.
+    """
+    __, log = run_python("-X", "importtime", "-c", "import pooch")
+    times = {}
+    for line in log.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            __, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) * 1e-6
+    return times["pooch"] - times.get("pooch.version", 0)
+
+
+def test_import_is_lazy():
+    "Heavy dependencies shouldn't be imported with pooch"
+    code = "import sys, pooch; print(' '.join(sys.modules))"
+    loaded = set(run_python("-c", code)[0].split())
+    assert "pooch.core" in loaded
+    assert loaded.isdisjoint(LAZY_MODULES)
+
+
+@pytest.mark.skipif(not RUN_BENCHMARKS, reason="set POOCH_BENCHMARK to run")
+def test_import_time():
+    "Importing pooch should take less than the budget"
+    # Take the best of a few runs to avoid noise
+    assert min(import_time() for i in range(3)) < IMPORT_TIME_BUDGET
@@ -0,0 +1,140 @@
+"""
+Test the index of verified files.
+"""
+import os
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from ..core import Pooch, download_action
+from ..index import HashIndex
+from ..utils import file_hash
+
+from .utils import check_tiny_data
+
+DATA_DIR = str(Path(__file__).parent / "data")
+
+
+def write_file(fname, content):
+    "Write a text file and return its SHA256 hash"
+    with open(fname, "w") as fout:
+        fout.write(content)
+    return file_hash(fname)
+
+
+def test_hash_index_record_and_lookup():
+    "Recorded files should be found as long as they don't change"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.txt")
+        known_hash = write_file(fname, "some data")
+        index = HashIndex(path)
+        assert index.lookup(fname, known_hash) is None
+        index.record(fname, known_hash)
+        assert index.lookup(fname, known_hash)
+        assert index.lookup(fname, "sha256:" + known_hash)
+        # A different hash for the same algorithm is a known mismatch
+        assert index.lookup(fname, "a-different-hash") is False
+        # But a different algorithm needs the file to be hashed
+        assert index.lookup(fname, "md5:a-different-hash") is None
+        # Changing the file invalidates the entry
+        write_file(fname, "some other data")
+        assert index.lookup(fname, known_hash) is None
+        # Missing files are never in the index
+        assert index.lookup(os.path.join(path, "missing.txt"), known_hash) is None
+
+
+def test_hash_index_persistence():
+    "The index should be saved to disk and shared between instances"
+    with TemporaryDirectory() as path:
+        os.makedirs(os.path.join(path, "subdir"))
+        fname = os.path.join(path, "subdir", "data.txt")
+        known_hash = write_file(fname, "some data")
+        HashIndex(path).record(fname, known_hash)
+        with open(os.path.join(path, ".pooch", "index.json")) as fin:
+            content = json.load(fin)
+        assert list(content["files"]) == ["subdir/data.txt"]
+        index = HashIndex(path)
+        assert index.lookup(fname, known_hash)
+        index.forget(fname)
+        assert HashIndex(path).lookup(fname, known_hash) is None
+
+
+def test_hash_index_corrupted_file():
+    "An unreadable index file should be ignored"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.txt")
+        known_hash = write_file(fname, "some data")
+        os.makedirs(os.path.join(path, ".pooch"))
+        with open(os.path.join(path, ".pooch", "index.json"), "w") as fout:
+            fout.write("this is not JSON")
+        index = HashIndex(path)
+        assert index.lookup(fname, known_hash) is None
+        index.record(fname, known_hash)
+        assert HashIndex(path).lookup(fname, known_hash)
+
+
+def test_download_action_uses_index(monkeypatch):
+    "Files in the index shouldn't be hashed again"
+    with TemporaryDirectory() as path:
+        fname = Path(path) / "data.txt"
+        known_hash = write_file(str(fname), "some data")
+        index = HashIndex(path)
+        assert download_action(fname, known_hash, index=index)[0] == "fetch"
+        assert index.lookup(fname, known_hash)
+
+        def fail_file_hash(*args, **kwargs):  # pylint: disable=unused-argument
+            "The file should never be hashed again"
+            raise AssertionError("File was hashed.")
+
+        monkeypatch.setattr("pooch.utils.file_hash", fail_file_hash)
+        assert download_action(fname, known_hash, index=index)[0] == "fetch"
+        assert download_action(fname, "wrong-hash", index=index)[0] == "update"
+
+
+def test_pooch_fetch_records_index():
+    "Fetching local files should add them to the index in the storage"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "tiny-data.txt")
+        with open(os.path.join(DATA_DIR, "tiny-data.txt")) as fin:
+            known_hash = write_file(fname, fin.read())
+        pup = Pooch(path=path, base_url="", registry={"tiny-data.txt": known_hash})
+        assert pup.fetch("tiny-data.txt") == fname
+        check_tiny_data(fname)
+        assert HashIndex(path).lookup(fname, known_hash)
+        assert pup.hash_index is pup.hash_index
+
+
+def test_hash_index_journal(monkeypatch):
+    "Changes should be appended to the journal and compacted once in a while"
+    monkeypatch.setattr(HashIndex, "min_journal_size", 5)
+    with TemporaryDirectory() as path:
+        fnames = [os.path.join(path, "data{}.txt".format(i)) for i in range(20)]
+        hashes = [write_file(fname, fname) for fname in fnames]
+        index = HashIndex(path)
+        other = HashIndex(path)
+        for i, (fname, known_hash) in enumerate(zip(fnames, hashes)):
+            index.record(fname, known_hash)
+            # Other instances see the changes whether they're in the journal or
+            # were compacted into the index file
+            assert other.lookup(fname, known_hash)
+            with open(index.journal) as fin:
+                assert len(fin.readlines()) <= max(6, i + 2)
+        with open(index.fname) as fin:
+            assert len(json.load(fin)["files"]) >= 10
+
+
+def test_hash_index_forget_in_other_instance():
+    "Files removed by another instance shouldn't come back when saving"
+    with TemporaryDirectory() as path:
+        first, second = [os.path.join(path, name) for name in ["a.txt", "b.txt"]]
+        first_hash, second_hash = write_file(first, "a"), write_file(second, "b")
+        index = HashIndex(path)
+        index.record(first, first_hash)
+        other = HashIndex(path)
+        assert other.lookup(first, first_hash)
+        other.forget(first)
+        index.record(second, second_hash)
+        fresh = HashIndex(path)
+        assert fresh.lookup(first, first_hash) is None
+        assert fresh.lookup(second, second_hash)
+        assert index.lookup(first, first_hash) is None
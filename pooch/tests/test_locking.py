@@ -0,0 +1,341 @@
+"""
+Test the locks used to coordinate downloads.
+"""
+import os
+import json
+import asyncio
+import pickle
+import time
+import socket
+import threading
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from ..core import Pooch
+from ..locking import FileLock, SingleFlight, _read_owner
+
+from .utils import pooch_test_registry, check_tiny_data, copy_downloader
+
+DATA_DIR = str(Path(__file__).parent / "data" / "store")
+REGISTRY = pooch_test_registry()
+
+
+def write_lock(fname, pid, host, age=0):
+    "Create a lock file that looks like it belongs to someone else"
+    with open(fname, "w") as fout:
+        json.dump({"pid": pid, "host": host, "token": "sometoken"}, fout)
+    mtime = time.time() - age
+    os.utime(fname, (mtime, mtime))
+
+
+def test_file_lock_exclusive():
+    "Only one thread should hold the lock at a time"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "locks", "data.lock")
+        inside = []
+        overlaps = []
+
+        def work():
+            "Hold the lock for a while and check nobody else has it"
+            with FileLock(fname, poll_interval=0.01):
+                inside.append(1)
+                overlaps.append(len(inside) > 1)
+                time.sleep(0.05)
+                inside.pop()
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert overlaps == [False] * 4
+        assert not os.path.exists(fname)
+
+
+def test_file_lock_timeout():
+    "Should raise an error if the lock isn't released in time"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.lock")
+        with FileLock(fname):
+            lock = FileLock(fname, timeout=0.1, poll_interval=0.01)
+            with pytest.raises(TimeoutError):
+                lock.acquire()
+            assert not lock.is_locked
+        lock.acquire()
+        assert not lock.waited
+        lock.release()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires process IDs")
+def test_file_lock_dead_owner():
+    "Locks from processes that are no longer running should be broken"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.lock")
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        write_lock(fname, process.pid, socket.gethostname())
+        with FileLock(fname, timeout=5, poll_interval=0.01) as lock:
+            assert lock.waited
+        assert not os.path.exists(fname)
+        assert os.listdir(path) == []
+
+
+@pytest.mark.skipif(os.name != "posix", reason="requires process IDs")
+def test_file_lock_dead_owner_many_waiters():
+    "Only one of many waiters should break a lock and get it at a time"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.lock")
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        write_lock(fname, process.pid, socket.gethostname())
+        inside = []
+        overlaps = []
+
+        def work():
+            "Hold the lock for a moment and check nobody else has it"
+            with FileLock(fname, timeout=30, poll_interval=0.001):
+                inside.append(1)
+                overlaps.append(len(inside) > 1)
+                time.sleep(0.005)
+                inside.pop()
+
+        threads = [threading.Thread(target=work) for i in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert overlaps == [False] * 32
+        assert os.listdir(path) == []
+
+
+def test_file_lock_break_rereads_owner(monkeypatch):
+    "A lock taken by a new owner after the stale one was broken must be kept"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.lock")
+        # The new owner is alive but the waiter read the owner of the stale
+        # lock (on a host that stopped updating it) before it was replaced
+        write_lock(fname, os.getpid(), socket.gethostname())
+        reads = []
+        read_owner = _read_owner
+
+        def outdated_read_owner(name):
+            "Return the old owner on the first read"
+            reads.append(name)
+            if len(reads) == 1:
+                return {"pid": 1, "host": "other", "token": "old"}
+            return read_owner(name)
+
+        lock = FileLock(fname, stale_after=60)
+        monkeypatch.setattr(
+            lock, "_is_stale", lambda owner: owner.get("token") == "old"
+        )
+        monkeypatch.setattr("pooch.locking._read_owner", outdated_read_owner)
+        renames = []
+        monkeypatch.setattr(
+            "pooch.locking.os.rename", lambda *args: renames.append(args)
+        )
+        lock._break_if_stale()  # pylint: disable=protected-access
+        assert read_owner(fname)["token"] == "sometoken"
+        assert len(reads) == 2 and not renames
+        assert os.listdir(path) == ["data.lock"]
+
+
+def test_file_lock_crashed_breaker():
+    "Break files left by processes that crashed should be removed"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.lock")
+        write_lock(fname, os.getpid(), "some-other-host", age=10)
+        open(fname + ".break", "w").close()
+        os.utime(fname + ".break", (time.time() - 10, time.time() - 10))
+        with FileLock(fname, timeout=5, stale_after=5, poll_interval=0.01):
+            pass
+        assert os.listdir(path) == []
+
+
+def test_file_lock_stale():
+    "Locks that haven't been updated in a while should be broken"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.lock")
+        # A live process on another machine
+        write_lock(fname, os.getpid(), "some-other-host", age=10)
+        with pytest.raises(TimeoutError):
+            FileLock(fname, timeout=0.1, stale_after=60, poll_interval=0.01).acquire()
+        with FileLock(fname, timeout=5, stale_after=5, poll_interval=0.01):
+            pass
+        # Empty lock files left by crashes before the owner was written
+        open(fname, "w").close()
+        os.utime(fname, (time.time() - 10, time.time() - 10))
+        with FileLock(fname, timeout=5, stale_after=5, poll_interval=0.01):
+            pass
+
+
+def test_file_lock_heartbeat():
+    "The lock file should be kept fresh while the lock is held"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.lock")
+        with FileLock(fname, stale_after=0.2):
+            os.utime(fname, (0, 0))
+            time.sleep(0.2)
+            assert time.time() - os.stat(fname).st_mtime < 1
+
+
+def test_fetch_waits_for_lock():
+    "Concurrent fetches of the same file should only download it once"
+    downloads = []
+
+    def download(url, output_file, pup):
+        "Count the downloads and take a while to finish"
+        downloads.append(url)
+        time.sleep(0.1)
+        copy_downloader(url, output_file, pup)
+
+    with TemporaryDirectory() as local_store:
+        pup = Pooch(path=local_store, base_url=DATA_DIR + os.sep, registry=REGISTRY)
+        actions = []
+
+        def fetch():
+            "Fetch the file and record the action"
+            actions.append(
+                pup.fetch(
+                    "tiny-data.txt",
+                    processor=lambda fname, action, pup: action,
+                    downloader=download,
+                )
+            )
+
+        threads = [threading.Thread(target=fetch) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(downloads) == 1
+        assert sorted(actions) == ["download", "fetch", "fetch", "fetch"]
+        check_tiny_data(os.path.join(local_store, "tiny-data.txt"))
+        assert os.listdir(os.path.join(local_store, ".pooch", "locks")) == []
+
+
+def test_single_flight_threads():
+    "Concurrent calls with the same key should run the function once"
+    flights = SingleFlight()
+    calls = []
+    barrier = threading.Barrier(4, timeout=10)
+    results = []
+
+    def slow(value):
+        "Record the call and take a while"
+        calls.append(value)
+        time.sleep(0.1)
+        return value * 2
+
+    def call():
+        "Wait for all threads before calling"
+        barrier.wait()
+        results.append(flights.run("key", slow, 21))
+
+    threads = [threading.Thread(target=call) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [21]
+    assert results == [42] * 4
+    # Calls after the first one finished run the function again
+    assert flights.run("key", slow, 1) == 2
+    assert calls == [21, 1]
+
+
+def test_single_flight_errors():
+    "Errors should be raised for all callers waiting on the same call"
+    flights = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def fail():
+        "Raise an exception after a while"
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("Nope")
+
+    def call():
+        "Wait for the first call to start"
+        started.wait()
+        try:
+            flights.run("key", fail)
+        except ValueError as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    with pytest.raises(ValueError):
+        flights.run("key", fail)
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_single_flight_coroutines():
+    "Concurrent coroutines with the same key should share the call"
+    flights = SingleFlight()
+    calls = []
+
+    async def slow(value):
+        "Record the call and take a while"
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        return value * 2
+
+    async def main():
+        "Run several calls at once"
+        return await asyncio.gather(
+            flights.arun("key", slow, 1),
+            flights.arun("key", slow, 1),
+            flights.arun("other", slow, 2),
+        )
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(main()) == [2, 2, 4]
+    finally:
+        loop.close()
+    assert sorted(calls) == [1, 2]
+
+
+def test_fetch_single_flight():
+    "Concurrent fetches in the same process should share the processing"
+    processed = []
+    barrier = threading.Barrier(4, timeout=10)
+
+    def download(url, output_file, pup):
+        "Take a while to download"
+        time.sleep(0.1)
+        copy_downloader(url, output_file, pup)
+
+    def processor(fname, action, pup):  # pylint: disable=unused-argument
+        "Count the calls"
+        processed.append(action)
+        return action
+
+    with TemporaryDirectory() as local_store:
+        pup = Pooch(path=local_store, base_url=DATA_DIR + os.sep, registry=REGISTRY)
+        actions = []
+
+        def fetch():
+            "Fetch the file at the same time as the other threads"
+            barrier.wait()
+            actions.append(
+                pup.fetch("tiny-data.txt", processor=processor, downloader=download)
+            )
+
+        threads = [threading.Thread(target=fetch) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert processed == ["download"]
+        assert actions == ["download"] * 4
+        # The Pooch can still be pickled after fetching
+        copy = pickle.loads(pickle.dumps(pup))
+        assert copy.fetch("tiny-data.txt", processor=processor) == "fetch"
@@ -0,0 +1,269 @@
+"""
+Test the registry backends.
+"""
+import io
+import os
+import bz2
+import gzip
+import lzma
+import pickle
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from ..core import Pooch
+from ..registry import (
+    SQLiteRegistry,
+    CompactRegistry,
+    convert_registry,
+    read_registry,
+    iter_registry,
+)
+from ..utils import hash_matches
+
+from .utils import (
+    pooch_test_registry,
+    check_tiny_data,
+    check_large_data,
+    serve_directory,
+)
+
+DATA_DIR = str(Path(__file__).parent / "data")
+REGISTRY = pooch_test_registry()
+
+
+def test_sqlite_registry_mapping():
+    "Should behave like a dictionary"
+    with TemporaryDirectory() as path:
+        registry = SQLiteRegistry(os.path.join(path, "registry.db"))
+        assert len(registry) == 0
+        registry.update(REGISTRY)
+        assert dict(registry) == REGISTRY
+        assert list(registry) == sorted(REGISTRY)
+        registry["tiny-data.txt"] = "md5:some-hash"
+        assert registry["tiny-data.txt"] == "md5:some-hash"
+        del registry["tiny-data.txt"]
+        assert "tiny-data.txt" not in registry
+        with pytest.raises(KeyError):
+            registry["tiny-data.txt"]  # pylint: disable=pointless-statement
+        with pytest.raises(KeyError):
+            del registry["tiny-data.txt"]
+        # URLs are only available for the files that have them
+        urls = registry.urls
+        assert len(urls) == 0
+        urls["large-data.txt"] = "http://some.link.com/large-data.txt"
+        assert dict(urls) == {"large-data.txt": "http://some.link.com/large-data.txt"}
+        del urls["large-data.txt"]
+        assert "large-data.txt" not in urls
+        assert "large-data.txt" in registry
+        # Changes are visible to other connections and after pickling
+        other = pickle.loads(pickle.dumps(registry))
+        assert dict(other) == dict(registry)
+
+
+def test_sqlite_registry_threads():
+    "Each thread should be able to use the registry"
+    with TemporaryDirectory() as path:
+        registry = SQLiteRegistry(os.path.join(path, "registry.db"))
+        registry.update(REGISTRY)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(dict(registry)))
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [REGISTRY] * 4
+
+
+def test_convert_registry():
+    "Should match the result of loading the text file into dictionaries"
+    with TemporaryDirectory() as path:
+        source = os.path.join(DATA_DIR, "registry-custom-url.txt")
+        pup = Pooch(path="", base_url="")
+        pup.load_registry(source)
+        registry = convert_registry(source, os.path.join(path, "registry.db"))
+        assert dict(registry) == pup.registry
+        assert dict(registry.urls) == pup.urls
+
+
+def test_sqlite_registry_load_invalid():
+    "Invalid files shouldn't leave a partially loaded registry"
+    with TemporaryDirectory() as path:
+        pup = Pooch(
+            path=path,
+            base_url="",
+            registry=SQLiteRegistry(os.path.join(path, "registry.db")),
+        )
+        with pytest.raises(OSError):
+            pup.load_registry(os.path.join(DATA_DIR, "registry-invalid.txt"))
+        assert len(pup.registry) == 0
+
+
+def test_pooch_sqlite_registry():
+    "Should fetch files using the database as the registry and URLs"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            registry = SQLiteRegistry(os.path.join(local_store, "registry.db"))
+            pup = Pooch(
+                path=os.path.join(local_store, "data"),
+                base_url="http://wrong.url/",
+                registry=registry,
+                urls=registry.urls,
+            )
+            pup.load_registry(os.path.join(DATA_DIR, "registry.txt"))
+            pup.urls["tiny-data.txt"] = server.url + "tiny-data.txt"
+            assert registry.urls["tiny-data.txt"] == pup.get_url("tiny-data.txt")
+            for fname in pup.fetch_many(["tiny-data.txt"] * 3):
+                check_tiny_data(fname)
+            assert len(server.requests) == 1
+
+
+def test_compact_registry_round_trip():
+    "Should return exactly the hashes that were stored"
+    hashes = {
+        "a.txt": "baee0894dba14b12085eacb204284b97e362f4f3e5a5807693cc90ef415c1b2d",
+        "b.txt": "md5:70e2afd3fd7e336ae478b1e740a5f08e",
+        "c.txt": "SHA1:A3E0E4F0E0A6B0F0C8D1A8E2F6B8C0D4E1F2A3B4",
+        "d.txt": "9081wo2eb2gc0u...",
+        "e.txt": "a:b:c0ffee",
+        "f.txt": "",
+        "dados/ção.txt": "sha512:" + "ab" * 64,
+    }
+    registry = CompactRegistry(hashes)
+    assert dict(registry) == hashes
+    assert list(registry) == sorted(hashes, key=lambda name: name.encode("utf-8"))
+    known_hash = registry["b.txt"]
+    assert known_hash.algorithm == "md5"
+    assert known_hash.digest == "70e2afd3fd7e336ae478b1e740a5f08e"
+    assert registry["a.txt"].algorithm == "sha256"
+    assert registry["e.txt"].algorithm == "a"
+    assert "g.txt" not in registry
+    assert 1 not in registry
+    # Pickling keeps all entries
+    assert dict(pickle.loads(pickle.dumps(registry))) == hashes
+
+
+def test_compact_registry_changes():
+    "Setting and deleting entries should work before and after compacting"
+    registry = CompactRegistry(pooch_test_registry())
+    expected = pooch_test_registry()
+    for compact in [False, True]:
+        registry["new.txt"] = expected["new.txt"] = "md5:" + "0" * 32
+        registry["tiny-data.txt"] = expected["tiny-data.txt"] = "md5:" + "1" * 32
+        del registry["large-data.txt"]
+        del expected["large-data.txt"]
+        if compact:
+            registry.compact()
+        assert registry["tiny-data.txt"] == "md5:" + "1" * 32
+        assert "large-data.txt" not in registry
+        with pytest.raises(KeyError):
+            registry["large-data.txt"]  # pylint: disable=pointless-statement
+        with pytest.raises(KeyError):
+            del registry["large-data.txt"]
+        assert dict(registry) == expected
+        assert len(registry) == len(expected)
+        registry["large-data.txt"] = expected["large-data.txt"] = (
+            "98de171fb320da82982e6bf0f3994189fff4b42b23328769afce12bdd340444a"
+        )
+    with pytest.raises(TypeError):
+        registry["bad.txt"] = 1234
+
+
+def test_compact_registry_many_entries():
+    "Entries added one at a time should be merged in batches"
+    registry = CompactRegistry()
+    expected = {}
+    for i in range(10000):
+        name = "file-{}.txt".format(9999 - i)
+        expected[name] = registry[name] = "md5:{:032x}".format(i)
+    assert len(registry._pending) < 10000  # pylint: disable=protected-access
+    assert dict(registry) == expected
+
+
+def test_pooch_compact_registry():
+    "Should be usable as the registry of a Pooch"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = Pooch(
+                path=local_store, base_url=server.url, registry=CompactRegistry()
+            )
+            pup.load_registry(os.path.join(DATA_DIR, "registry.txt"))
+            check_tiny_data(pup.fetch("tiny-data.txt"))
+            fname = pup.fetch("large-data.txt")
+            check_large_data(fname)
+            assert hash_matches(fname, pup.registry["large-data.txt"])
+
+
+@pytest.mark.parametrize(
+    "opener", [open, gzip.open, lzma.open, bz2.open], ids=["plain", "gz", "xz", "bz2"]
+)
+def test_read_registry_compressed(opener):
+    "Compressed registry files should be read transparently"
+    with open(os.path.join(DATA_DIR, "registry-custom-url.txt"), "rb") as fin:
+        content = fin.read()
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "registry")
+        with opener(fname, "wb") as fout:
+            fout.write(content)
+        hashes, urls = read_registry(fname)
+        assert hashes == REGISTRY
+        assert urls == {"tiny-data.txt": "https://some-site/tiny-data.txt"}
+        assert len(list(iter_registry(fname))) == len(REGISTRY)
+        with open(fname, "rb") as fin:
+            assert read_registry(fin) == (hashes, urls)
+        pup = Pooch(path=path, base_url="")
+        pup.load_registry(fname)
+        assert pup.registry == REGISTRY
+
+
+def test_read_registry_matches_iter_registry():
+    "Should give the same entries as reading them one at a time"
+    lines = [
+        "a.txt 1a2b",
+        "",
+        "  b.txt\tmd5:3c4d  ",
+        "c.txt 5e6f http://some.link.com/c.txt",
+        "dados/ção.txt 7a8b",
+        "d.txt\u00a0e.txt 9c0d",
+        "e.txt 0011\r",
+        "a.txt 2233",
+    ]
+    content = "\n".join(lines)
+    expected = {}
+    expected_urls = {}
+    for name, known_hash, url in iter_registry(io.StringIO(content)):
+        expected[name] = known_hash
+        if url is not None:
+            expected_urls[name] = url
+    for fin in [io.StringIO(content), io.BytesIO(content.encode("utf-8"))]:
+        hashes, urls = read_registry(fin)
+        assert hashes == expected
+        assert urls == expected_urls
+    assert expected["a.txt"] == "2233"
+
+
+def test_read_registry_reports_all_errors():
+    "All invalid lines should be in the error message"
+    content = "a.txt 1a2b\nb.txt\nc.txt 3c4d\nd.txt 1 2 3\ne.txt 5e6f\n"
+    with pytest.raises(OSError) as error:
+        read_registry(io.BytesIO(content.encode()))
+    message = str(error.value)
+    assert "line 2 has 1 ('b.txt')" in message
+    assert "line 4 has 4 ('d.txt 1 2 3')" in message
+    # Valid entries are read before the error is raised
+    entries = []
+    with pytest.raises(OSError) as error:
+        for entry in iter_registry(io.StringIO(content)):
+            entries.append(entry[0])
+    assert entries == ["a.txt", "c.txt", "e.txt"]
+    assert "line 2 has 1 ('b.txt')" in str(error.value)
+    # The registry shouldn't change if the file is invalid
+    pup = Pooch(path="", base_url="", registry={})
+    with pytest.raises(OSError):
+        pup.load_registry(io.StringIO(content))
+    assert pup.registry == {}
@@ -0,0 +1,116 @@
+"""
+Test the HTTP mirror server.
+"""
+import os
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from contextlib import contextmanager
+
+import pytest
+import requests
+
+from .. import Pooch
+from ..__main__ import main
+from ..server import make_server
+
+from .utils import (
+    pooch_test_registry,
+    check_tiny_data,
+    check_large_data,
+    serve_directory,
+)
+
+DATA_DIR = str(Path(__file__).parent / "data")
+REGISTRY = pooch_test_registry()
+
+
+@contextmanager
+def mirror(origin, registry):
+    "Run a mirror of the origin with its local storage in a temporary folder"
+    with TemporaryDirectory() as local_store:
+        pup = Pooch(path=local_store, base_url=origin, registry=registry)
+        server = make_server(pup, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+
+def test_mirror_downloads_once():
+    "Files should be downloaded once from the origin for all clients"
+    with serve_directory(DATA_DIR) as origin:
+        with mirror(origin.url, REGISTRY) as server:
+            with TemporaryDirectory() as local_store:
+                pup = Pooch(path=local_store, base_url=server.url, registry=REGISTRY)
+                check_tiny_data(pup.fetch("tiny-data.txt"))
+            # Many clients at the same time share the download by the mirror
+            results = []
+
+            def fetch():
+                "Fetch the file with a new Pooch"
+                with TemporaryDirectory() as path:
+                    client = Pooch(path=path, base_url=server.url, registry=REGISTRY)
+                    check_large_data(client.fetch("large-data.txt"))
+                    results.append(True)
+
+            threads = [threading.Thread(target=fetch) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert len(results) == 8
+            assert [path for __, path, __ in origin.requests] == [
+                "/tiny-data.txt",
+                "/large-data.txt",
+            ]
+
+
+def test_mirror_ranges():
+    "Should send the ranges of the file that were requested"
+    fname = os.path.join(DATA_DIR, "tiny-data.txt")
+    with open(fname, "rb") as fin:
+        data = fin.read()
+    with mirror(DATA_DIR + os.sep, REGISTRY) as server:
+        url = server.url + "tiny-data.txt"
+        response = requests.get(url, headers={"Range": "bytes=5-9"})
+        assert response.status_code == 206
+        assert response.content == data[5:10]
+        assert response.headers["Content-Range"] == "bytes 5-9/{}".format(len(data))
+        response = requests.get(url, headers={"Range": "bytes=-4"})
+        assert response.content == data[-4:]
+        response = requests.get(url, headers={"Range": "bytes=100000-"})
+        assert response.status_code == 416
+        # Ranges for a different version of the file are ignored
+        headers = {"Range": "bytes=5-9", "If-Range": '"some-other-etag"'}
+        response = requests.get(url, headers=headers)
+        assert response.status_code == 200
+        assert response.content == data
+        etag = response.headers["ETag"]
+        assert etag == '"{}"'.format(REGISTRY["tiny-data.txt"])
+        response = requests.head(url)
+        assert response.headers["Content-Length"] == str(len(data))
+        assert not response.content
+
+
+def test_mirror_errors():
+    "Should give 404 for files not in the registry and 502 for failed fetches"
+    registry = dict(REGISTRY)
+    registry["missing.txt"] = registry["tiny-data.txt"]
+    with mirror(DATA_DIR + os.sep, registry) as server:
+        assert requests.get(server.url + "not-in-registry.txt").status_code == 404
+        assert requests.get(server.url + "missing.txt").status_code == 502
+        # Registry files can't be used to read other files
+        assert requests.get(server.url + "../core.py").status_code == 404
+
+
+def test_main_without_command(capsys):
+    "Should print the help if no command is given"
+    assert main([]) == 1
+    assert "serve" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        main(["serve", "some-path"])
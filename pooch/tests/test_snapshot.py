@@ -0,0 +1,114 @@
+"""
+Test saving and restoring Pooch instances from snapshots.
+"""
+import os
+import shutil
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from .. import create
+from ..registry import CompactRegistry
+from ..snapshot import warm_start, save_snapshot, load_snapshot
+
+from .utils import pooch_test_registry, check_tiny_data, serve_directory
+
+DATA_DIR = str(Path(__file__).parent / "data")
+REGISTRY = pooch_test_registry()
+
+
+def test_warm_start():
+    "Should only call the setup function if the registry file changed"
+    with TemporaryDirectory() as local_store:
+        registry = os.path.join(local_store, "registry.txt")
+        shutil.copy(os.path.join(DATA_DIR, "registry.txt"), registry)
+        snapshot = os.path.join(local_store, "snapshots", "pooch.snapshot")
+        calls = []
+
+        def setup():
+            "Create the Pooch and count the calls"
+            calls.append(1)
+            pup = create(path=local_store, base_url="http://some.link.com/")
+            pup.load_registry(registry)
+            return pup
+
+        for i in range(3):
+            pup = warm_start(snapshot, setup, sources=[registry])
+            assert pup.registry == REGISTRY
+        assert len(calls) == 1
+        # Touching the file without changing it keeps the snapshot
+        os.utime(registry, (0, 0))
+        warm_start(snapshot, setup, sources=[registry])
+        assert len(calls) == 1
+        # Modifying the file invalidates the snapshot
+        with open(registry, "a") as fout:
+            fout.write("new.txt 1a2b\n")
+        pup = warm_start(snapshot, setup, sources=[registry])
+        assert len(calls) == 2
+        assert pup.registry["new.txt"] == "1a2b"
+        # Different sources also invalidate the snapshot
+        assert load_snapshot(snapshot) is None
+        assert load_snapshot(snapshot, sources=[registry]) is not None
+
+
+def test_warm_start_key():
+    "Should make the snapshot again if the configuration changed"
+    with TemporaryDirectory() as local_store:
+        registry = os.path.join(local_store, "registry.txt")
+        shutil.copy(os.path.join(DATA_DIR, "registry.txt"), registry)
+        snapshot = os.path.join(local_store, "pooch.snapshot")
+
+        def setup(version):
+            "Create the Pooch for a version"
+            pup = create(
+                path=local_store,
+                base_url="http://some.link.com/{version}/",
+                version=version,
+            )
+            pup.load_registry(registry)
+            return pup
+
+        for version in ["v0.1", "v0.2", "v0.2"]:
+            pup = warm_start(
+                snapshot, partial(setup, version), sources=[registry], key=version
+            )
+            assert pup.base_url == "http://some.link.com/{}/".format(version)
+            assert pup.abspath == Path(local_store, version)
+        assert load_snapshot(snapshot, sources=[registry]) is None
+        assert load_snapshot(snapshot, sources=[registry], key="v0.2") is not None
+
+
+def test_load_snapshot_invalid():
+    "Missing and corrupted snapshots should be ignored"
+    with TemporaryDirectory() as local_store:
+        snapshot = os.path.join(local_store, "pooch.snapshot")
+        assert load_snapshot(snapshot) is None
+        with open(snapshot, "wb") as fout:
+            fout.write(b"not a snapshot")
+        assert load_snapshot(snapshot) is None
+        # Pooch instances that can't be pickled aren't saved
+        pup = create(path=local_store, base_url="", registry=REGISTRY)
+        pup.urls = {"tiny-data.txt": lambda: None}
+        save_snapshot(pup, snapshot)
+        assert load_snapshot(snapshot) is None
+
+
+def test_snapshot_keeps_verified_files():
+    "Files verified before the snapshot shouldn't need to be hashed again"
+    with serve_directory(DATA_DIR) as server:
+        with TemporaryDirectory() as local_store:
+            pup = create(
+                path=local_store,
+                base_url=server.url,
+                registry=CompactRegistry(REGISTRY),
+            )
+            fname = pup.fetch("tiny-data.txt")
+            snapshot = os.path.join(local_store, "pooch.snapshot")
+            save_snapshot(pup, snapshot)
+            # Without the index file, only the snapshot knows about the file
+            os.remove(os.path.join(local_store, ".pooch", "index.json"))
+            restored = load_snapshot(snapshot)
+            assert dict(restored.registry) == REGISTRY
+            assert restored.hash_index.lookup(fname, REGISTRY["tiny-data.txt"])
+            check_tiny_data(restored.fetch("tiny-data.txt"))
+            assert len(server.requests) == 1
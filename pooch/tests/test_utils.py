@@ -9,14 +9,21 @@ from tempfile import NamedTemporaryFile, TemporaryDirectory
 
 import pytest
 
+try:
+    import tqdm
+except ImportError:
+    tqdm = None
+
 from ..core import Pooch
 from ..utils import (
     make_registry,
     parse_url,
     make_local_storage,
     file_hash,
+    update_hash,
     hash_matches,
     temporary_file,
+    HashedWriter,
 )
 from .utils import check_tiny_data, capture_log
 
@@ -118,6 +125,91 @@ def test_registry_builder_recursive():
         os.remove(outfile.name)
 
 
+@pytest.mark.parametrize("workers", [1, 3])
+def test_registry_builder_parallel(workers):
+    "Should write the same sorted registry with any number of workers"
+    with TemporaryDirectory() as path:
+        data = os.path.join(path, "data")
+        os.makedirs(os.path.join(data, "sub"))
+        expected = []
+        for i in range(50):
+            name = "sub/file-{}.txt".format(i) if i % 2 else "file-{}.txt".format(i)
+            with open(os.path.join(data, name), "w") as fout:
+                fout.write("content of file {}".format(i) * i)
+            expected.append("{} {}\n".format(name, file_hash(os.path.join(data, name))))
+        output = os.path.join(path, "registry.txt")
+        make_registry(data, output, workers=workers)
+        with open(output) as fin:
+            assert fin.read() == "".join(sorted(expected))
+
+
+def test_registry_builder_incremental(monkeypatch):
+    "Should only hash new and modified files and give the same result"
+    with TemporaryDirectory() as path:
+        data = os.path.join(path, "data")
+        os.makedirs(os.path.join(data, "sub"))
+        for name in ["a.txt", "b.txt", "sub/c.txt", "sub/d.txt"]:
+            with open(os.path.join(data, name), "w") as fout:
+                fout.write("content of {}".format(name))
+            os.utime(os.path.join(data, name), (1e9, 1e9))
+        output = os.path.join(path, "registry.txt")
+        make_registry(data, output, incremental=True)
+        assert os.path.exists(output + ".stat")
+        hashed = []
+
+        def count_file_hash(fname, alg="sha256"):
+            "Keep track of the files that were hashed"
+            hashed.append(os.path.relpath(fname, data).replace(os.sep, "/"))
+            return file_hash(fname, alg=alg)
+
+        monkeypatch.setattr("pooch.utils.file_hash", count_file_hash)
+        # Same size but different modification time and content
+        with open(os.path.join(data, "a.txt"), "w") as fout:
+            fout.write("CONTENT of a.txt")
+        os.utime(os.path.join(data, "a.txt"), (1.5e9, 1.5e9))
+        with open(os.path.join(data, "sub", "e.txt"), "w") as fout:
+            fout.write("a new file")
+        os.utime(os.path.join(data, "sub", "e.txt"), (1.5e9, 1.5e9))
+        os.remove(os.path.join(data, "sub", "c.txt"))
+        make_registry(data, output, incremental=True)
+        assert sorted(hashed) == ["a.txt", "sub/e.txt"]
+        # Running again shouldn't hash anything
+        del hashed[:]
+        make_registry(data, output, incremental=True)
+        assert hashed == []
+        # Files with modification times after the registry was made are always
+        # hashed since they might change again without changing the time
+        os.utime(os.path.join(data, "b.txt"), (2e9, 2e9))
+        for i in range(2):
+            make_registry(data, output, incremental=True)
+        assert hashed == ["b.txt", "b.txt"]
+        with open(output, "rb") as fin:
+            incremental = fin.read()
+        make_registry(data, output)
+        with open(output, "rb") as fin:
+            assert fin.read() == incremental
+        assert len(incremental.splitlines()) == 4
+
+
+@pytest.mark.skipif(tqdm is not None, reason="tqdm must be missing")
+def test_registry_builder_progressbar_without_tqdm():
+    "Should raise an exception if trying to use a progress bar without tqdm"
+    with pytest.raises(ValueError):
+        make_registry(DATA_DIR, "registry.txt", progressbar=True)
+    assert not os.path.exists("registry.txt")
+
+
+@pytest.mark.skipif(tqdm is None, reason="requires tqdm")
+def test_registry_builder_progressbar(capsys):
+    "Should show the amount of data that was hashed"
+    with TemporaryDirectory() as path:
+        output = os.path.join(path, "registry.txt")
+        make_registry(DATA_DIR, output, progressbar=True)
+        with open(output) as fin:
+            assert fin.read() == REGISTRY_RECURSIVE
+    assert "100%" in capsys.readouterr().err
+
+
 def test_parse_url():
     "Parse URL into 3 components"
     url = "http://127.0.0.1:8080/test.nc"
@@ -142,6 +234,26 @@ def test_file_hash_invalid_algorithm():
     assert "'blah'" in str(exc.value)
 
 
+@pytest.mark.parametrize("size", [0, 10, 1000, 5000, 20000])
+def test_file_hash_sizes(monkeypatch, size):
+    "Should give the same hash when reading in one go or in chunks"
+    monkeypatch.setattr("pooch.utils.HASH_CHUNK_SIZE", 1024)
+    data = os.urandom(size)
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "data.bin")
+        with open(fname, "wb") as fout:
+            fout.write(data)
+        for alg in ["sha256", "md5"]:
+            assert file_hash(fname, alg=alg) == hashlib.new(alg, data).hexdigest()
+        # Starting from the middle of the file
+        hasher = hashlib.sha256()
+        with open(fname, "rb") as fin:
+            fin.seek(size // 3)
+            update_hash(hasher, fin)
+            assert fin.tell() == size
+        assert hasher.hexdigest() == hashlib.sha256(data[size // 3 :]).hexdigest()
+
+
 def test_hash_matches():
     "Make sure the hash checking function works"
     fname = os.path.join(DATA_DIR, "tiny-data.txt")
@@ -224,3 +336,45 @@ def test_temporary_file_exception():
             raise ValueError("Nooooooooo!")
     except ValueError:
         assert not Path(tmp).exists()
+
+
+def test_hashed_writer():
+    "The hash of the written data should match the hash of the file"
+    with TemporaryDirectory() as path:
+        fname = os.path.join(path, "output.txt")
+        with HashedWriter(fname, alg="md5") as writer:
+            assert writer.hexdigest() is None
+            assert os.fspath(writer) == fname
+            writer.write(b"some ")
+            writer.write(b"data")
+            assert writer.tell() == 9
+        assert writer.closed
+        assert writer.hexdigest() == file_hash(fname, alg="md5")
+    with pytest.raises(ValueError) as exc:
+        HashedWriter("something", alg="blah")
+    assert "'blah'" in str(exc.value)
+
+
+@pytest.mark.parametrize("kernel", [True, False], ids=["kernel", "no-kernel"])
+@pytest.mark.parametrize("size", [0, 1000, 20000])
+def test_hashed_writer_copy_from(monkeypatch, size, kernel):
+    "Copying should hash files in the same pass with or without the kernel"
+    monkeypatch.setattr("pooch.utils.HASH_CHUNK_SIZE", 1024)
+    if not kernel:
+        monkeypatch.setattr("pooch.utils.reflink", lambda source, destination: False)
+        monkeypatch.setattr("pooch.utils._kernel_copy", lambda *args: None)
+    data = os.urandom(size)
+    with TemporaryDirectory() as path:
+        source = os.path.join(path, "source.bin")
+        with open(source, "wb") as fout:
+            fout.write(data)
+        fname = os.path.join(path, "output.bin")
+        with HashedWriter(fname) as writer:
+            assert writer.copy_from(source) == size
+            # Appending after the copied data
+            writer.write(b"more data")
+            assert writer.copy_from(source) == size
+        expected = data + b"more data" + data
+        with open(fname, "rb") as fin:
+            assert fin.read() == expected
+        assert writer.hexdigest() == hashlib.sha256(expected).hexdigest()
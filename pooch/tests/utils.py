@@ -3,8 +3,13 @@ Utilities for testing code.
 """
 import os
 import io
+import shutil
 import logging
+import threading
 from contextlib import contextmanager
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
 
 from ..version import full_version
 from ..utils import check_version, get_logger
@@ -80,6 +85,18 @@ def pooch_test_registry():
     return registry
 
 
+def copy_downloader(url, output_file, pooch):  # pylint: disable=unused-argument
+    """
+    Downloader that copies a local file given as the URL (for offline tests).
+    """
+    with open(url, "rb") as fin:
+        if hasattr(output_file, "write"):
+            shutil.copyfileobj(fin, output_file)
+        else:
+            with open(output_file, "wb") as fout:
+                shutil.copyfileobj(fin, fout)
+
+
 @contextmanager
 def capture_log(level=logging.DEBUG):
     """
@@ -96,3 +113,110 @@ def capture_log(level=logging.DEBUG):
     get_logger().addHandler(handler)
     yield log_file
     get_logger().removeHandler(handler)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    "HTTP server that handles each connection in a thread"
+    daemon_threads = True
+
+
+class _RequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serve files with keep-alive and range requests and record what was used.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        "Don't print anything to stderr"
+
+    def handle(self):
+        self.server.connections.append(self.client_address)
+        super().handle()
+
+    def do_GET(self):
+        self._send_file(send_body=True)
+
+    def do_HEAD(self):
+        self._send_file(send_body=False)
+
+    def _send_file(self, send_body):
+        "Send the whole file or the range that was requested"
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        with open(path, "rb") as fin:
+            data = fin.read()
+        stat = os.stat(path)
+        etag = '"{}-{}"'.format(stat.st_size, stat.st_mtime_ns)
+        status, start, end = 200, 0, len(data)
+        requested = self.headers.get("Range")
+        if (
+            requested is not None
+            and self.server.ranges
+            and self.headers.get("If-Range", etag) == etag
+        ):
+            first, last = requested.split("=")[1].split("-")
+            status, start = 206, int(first)
+            if last:
+                end = min(int(last) + 1, len(data))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(len(data)))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        body = data[start:end]
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header(
+                "Content-Range", "bytes {}-{}/{}".format(start, end - 1, len(data))
+            )
+        self.end_headers()
+        if not send_body:
+            return
+        if self.server.interrupt_after is not None:
+            # Send only part of the data and drop the connection once
+            body = body[: self.server.interrupt_after]
+            self.server.interrupt_after = None
+            self.close_connection = True
+        self.wfile.write(body)
+
+
+@contextmanager
+def serve_directory(directory):
+    """
+    Serve the files in a directory over HTTP on localhost (for offline tests).
+
+    Yields
+    ------
+    server : http.server.HTTPServer
+        The running server. The base URL is in the ``url`` attribute (ends in
+        ``'/'``), the addresses of all clients that opened a connection are in
+        the ``connections`` list, and the method, path, and headers of each
+        request for a file are in ``requests``. Set ``ranges`` to False to
+        disable range requests. Set ``interrupt_after`` to a number of bytes
+        to drop the connection of the next download after sending them.
+    """
+    handler = partial(_RequestHandler, directory=str(directory))
+    server = _ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.url = "http://127.0.0.1:{}/".format(server.server_address[1])
+    server.connections = []
+    server.requests = []
+    server.ranges = True
+    server.interrupt_after = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -3,6 +3,11 @@ Misc utilities
 """
 import logging
 import os
+import sys
+import json
+import time
+import itertools
+import collections
 import tempfile
 from pathlib import Path
 import hashlib
@@ -10,12 +15,17 @@ from urllib.parse import urlsplit
 from contextlib import contextmanager
 
 import appdirs
-from packaging.version import Version
 
 
+# Files are read into a reused buffer of at least this many bytes to hash them
+HASH_CHUNK_SIZE = 2**20
+
 LOGGER = logging.Logger("pooch")
 LOGGER.addHandler(logging.StreamHandler())
 
+# Folder inside the local storage where Pooch keeps its own bookkeeping files
+METADATA_DIR = ".pooch"
+
 
 def get_logger():
     r"""
@@ -94,17 +104,131 @@ def file_hash(fname, alg="sha256"):
     """
     if alg not in hashlib.algorithms_available:
         raise ValueError("Algorithm '{}' not available in hashlib".format(alg))
-    # Calculate the hash in chunks to avoid overloading the memory
-    chunksize = 65536
     hasher = hashlib.new(alg)
-    with open(fname, "rb") as fin:
-        buff = fin.read(chunksize)
-        while buff:
-            hasher.update(buff)
-            buff = fin.read(chunksize)
+    # Unbuffered so that the data is read straight into our buffer
+    with open(str(fname), "rb", buffering=0) as fin:
+        update_hash(hasher, fin)
     return hasher.hexdigest()
 
 
+def update_hash(hasher, fin):
+    """
+    Update a hash with the data from the current position to the end of a file.
+
+    Avoids copying the data as much as possible. Files smaller than
+    :data:`HASH_CHUNK_SIZE` are read with a single call. Larger files are
+    read in chunks into a buffer that is reused (no new objects are created
+    for each chunk). Chunks are larger for file systems with larger blocks
+    (like some network file systems).
+
+    Parameters
+    ----------
+    hasher : hashlib hash object
+        The hash to update (for example, ``hashlib.sha256()``).
+    fin : file object
+        A file opened in binary mode. Its position is moved to the end.
+
+    """
+    stat = os.fstat(fin.fileno())
+    remaining = stat.st_size - fin.tell()
+    chunk_size = max(HASH_CHUNK_SIZE, getattr(stat, "st_blksize", 0))
+    buffer = bytearray(max(min(remaining + 1, chunk_size), 4096))
+    with memoryview(buffer) as view:
+        size = fin.readinto(buffer)
+        while size:
+            hasher.update(view[:size])
+            size = fin.readinto(buffer)
+
+
+def _copy_hashed(fin, fout, hasher):
+    """
+    Append the rest of a file to another and update a hash in the same pass.
+
+    The data is copied by the kernel (:func:`os.copy_file_range` or
+    :func:`os.sendfile`) in chunks and each chunk is read back from *fout*
+    into a reused buffer right after it's copied (while it's in the page
+    cache) to hash the data that was actually written. Whatever the kernel
+    can't copy is read into the buffer and written. Both files must be
+    unbuffered (or flushed) and *fout* must be readable.
+    """
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    with memoryview(buffer) as view:
+        count = _kernel_copy(fin.fileno(), fout.fileno(), len(buffer))
+        while count:
+            fout.seek(-count, os.SEEK_CUR)
+            size = 0
+            while size < count:
+                read = fout.readinto(view[size:count])
+                if not read:
+                    raise OSError(
+                        "Could not read back the data copied to '{}'.".format(fout.name)
+                    )
+                size += read
+            hasher.update(view[:count])
+            count = _kernel_copy(fin.fileno(), fout.fileno(), len(buffer))
+        size = fin.readinto(buffer)
+        while size:
+            hasher.update(view[:size])
+            fout.write(view[:size])
+            size = fin.readinto(buffer)
+
+
+def _kernel_copy(source, destination, count):
+    """
+    Copy up to *count* bytes between the current positions of two file
+    descriptors without passing them through Python. Returns the number of
+    bytes copied or None if the system can't copy between these files.
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            return os.copy_file_range(source, destination, count)
+        except OSError:
+            pass
+    # sendfile only accepts regular files as the output on Linux
+    if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        try:
+            return os.sendfile(destination, source, None, count)
+        except OSError:
+            pass
+    return None
+
+
+# The FICLONE request of ioctl on Linux
+FICLONE = 0x40049409
+
+
+def reflink(source, destination):
+    """
+    Try to make a copy-on-write clone of an open file into another.
+
+    Only possible on Linux file systems that support it (like Btrfs and XFS)
+    and if both files are on the same file system.
+
+    Parameters
+    ----------
+    source : int
+        File descriptor of the file to clone.
+    destination : int
+        File descriptor of the output file (opened for writing). Its content
+        is replaced by the content of *source*.
+
+    Returns
+    -------
+    cloned : bool
+        True if the file was cloned.
+
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl  # pylint: disable=import-outside-toplevel
+
+    try:
+        fcntl.ioctl(destination, FICLONE, source)
+    except OSError:
+        return False
+    return True
+
+
 def check_version(version, fallback="master"):
     """
     Check if a version is PEP440 compliant and there are no unreleased changes.
@@ -145,18 +269,32 @@ def check_version(version, fallback="master"):
     'dev'
 
     """
+    from packaging.version import Version  # pylint: disable=import-outside-toplevel
+
     parse = Version(version)
     if parse.local is not None:
         return fallback
     return version
 
 
-def make_registry(directory, output, recursive=True):
+def make_registry(
+    directory,
+    output,
+    recursive=True,
+    workers=None,
+    progressbar=False,
+    incremental=False,
+):
     """
     Make a registry of files and hashes for the given directory.
 
     This is helpful if you have many files in your test dataset as it keeps you
-    from needing to manually update the registry.
+    from needing to manually update the registry. The ``.pooch`` folder that
+    Pooch uses to keep track of verified files in a local storage is ignored.
+
+    Files are hashed in parallel threads (hashing doesn't hold the global
+    interpreter lock) and entries are written to *output* in sorted order as
+    soon as they're ready.
 
     Parameters
     ----------
@@ -168,29 +306,167 @@ def make_registry(directory, output, recursive=True):
     recursive : bool
         If True, will recursively look for files in subdirectories of
         *directory*.
+    workers : int or None
+        The number of files hashed at the same time. If None, will use the
+        number of CPUs.
+    progressbar : bool
+        If True, will print a progress bar of the amount of data hashed to
+        standard error (stderr). Requires `tqdm
+        <https://github.com/tqdm/tqdm>`__ to be installed.
+    incremental : bool
+        If True and *output* already exists, reuse its hashes for the files
+        that haven't changed since it was made instead of hashing them again.
+        The size and modification time of the files are saved to a
+        ``<output>.stat`` file to detect changes. New and modified files are
+        hashed and files that no longer exist are removed, so the result is
+        the same as making the registry from scratch.
 
     """
-    directory = Path(directory)
-    if recursive:
-        pattern = "**/*"
-    else:
-        pattern = "*"
+    # pylint: disable=import-outside-toplevel,too-many-locals
+    from concurrent.futures import ThreadPoolExecutor
+
+    if progressbar:
+        try:
+            from tqdm import tqdm
+        except ImportError:
+            raise ValueError("Missing package 'tqdm' required for progress bars.")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    directory = str(directory)
+    files = _list_files(directory, recursive)
+    started = time.time()
+    stats = {}
+    if incremental or progressbar:
+        stats = {fname: os.stat(os.path.join(directory, fname)) for fname in files}
+    unchanged = {}
+    if incremental:
+        unchanged = _unchanged_hashes(str(output), stats)
+
+    progress = None
+    if progressbar:
+        # Need to use ascii characters on Windows because there isn't
+        # always full unicode support
+        # (see https://github.com/tqdm/tqdm/issues/454)
+        progress = tqdm(
+            total=sum(
+                stats[fname].st_size for fname in files if fname not in unchanged
+            ),
+            ncols=79,
+            ascii=bool(sys.platform == "win32"),
+            unit="B",
+            unit_scale=True,
+            leave=True,
+        )
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+
+            def submit(fname):
+                "Start hashing a file in the background (if needed)"
+                if fname in unchanged:
+                    return fname, unchanged[fname]
+                return fname, executor.submit(file_hash, os.path.join(directory, fname))
+
+            with open(output, "w") as outfile:
+                # Only keep a few files ahead of the output in the queue so
+                # that memory use doesn't grow with the number of files
+                names = iter(files)
+                pending = collections.deque(
+                    submit(fname) for fname in itertools.islice(names, 4 * workers)
+                )
+                while pending:
+                    fname, future = pending.popleft()
+                    # Replace it with the next file in line
+                    for name in itertools.islice(names, 1):
+                        pending.append(submit(name))
+                    if isinstance(future, str):
+                        fhash = future
+                    else:
+                        fhash = future.result()
+                        if progress is not None:
+                            progress.update(stats[fname].st_size)
+                    # Only use Unix separators for the registry so that we
+                    # don't go insane dealing with file paths.
+                    outfile.write("{} {}\n".format(fname.replace("\\", "/"), fhash))
+    finally:
+        if progress is not None:
+            progress.close()
+    if incremental:
+        _save_stats(str(output), stats, started)
+
+
+def _list_files(directory, recursive):
+    """
+    Sorted names of the files in a directory relative to it.
+
+    Symbolic links are followed. The bookkeeping files that Pooch keeps in its
+    local storage folders are skipped.
+    """
+    if not recursive:
+        with os.scandir(directory) as entries:
+            return sorted(entry.name for entry in entries if entry.is_file())
+    files = []
+    for root, dirs, names in os.walk(directory, followlinks=True):
+        dirs[:] = [name for name in dirs if name != METADATA_DIR]
+        prefix = os.path.relpath(root, directory)
+        if prefix == os.curdir:
+            prefix = ""
+        files.extend(
+            os.path.join(prefix, name)
+            for name in names
+            if os.path.isfile(os.path.join(root, name))
+        )
+    return sorted(files)
+
 
-    files = sorted(
-        [
-            str(path.relative_to(directory))
-            for path in directory.glob(pattern)
-            if path.is_file()
-        ]
-    )
+def _unchanged_hashes(output, stats):
+    """
+    Get the hashes in an existing registry of the files that haven't changed.
 
-    hashes = [file_hash(str(directory / fname)) for fname in files]
+    Files are unchanged if their size and modification time are the same as
+    when the registry was made (saved in the ``.stat`` file). Files modified
+    while the registry was being made might have the same modification time
+    after another change and are never considered unchanged.
+    """
+    from .registry import read_registry  # pylint: disable=import-outside-toplevel
 
-    with open(output, "w") as outfile:
-        for fname, fhash in zip(files, hashes):
-            # Only use Unix separators for the registry so that we don't go
-            # insane dealing with file paths.
-            outfile.write("{} {}\n".format(fname.replace("\\", "/"), fhash))
+    try:
+        with open(output + ".stat") as fin:
+            content = json.load(fin)
+        saved, made = content["files"], content["time"]
+        hashes = read_registry(output)[0]
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+    unchanged = {}
+    for fname, stat in stats.items():
+        name = fname.replace("\\", "/")
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if (
+            name in hashes
+            and saved.get(name) == signature
+            and stat.st_mtime_ns < made * 1e9
+        ):
+            unchanged[fname] = hashes[name]
+    return unchanged
+
+
+def _save_stats(output, stats, started):
+    """
+    Save the size and modification time of the files in a registry.
+    """
+    content = {
+        "time": started,
+        "files": {
+            fname.replace("\\", "/"): [stat.st_size, stat.st_mtime_ns]
+            for fname, stat in stats.items()
+        },
+    }
+    path = os.path.dirname(os.path.abspath(output))
+    with temporary_file(path=path) as tmp:
+        with open(tmp, "w") as fout:
+            # Much faster than json.dump for large registries
+            fout.write(json.dumps(content))
+        os.replace(tmp, output + ".stat")
 
 
 def parse_url(url):
@@ -302,6 +578,8 @@ def hash_algorithm(hash_string):
     sha256
 
     """
+    if isinstance(hash_string, KnownHash):
+        return hash_string.algorithm
     parts = hash_string.split(":")
     if len(parts) == 1:
         algorithm = "sha256"
@@ -310,7 +588,78 @@ def hash_algorithm(hash_string):
     return algorithm
 
 
-def hash_matches(fname, known_hash, strict=False):
+def hash_digest(hash_string):
+    """
+    Parse the digest from the hash string (without the algorithm).
+
+    Parameters
+    ----------
+    hash_string : str
+        The hash string with optional algorithm prepended.
+
+    Returns
+    -------
+    hash_digest : str
+        The hash itself.
+
+    Examples
+    --------
+
+    >>> print(hash_digest("qouuwhwd2j192y1lb1iwgowdj2898wd2d9"))
+    qouuwhwd2j192y1lb1iwgowdj2898wd2d9
+    >>> print(hash_digest("md5:qouuwhwd2j192y1lb1iwgowdj2898wd2d9"))
+    qouuwhwd2j192y1lb1iwgowdj2898wd2d9
+
+    """
+    if isinstance(hash_string, KnownHash):
+        return hash_string.digest
+    return hash_string.split(":")[-1]
+
+
+class KnownHash(str):
+    """
+    A hash string with its algorithm and digest already parsed.
+
+    Behaves exactly like the original string but :func:`hash_algorithm`,
+    :func:`hash_digest`, and :func:`hash_matches` use the parsed parts instead
+    of splitting the string every time. Registries that store hashes in a
+    parsed form (like :class:`pooch.CompactRegistry`) return these.
+
+    Parameters
+    ----------
+    value : str
+        The hash string with optional algorithm prepended.
+    algorithm : str or None
+        The name of the algorithm. Parsed from *value* if None.
+    digest : str or None
+        The hash itself. Parsed from *value* if None.
+
+    Examples
+    --------
+
+    >>> known_hash = KnownHash("md5:qouuwhwd2j192y1lb1iwgowdj2898wd2d9")
+    >>> print(known_hash == "md5:qouuwhwd2j192y1lb1iwgowdj2898wd2d9")
+    True
+    >>> print(known_hash.algorithm, known_hash.digest)
+    md5 qouuwhwd2j192y1lb1iwgowdj2898wd2d9
+
+    """
+
+    def __new__(cls, value, algorithm=None, digest=None):
+        known_hash = super().__new__(cls, value)
+        if algorithm is None:
+            algorithm = hash_algorithm(value)
+        if digest is None:
+            digest = hash_digest(value)
+        known_hash.algorithm = algorithm
+        known_hash.digest = digest
+        return known_hash
+
+    def __reduce__(self):
+        return (KnownHash, (str(self), self.algorithm, self.digest))
+
+
+def hash_matches(fname, known_hash, strict=False, new_hash=None):
     """
     Check if the hash of a file matches a known hash.
 
@@ -324,6 +673,11 @@ def hash_matches(fname, known_hash, strict=False):
     strict : bool
         If True, will raise a :class:`ValueError` if the hash does not match
         informing the user that the file may be corrupted.
+    new_hash : str or None
+        The hash of the file if it has already been calculated (for example,
+        while the file was being downloaded). It must have been calculated
+        with the algorithm specified in *known_hash*. If None, will calculate
+        the hash by reading *fname*.
 
     Returns
     -------
@@ -332,8 +686,9 @@ def hash_matches(fname, known_hash, strict=False):
 
     """
     algorithm = hash_algorithm(known_hash)
-    new_hash = file_hash(fname, alg=algorithm)
-    matches = new_hash == known_hash.split(":")[-1]
+    if new_hash is None:
+        new_hash = file_hash(fname, alg=algorithm)
+    matches = new_hash == hash_digest(known_hash)
     if strict and not matches:
         raise ValueError(
             "{} hash of file '{}' does not match the known hash:"
@@ -374,3 +729,243 @@ def temporary_file(path=None):
     finally:
         if os.path.exists(tmp.name):
             os.remove(tmp.name)
+
+
+def running_loop():
+    """
+    Get the event loop running the current coroutine.
+
+    Uses :func:`asyncio.get_running_loop` (Python 3.7 and later). Older
+    versions only have :func:`asyncio.get_event_loop`, which returns the
+    running loop when called from a coroutine.
+
+    Returns
+    -------
+    loop : :class:`asyncio.AbstractEventLoop`
+        The running event loop.
+
+    """
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    return getattr(asyncio, "get_running_loop", asyncio.get_event_loop)()
+
+
+class HashedWriter:
+    """
+    Binary file writer that calculates the hash of the data as it's written.
+
+    Used by :func:`pooch.core.stream_download` to verify downloads without
+    reading the file back from disk. Downloaders that write to file-like
+    objects can use this class like any other open binary file. The file is
+    only opened on the first call to :meth:`write`.
+
+    Instances are also path-like objects (they implement ``__fspath__``) so
+    that downloaders that only accept file names can still ``open`` them. In
+    that case, the data never passes through :meth:`write` and
+    :meth:`hexdigest` returns None to indicate that the hash must be
+    calculated from the file on disk.
+
+    When resuming an interrupted download, the data already in the file is
+    hashed first and new data is appended to it. Downloaders can store what
+    they need to resume the download later (like the ETag of the remote file)
+    in the :attr:`resume_info` dictionary with :meth:`save_resume_info`.
+
+    Parameters
+    ----------
+    fname : str or PathLike
+        The path to the output file.
+    alg : str
+        The type of the hashing algorithm.
+    resume : bool
+        If True and the file already exists, keep its contents and append to
+        it. Otherwise, the file is overwritten.
+    resume_info : dict or None
+        Information about the partial download stored by the downloader that
+        started it. Only used if *resume* is True.
+    info_file : str, PathLike, or None
+        JSON file where :meth:`save_resume_info` stores the information about
+        the download. If None, it's only kept in :attr:`resume_info`.
+
+    Examples
+    --------
+
+    >>> fname = "test-file-for-hashed-writer.txt"
+    >>> writer = HashedWriter(fname)
+    >>> print(writer.hexdigest())
+    None
+    >>> __ = writer.write(b"content of the file")
+    >>> writer.close()
+    >>> print(writer.hexdigest())
+    0fc74468e6a9a829f103d069aeb2bb4f8646bad58bf146bb0e3379b759ec4a00
+    >>> print(writer.hexdigest() == file_hash(fname))
+    True
+
+    Resume writing to the file:
+
+    >>> writer = HashedWriter(fname, resume=True)
+    >>> print(writer.tell())
+    19
+    >>> __ = writer.write(b" and some more")
+    >>> writer.close()
+    >>> print(writer.hexdigest() == file_hash(fname))
+    True
+    >>> os.remove(fname)
+
+    """
+
+    def __init__(
+        self, fname, alg="sha256", resume=False, resume_info=None, info_file=None
+    ):
+        if alg not in hashlib.algorithms_available:
+            raise ValueError("Algorithm '{}' not available in hashlib".format(alg))
+        self.name = str(fname)
+        self.info_file = None if info_file is None else str(info_file)
+        self.alg = alg
+        self._hasher = hashlib.new(alg)
+        self._file = None
+        self.resume_info = {}
+        if resume and os.path.exists(self.name):
+            self._file = open(self.name, "r+b")
+            update_hash(self._hasher, self._file)
+            if resume_info is not None:
+                self.resume_info.update(resume_info)
+
+    def __fspath__(self):
+        return self.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self):
+        "True if the file was opened and then closed"
+        return self._file is not None and self._file.closed
+
+    def write(self, data):
+        """
+        Write the data to the file and update the hash.
+
+        Parameters
+        ----------
+        data : bytes-like
+            The data to be written.
+
+        Returns
+        -------
+        nbytes : int
+            The number of bytes written.
+
+        """
+        if self._file is None:
+            self._file = open(self.name, "w+b")
+        self._hasher.update(data)
+        return self._file.write(data)
+
+    def copy_from(self, fname):
+        """
+        Append the content of a local file and update the hash in one pass.
+
+        The data is copied by the kernel without going through Python: with
+        a copy-on-write clone if nothing was written yet and the file system
+        supports it, or with :func:`os.copy_file_range` or
+        :func:`os.sendfile`. The hash is calculated from the data read back
+        from this file while it's in the page cache. Falls back to reading and
+        writing chunks if the system can't copy the file.
+
+        Parameters
+        ----------
+        fname : str or PathLike
+            The file to copy.
+
+        Returns
+        -------
+        nbytes : int
+            The number of bytes copied.
+
+        """
+        if self._file is None:
+            self._file = open(self.name, "w+b")
+        self._file.flush()
+        start = self._file.tell()
+        with open(str(fname), "rb", buffering=0) as fin:
+            if start == 0 and reflink(fin.fileno(), self._file.fileno()):
+                update_hash(self._hasher, self._file)
+            else:
+                _copy_hashed(fin, self._file.raw, self._hasher)
+        # The kernel moved the position of the file behind the buffer's back
+        return self._file.seek(0, os.SEEK_END) - start
+
+    def flush(self):
+        "Flush the write buffers of the file (if it's open)"
+        if self._file is not None:
+            self._file.flush()
+
+    def tell(self):
+        "Current position in the file (the number of bytes written)"
+        if self._file is None:
+            return 0
+        return self._file.tell()
+
+    def save_resume_info(self, info):
+        """
+        Replace the :attr:`resume_info` and store it in the *info_file*.
+
+        Downloaders should call this as soon as they know how to resume the
+        download (for example, when the headers of the response arrive) so
+        that it can be resumed even if the process is killed.
+
+        Parameters
+        ----------
+        info : dict
+            Information needed to resume the download. If empty, the download
+            can't be resumed and the *info_file* is deleted.
+
+        """
+        self.resume_info.clear()
+        self.resume_info.update(info)
+        if self.info_file is None:
+            return
+        if info:
+            with open(self.info_file, "w") as fout:
+                json.dump(info, fout)
+        elif os.path.exists(self.info_file):
+            os.remove(self.info_file)
+
+    def restart(self):
+        """
+        Discard all the data in the file to start writing it from scratch.
+
+        The file is emptied and closed. Like a new writer, it's opened again
+        on the next call to :meth:`write` and :meth:`hexdigest` returns None
+        if it's only written by name.
+        """
+        self._hasher = hashlib.new(self.alg)
+        self.resume_info.clear()
+        if self._file is not None:
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        "Close the file (if it's open)"
+        if self._file is not None:
+            self._file.close()
+
+    def hexdigest(self):
+        """
+        The hash of the data written so far.
+
+        Returns
+        -------
+        hash : str or None
+            The hash of the data or None if nothing was written through this
+            object.
+
+        """
+        if self._file is None:
+            return None
+        return self._hasher.hexdigest()
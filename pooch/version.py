@@ -5,5 +5,7 @@ Get the version number and git commit hash from versioneer.
 from ._version import get_versions
 
 
-full_version = get_versions()["version"]
-git_revision = get_versions()["full-revisionid"]
+# Getting the versions can run git so only do it once
+versions = get_versions()
+full_version = versions["version"]
+git_revision = versions["full-revisionid"]
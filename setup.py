@@ -46,6 +46,7 @@ CLASSIFIERS = [
 PLATFORMS = "Any"
 PACKAGES = find_packages(exclude=["doc"])
 SCRIPTS = []
+ENTRY_POINTS = {"console_scripts": ["pooch = pooch.__main__:main"]}
 PACKAGE_DATA = {
     "pooch.tests": [
         os.path.join("data", "*"),
@@ -71,6 +72,7 @@ if __name__ == "__main__":
         url=URL,
         platforms=PLATFORMS,
         scripts=SCRIPTS,
+        entry_points=ENTRY_POINTS,
         packages=PACKAGES,
         package_data=PACKAGE_DATA,
         classifiers=CLASSIFIERS,